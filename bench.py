@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the MCP helpers' hot paths.
+
+Usage:
+    python bench.py                 # run every benchmark
+    python bench.py instrument      # run one benchmark by name
+    python bench.py sse_parser
+    python bench.py correlation_query
+    python bench.py redaction
+"""
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+
+def _per_call_us(elapsed_s: float, calls: int) -> float:
+    return elapsed_s / calls * 1e6
+
+
+async def _time_calls(func, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        await func(i)
+    return time.perf_counter() - start
+
+
+def bench_instrument(calls: int = 20000) -> None:
+    """Per-call overhead of @instrument at each instrumentation level."""
+    from mcp_helpers import instrument, set_instrument_level, INSTRUMENT_LEVEL, CORRELATION_SAMPLE_RATE, CORRELATION_CHAIN, flush_logs
+
+    async def noop(i):
+        return {"i": i}
+
+    wrapped = instrument("bench.noop")(noop)
+    configs = [("off", 1.0), ("counters", 1.0), ("full", 0.01), ("full", 0.1), ("full", 1.0)]
+
+    async def run() -> None:
+        baseline = _per_call_us(await _time_calls(noop, calls), calls)
+        print(f"instrument: {calls} calls per level (log output discarded)")
+        print(f"  {'bare coroutine':<24} {baseline:8.2f} us/call")
+        for level, rate in configs:
+            set_instrument_level(level, rate)
+            per_call = _per_call_us(await _time_calls(wrapped, calls), calls)
+            label = level if level != "full" else f"full (sample={rate:g})"
+            print(f"  {label:<24} {per_call:8.2f} us/call  (+{per_call - baseline:.2f} us overhead)")
+            CORRELATION_CHAIN.clear()
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stderr(devnull):
+            asyncio.run(run())
+            flush_logs()
+    finally:
+        set_instrument_level(INSTRUMENT_LEVEL, CORRELATION_SAMPLE_RATE)
+
+
+def _synthetic_sse_stream(events: int) -> bytes:
+    """A text/event-stream mixing single- and multi-line events, comments and CRLF endings."""
+    parts = []
+    for i in range(events):
+        if i % 10 == 0:
+            parts.append(b": keep-alive\n")
+        if i % 3 == 0:
+            parts.append(b'event: status\r\nid: %d\r\ndata: {"status": "IN_PROGRESS",\r\ndata:  "n": %d}\r\n\r\n' % (i, i))
+        else:
+            parts.append(b'id: %d\ndata: {"status": "IN_PROGRESS", "n": %d, "pad": "%s"}\n\n' % (i, i, b"x" * (i % 200)))
+    return b"".join(parts)
+
+
+def bench_sse_parser(events: int = 50000) -> None:
+    """SSEParser throughput (events/s) on synthetic streams at several chunk sizes."""
+    from sse_tracker import SSEParser
+
+    stream = _synthetic_sse_stream(events)
+    print(f"sse_parser: {events} events, {len(stream) / 1e6:.1f} MB")
+    for chunk_size in (64, 1024, 16384, 262144):
+        chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+        parser = SSEParser()
+        parsed = 0
+        start = time.perf_counter()
+        for chunk in chunks:
+            parsed += len(parser.feed(chunk))
+        elapsed = time.perf_counter() - start
+        assert parsed == events, f"parsed {parsed} of {events} events"
+        print(f"  chunk {chunk_size:>7} B   {events / elapsed:12,.0f} events/s  {len(stream) / elapsed / 1e6:8.1f} MB/s")
+
+
+def bench_correlation_query(calls: int = 200000, queries: int = 2000) -> None:
+    """Dashboard-style correlation queries against a store that has seen `calls` chains."""
+    import random
+    from correlation_store import CorrelationStore
+
+    store = CorrelationStore()
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for i in range(calls):
+        cid = f"{i:08x}"
+        store[cid] = {"tool": f"tool{i % 20}", "start_time": 1e9 + i * 0.01}
+        store.finish(cid, "error" if rng.random() < 0.02 else "success", elapsed_ms=rng.expovariate(1 / 50))
+    fill = time.perf_counter() - start
+    print(f"correlation_query: {calls} chains recorded ({_per_call_us(fill, calls):.2f} us/chain), {len(store)} retained")
+    cases = [
+        ("top 10 by latency", dict(order="latency", limit=10)),
+        ("recent 100", dict(order="recent", limit=100)),
+        ("tool + min_ms", dict(tool="tool3", min_ms=200, limit=50)),
+        ("errors, recent", dict(status="error", order="recent", limit=50)),
+        ("time range", dict(order="recent", since=1e9 + (calls - 500) * 0.01, limit=100)),
+    ]
+    for label, kwargs in cases:
+        start = time.perf_counter()
+        for _ in range(queries):
+            store.query(**kwargs)
+        print(f"  {label:<24} {_per_call_us(time.perf_counter() - start, queries):8.1f} us/query")
+
+
+def _synthetic_log_lines(lines: int) -> list[str]:
+    """Log lines shaped like the workflow's output; about 2% carry something to redact."""
+    import random
+
+    rng = random.Random(0)
+    templates = [
+        "[cid={cid}] START tool=sonar.status jsonrpc_id=N/A parent=N/A",
+        "[cid={cid}] END tool=sonar.scan_project elapsed_ms={ms:.1f}",
+        "Workspace /tmp/mcp_sonar_workspaces/demo-{cid}: {n} written, 0 deleted, 38 unchanged",
+        "[cid={cid}] SSE: Event #{n} at {ms:.1f}ms: {{'status': 'IN_PROGRESS', 'task': 'AY{cid}'}}",
+        "Fetched {n} issues for project demo-{cid} in {ms:.1f}ms",
+        "CE watcher: {n} task(s) pending, next poll in {ms:.0f}ms",
+        "Résumé des tâches: {n} terminées en {ms:.1f}ms",
+    ]
+    secrets = [
+        "Calling GitHub with Authorization: Bearer {tok}",
+        "config loaded: token={tok} base=https://sonarcloud.io",
+        "push failed for ghp_{tok36}",
+    ]
+    out = []
+    for i in range(lines):
+        fields = {"cid": f"{rng.getrandbits(32):08x}", "ms": rng.expovariate(1 / 80), "n": rng.randint(1, 500),
+                  "tok": f"{rng.getrandbits(128):032x}", "tok36": f"{rng.getrandbits(144):036x}"}
+        template = rng.choice(secrets) if rng.random() < 0.02 else rng.choice(templates)
+        out.append(template.format(**fields))
+    return out
+
+
+def bench_redaction(lines: int = 100000) -> None:
+    """redact_secrets throughput on realistic log lines, against applying every regex to every line."""
+    from mcp_helpers import redact_secrets, SECRET_PATTERNS
+
+    def sequential(text: str) -> str:
+        for pattern in SECRET_PATTERNS:
+            text = pattern.sub(r'\1=<REDACTED>', text)
+        return text
+
+    log_lines = _synthetic_log_lines(lines)
+    print(f"redaction: {lines} log lines, {sum(map(len, log_lines)) / 1e6:.1f} MB")
+    results = {}
+    for label, func in (("all regexes per line", sequential), ("redact_secrets", redact_secrets)):
+        start = time.perf_counter()
+        results[label] = [func(line) for line in log_lines]
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<24} {lines / elapsed:12,.0f} lines/s  {_per_call_us(elapsed, lines):6.2f} us/line")
+    assert results["redact_secrets"] == results["all regexes per line"], "redaction output differs"
+
+
+BENCHMARKS = {
+    "instrument": bench_instrument,
+    "sse_parser": bench_sse_parser,
+    "correlation_query": bench_correlation_query,
+    "redaction": bench_redaction,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name} (available: {', '.join(BENCHMARKS)})", file=sys.stderr)
+            sys.exit(1)
+        BENCHMARKS[name]()
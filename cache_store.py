@@ -0,0 +1,329 @@
+# cache_store.py
+"""
+Cache backends behind mcp_helpers.cache_get/cache_set.
+
+- LRUTTLCache (default, "memory"): bounded in-process cache with LRU eviction
+  and per-key TTLs. Entries are capped by count and (optionally) by an
+  approximate byte budget.
+- SQLiteCache ("sqlite"): the same semantics in a local SQLite file, so the
+  sonar MCP server and workflow.py share task state and survive restarts.
+
+Expired entries are removed on access and by a periodic background sweep.
+Hit/miss/eviction counters are kept for the dashboard.
+"""
+import abc
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def _approx_size(value: Any) -> int:
+    """Rough serialized size of a value, used for the byte budget."""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(repr(value))
+
+
+class CacheBackend(abc.ABC):
+    """
+    Interface for cache backends. Subclasses must implement get/set/delete/
+    keys/sweep/stats; the base class provides the background sweeper and
+    counters.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 0, max_bytes: int = 0, sweep_interval: float = 30.0):
+        self.ttl = ttl
+        self.max_entries = max_entries  # 0 = unlimited
+        self.max_bytes = max_bytes  # 0 = unlimited
+        self.sweep_interval = sweep_interval
+        self._lock = threading.RLock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def keys(self, prefix: str = "") -> list[str]:
+        """Unexpired keys starting with `prefix`."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def sweep(self) -> int:
+        """Remove all expired entries; returns how many were removed."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+    def _counters(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _ensure_sweeper(self) -> None:
+        if self._sweeper is not None or self.sweep_interval <= 0:
+            return
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="cache-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def _sweep_loop(self) -> None:
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.sweep()
+            except Exception:
+                pass  # a failed sweep is retried on the next tick
+
+    def close(self) -> None:
+        """Stop the background sweeper."""
+        self._stop.set()
+
+
+class LRUTTLCache(CacheBackend):
+    """Thread-safe in-memory LRU cache whose entries expire after a (per-key) TTL."""
+
+    def __init__(self, ttl: float, max_entries: int = 0, max_bytes: int = 0, sweep_interval: float = 30.0):
+        super().__init__(ttl, max_entries, max_bytes, sweep_interval)
+        # {key: (expires_at (monotonic), value, size)}, least recently used first
+        self._data: OrderedDict[str, tuple[float, Any, int]] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        size = _approx_size(value) if self.max_bytes else 0
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            self._evict()
+        self._ensure_sweeper()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+    def keys(self, prefix: str = "") -> list[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (expires_at, _, _) in self._data.items()
+                    if expires_at > now and key.startswith(prefix)]
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _, _) in self._data.items() if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+        return len(expired)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def stats(self) -> dict:
+        """Counters and occupancy for observability."""
+        now = time.monotonic()
+        with self._lock:
+            total = len(self._data)
+            valid = sum(1 for expires_at, _, _ in self._data.values() if expires_at > now)
+            return {
+                "backend": "memory",
+                "total_items": total,
+                "valid_items": valid,
+                "expired_items": total - valid,
+                "approx_bytes": self._bytes,
+                **self._counters(),
+            }
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache stored in a local SQLite database (WAL mode), safe to share between
+    processes. Values must be JSON-serializable and are returned as fresh
+    copies, so callers must cache_set() after mutating them, re-reading first
+    if they awaited since their read (another writer may have stored a newer
+    copy meanwhile). Expiry uses wall clock time because it is compared across
+    processes; LRU order follows the last access time. Hit/miss counters are
+    per process.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int = 0, max_bytes: int = 0, sweep_interval: float = 30.0):
+        super().__init__(ttl, max_entries, max_bytes, sweep_interval)
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread (the dashboard and sweeper run in their own)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if row[1] <= now:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            self.expirations += 1
+            self.misses += 1
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        encoded = json.dumps(value)
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, encoded, expires_at, now),
+        )
+        self._evict(conn)
+        self._ensure_sweeper()
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        if self.max_entries:
+            cur = conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at"
+                " LIMIT max(0, (SELECT COUNT(*) FROM cache) - ?))",
+                (self.max_entries,),
+            )
+            self.evictions += max(cur.rowcount, 0)
+        if self.max_bytes:
+            total = conn.execute("SELECT COALESCE(SUM(length(value)), 0) FROM cache").fetchone()[0]
+            while total > self.max_bytes:
+                row = conn.execute("SELECT key, length(value) FROM cache ORDER BY accessed_at LIMIT 1").fetchone()
+                if row is None:
+                    break
+                conn.execute("DELETE FROM cache WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+
+    def keys(self, prefix: str = "") -> list[str]:
+        rows = self._conn().execute(
+            "SELECT key FROM cache WHERE substr(key, 1, length(?)) = ? AND expires_at > ?",
+            (prefix, prefix, time.time()),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def sweep(self) -> int:
+        cur = self._conn().execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        removed = max(cur.rowcount, 0)
+        self.expirations += removed
+        return removed
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def __contains__(self, key: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())).fetchone()
+        return row is not None
+
+    def stats(self) -> dict:
+        total, valid, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(expires_at > ?), 0), COALESCE(SUM(length(value)), 0) FROM cache",
+            (time.time(),),
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "total_items": total,
+            "valid_items": valid,
+            "expired_items": total - valid,
+            "approx_bytes": size,
+            **self._counters(),
+        }
+
+
+def make_cache(backend: str, ttl: float, max_entries: int = 0, max_bytes: int = 0,
+               sweep_interval: float = 30.0, path: Optional[str] = None) -> CacheBackend:
+    """Build the backend named by MCP_CACHE_BACKEND ("memory" or "sqlite")."""
+    if backend == "memory":
+        return LRUTTLCache(ttl, max_entries, max_bytes, sweep_interval)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("The sqlite cache backend needs a database path (MCP_CACHE_PATH)")
+        return SQLiteCache(path, ttl, max_entries, max_bytes, sweep_interval)
+    raise ValueError(f"Unknown cache backend: {backend!r} (expected 'memory' or 'sqlite')")
@@ -0,0 +1,212 @@
+# ce_watcher.py
+"""
+Batched watcher for SonarQube Compute Engine (CE) tasks.
+A single background loop tracks every pending task ID, checks their status
+in bulk via /api/ce/activity with adaptive backoff, and resolves an asyncio
+future per task the moment it reaches a terminal state.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Callable, Optional
+import httpx
+from mcp_helpers import log
+
+CE_POLL_MIN_INTERVAL = float(os.getenv("MCP_CE_POLL_MIN_INTERVAL", "0.5"))  # seconds
+CE_POLL_MAX_INTERVAL = float(os.getenv("MCP_CE_POLL_MAX_INTERVAL", "10"))  # seconds
+CE_POLL_BACKOFF = float(os.getenv("MCP_CE_POLL_BACKOFF", "1.5"))
+CE_WATCH_MAX_AGE = float(os.getenv("MCP_CE_WATCH_MAX_AGE", "1800"))  # give up on a task after this long
+
+TERMINAL_STATUSES = ("SUCCESS", "FAILED", "CANCELED")
+_ACTIVITY_PAGE_SIZE = 1000
+_MISSES_BEFORE_DIRECT_POLL = 3  # bulk polls a task may be absent from before it is fetched by id
+_MAX_FINISHED = 1000  # terminal results kept for late waiters
+
+
+class CeTaskWatcher:
+    """
+    Tracks pending CE tasks and resolves one shared future per task.
+
+    Remote tasks are polled in bulk; local (simulated) tasks are never polled
+    and are finished by calling resolve(). Results have the same shape as
+    /api/ce/task: {"task": {"id": ..., "status": ...}}.
+    """
+
+    def __init__(self, base_url: str, client_factory: Callable[[], httpx.AsyncClient]):
+        self._base_url = base_url
+        self._client_factory = client_factory
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._futures: dict[str, asyncio.Future] = {}
+        self._remote: dict[str, float] = {}  # task_id -> time watching started
+        self._misses: dict[str, int] = {}
+        self._last_status: dict[str, str] = {}
+        self._finished: OrderedDict[str, dict] = OrderedDict()
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._interval = CE_POLL_MIN_INTERVAL
+        self._bulk = True  # falls back to per-task polling if /api/ce/activity is not permitted
+
+    def _bind_loop(self) -> asyncio.AbstractEventLoop:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Futures and events belong to one loop; start fresh on a new one
+            self._loop = loop
+            self._futures.clear()
+            self._remote.clear()
+            self._misses.clear()
+            self._runner = None
+            self._wakeup = asyncio.Event()
+        return loop
+
+    def watch(self, task_id: str, remote: bool = True) -> asyncio.Future:
+        """Return the future for task_id, registering it for polling if remote."""
+        loop = self._bind_loop()
+        fut = self._futures.get(task_id)
+        if fut is None:
+            fut = loop.create_future()
+            if task_id in self._finished:
+                fut.set_result(self._finished[task_id])
+                return fut
+            self._futures[task_id] = fut
+        if not remote or task_id in self._remote:
+            return fut
+
+        self._remote[task_id] = time.monotonic()
+        self._interval = CE_POLL_MIN_INTERVAL
+        self._wakeup.set()
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+        return fut
+
+    async def wait(self, task_id: str, timeout: Optional[float] = None, remote: bool = True) -> dict:
+        """Wait for task_id to finish; returns a TIMEOUT status instead of raising."""
+        fut = self.watch(task_id, remote=remote)
+        try:
+            return await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            return {"task": {"id": task_id, "status": "TIMEOUT"}}
+
+    def status(self, task_id: str) -> Optional[str]:
+        """Last status seen for task_id, without any network call."""
+        return self._last_status.get(task_id)
+
+    def resolve(self, task_id: str, result: dict) -> None:
+        """Finish a task with `result` and wake everyone awaiting it."""
+        self._last_status[task_id] = result.get("task", {}).get("status", "UNKNOWN")
+        self._finished[task_id] = result
+        self._finished.move_to_end(task_id)
+        while len(self._finished) > _MAX_FINISHED:
+            old_id, _ = self._finished.popitem(last=False)
+            self._last_status.pop(old_id, None)
+        self._remote.pop(task_id, None)
+        self._misses.pop(task_id, None)
+        fut = self._futures.pop(task_id, None)
+        if fut is not None and not fut.done():
+            fut.set_result(result)
+
+    async def stop(self) -> None:
+        """Cancel the background poller (pending futures stay unresolved)."""
+        runner, self._runner = self._runner, None
+        if runner is not None and not runner.done():
+            runner.cancel()
+            try:
+                await runner
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while self._remote:
+            try:
+                changed = await self._poll_once()
+            except Exception as e:
+                log("CE watcher poll error: {}", repr(e))
+                changed = False
+            self._expire_stale()
+            if not self._remote:
+                break
+
+            if changed:
+                self._interval = CE_POLL_MIN_INTERVAL
+            else:
+                self._interval = min(self._interval * CE_POLL_BACKOFF, CE_POLL_MAX_INTERVAL)
+            self._wakeup.clear()
+            try:
+                # A new watch() sets the event and cuts the wait short
+                await asyncio.wait_for(self._wakeup.wait(), self._interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _expire_stale(self) -> None:
+        now = time.monotonic()
+        for task_id, since in list(self._remote.items()):
+            if now - since > CE_WATCH_MAX_AGE:
+                log("CE task {} still {} after {:.0f}s, giving up", task_id, self._last_status.get(task_id, "PENDING"), CE_WATCH_MAX_AGE)
+                self.resolve(task_id, {"task": {"id": task_id, "status": "TIMEOUT"}})
+
+    def _record(self, task: dict) -> bool:
+        """Apply one task payload; returns True if its status changed."""
+        task_id = task.get("id")
+        task_status = task.get("status")
+        if task_id not in self._remote or not task_status:
+            return False
+        self._misses.pop(task_id, None)
+        changed = self._last_status.get(task_id) != task_status
+        if task_status in TERMINAL_STATUSES:
+            self.resolve(task_id, {"task": task})
+            return True
+        if changed:
+            log("CE task {} status: {}", task_id, task_status)
+            self._last_status[task_id] = task_status
+        return changed
+
+    async def _poll_once(self) -> bool:
+        client = self._client_factory()
+        direct = list(self._remote)
+        changed = False
+
+        if self._bulk:
+            earliest = min(self._remote.values())
+            # Back-date the window: the task was submitted before we started watching it
+            submitted_after = time.time() - (time.monotonic() - earliest) - 300
+            r = await client.get(
+                f"{self._base_url}/api/ce/activity",
+                params={
+                    "status": "PENDING,IN_PROGRESS,SUCCESS,FAILED,CANCELED",
+                    "minSubmittedAt": time.strftime("%Y-%m-%dT%H:%M:%S+0000", time.gmtime(submitted_after)),
+                    "ps": _ACTIVITY_PAGE_SIZE,
+                },
+                timeout=20.0
+            )
+            if r.status_code in (401, 403):
+                log("CE watcher: /api/ce/activity not permitted (HTTP {}), polling tasks individually", r.status_code)
+                self._bulk = False
+            elif r.status_code != 200:
+                log("CE activity poll failed: HTTP {}", r.status_code)
+                return False
+            else:
+                seen = set()
+                for task in r.json().get("tasks", []):
+                    seen.add(task.get("id"))
+                    changed |= self._record(task)
+                # Tasks missing from the activity window for a while are fetched by id
+                direct = []
+                for task_id in list(self._remote):
+                    if task_id not in seen:
+                        self._misses[task_id] = self._misses.get(task_id, 0) + 1
+                        if self._misses[task_id] >= _MISSES_BEFORE_DIRECT_POLL:
+                            direct.append(task_id)
+
+        if direct:
+            responses = await asyncio.gather(
+                *(client.get(f"{self._base_url}/api/ce/task", params={"id": task_id}, timeout=20.0) for task_id in direct),
+                return_exceptions=True
+            )
+            for task_id, r in zip(direct, responses):
+                if isinstance(r, Exception):
+                    log("Error polling CE task {}: {}", task_id, repr(r))
+                elif r.status_code != 200:
+                    log("CE task poll failed: HTTP {}", r.status_code)
+                else:
+                    changed |= self._record(r.json().get("task", {}))
+        return changed
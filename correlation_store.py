@@ -0,0 +1,332 @@
+# correlation_store.py
+"""
+Bounded, indexed store for correlation chains.
+Replaces the unbounded CORRELATION_CHAIN dict: normal chains live in a
+fixed-capacity ring buffer, while slow and errored chains evicted from it are
+kept in a separate bounded "pinned" area. Indexes by tool, parent_cid and
+status make children and trace-tree lookups cheap; sorted start-time and
+latency indexes answer paginated, filtered queries without full scans.
+The store is a MutableMapping of {cid: info dict}, so existing dict-style
+code keeps working; use finish() to update status so the index stays right.
+"""
+import bisect
+import itertools
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Optional
+
+RUNNING = "running"  # index key for chains without a status yet
+
+
+class CorrelationStore(MutableMapping):
+    """Fixed-capacity correlation chains with secondary indexes."""
+
+    def __init__(self, capacity: int = 10000, pinned_capacity: int = 1000, slow_ms: float = 1000.0):
+        self.capacity = capacity
+        self.pinned_capacity = pinned_capacity
+        self.slow_ms = slow_ms
+        self._ring: OrderedDict[str, dict] = OrderedDict()  # oldest first
+        self._pinned: OrderedDict[str, dict] = OrderedDict()  # slow/errored chains evicted from the ring
+        self._seq: OrderedDict[str, int] = OrderedDict()  # last-change sequence per cid, ascending
+        self._next_seq = itertools.count(1)
+        # Insertion-ordered dicts used as ordered sets: {key: {cid: None}}
+        self._by_tool: dict[str, dict[str, None]] = {}
+        self._by_parent: dict[str, dict[str, None]] = {}
+        self._by_status: dict[str, dict[str, None]] = {}
+        # Sorted (key, cid) lists; (start_time, latency) keys per cid so entries can be found again
+        self._by_time: list[tuple[float, str]] = []
+        self._by_latency: list[tuple[float, str]] = []  # finished chains only
+        self._keys: dict[str, tuple[float, Optional[float]]] = {}
+        self._lock = threading.RLock()
+        self.evicted = 0
+
+    # -- indexing -----------------------------------------------------------
+
+    @staticmethod
+    def _add(index: dict, key: Optional[str], cid: str) -> None:
+        if key is not None:
+            index.setdefault(key, {})[cid] = None
+
+    @staticmethod
+    def _discard(index: dict, key: Optional[str], cid: str) -> None:
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(cid, None)
+            if not bucket:
+                del index[key]
+
+    @staticmethod
+    def _sorted_remove(index: list, key: tuple) -> None:
+        i = bisect.bisect_left(index, key)
+        if i < len(index) and index[i] == key:
+            del index[i]
+
+    def _index(self, cid: str, info: dict) -> None:
+        self._add(self._by_tool, info.get("tool"), cid)
+        self._add(self._by_parent, info.get("parent_cid"), cid)
+        self._add(self._by_status, info.get("status", RUNNING), cid)
+        started = info.get("start_time") or time.time()
+        latency = info.get("elapsed_ms")
+        self._keys[cid] = (started, latency)
+        bisect.insort(self._by_time, (started, cid))  # usually an append: chains arrive in start order
+        if latency is not None:
+            bisect.insort(self._by_latency, (latency, cid))
+
+    def _unindex(self, cid: str, info: dict) -> None:
+        self._discard(self._by_tool, info.get("tool"), cid)
+        self._discard(self._by_parent, info.get("parent_cid"), cid)
+        self._discard(self._by_status, info.get("status", RUNNING), cid)
+        started, latency = self._keys.pop(cid)
+        self._sorted_remove(self._by_time, (started, cid))
+        if latency is not None:
+            self._sorted_remove(self._by_latency, (latency, cid))
+
+    def _is_pinned_worthy(self, info: dict) -> bool:
+        return info.get("status") == "error" or (info.get("elapsed_ms") or 0) >= self.slow_ms
+
+    def _drop(self, cid: str, info: dict) -> None:
+        self._unindex(cid, info)
+        self._seq.pop(cid, None)
+        self.evicted += 1
+
+    def _evict(self) -> None:
+        while len(self._ring) > self.capacity:
+            cid, info = self._ring.popitem(last=False)
+            if self._is_pinned_worthy(info):
+                self._pinned[cid] = info
+            else:
+                self._drop(cid, info)
+        while len(self._pinned) > self.pinned_capacity:
+            cid, info = self._pinned.popitem(last=False)
+            self._drop(cid, info)
+
+    # -- MutableMapping -----------------------------------------------------
+
+    def __getitem__(self, cid: str) -> dict:
+        with self._lock:
+            info = self._ring.get(cid)
+            if info is None:
+                info = self._pinned[cid]
+            return info
+
+    def __setitem__(self, cid: str, info: dict) -> None:
+        with self._lock:
+            if cid in self:
+                del self[cid]
+            self._ring[cid] = info
+            self._touch(cid)
+            self._index(cid, info)
+            self._evict()
+
+    def __delitem__(self, cid: str) -> None:
+        with self._lock:
+            info = self._ring.pop(cid, None)
+            if info is None:
+                info = self._pinned.pop(cid)
+            self._unindex(cid, info)
+            self._seq.pop(cid, None)
+
+    def __contains__(self, cid: object) -> bool:
+        return cid in self._ring or cid in self._pinned
+
+    def __iter__(self) -> Iterator[str]:
+        # Pinned chains were all evicted from the ring, so they are older than everything in it
+        with self._lock:
+            return iter(list(self._pinned) + list(self._ring))
+
+    def __len__(self) -> int:
+        return len(self._ring) + len(self._pinned)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ring.clear()
+            self._pinned.clear()
+            self._seq.clear()
+            self._by_tool.clear()
+            self._by_parent.clear()
+            self._by_status.clear()
+            self._by_time.clear()
+            self._by_latency.clear()
+            self._keys.clear()
+
+    # -- updates ------------------------------------------------------------
+
+    def _touch(self, cid: str) -> None:
+        self._seq[cid] = next(self._next_seq)
+        self._seq.move_to_end(cid)
+
+    def finish(self, cid: str, status: str, **fields: Any) -> None:
+        """Set a chain's final status (and e.g. elapsed_ms), keeping the status index in sync."""
+        with self._lock:
+            info = self.get(cid)
+            if info is None:
+                return
+            self._discard(self._by_status, info.get("status", RUNNING), cid)
+            info.update(fields)
+            info["status"] = status
+            self._add(self._by_status, status, cid)
+            started, latency = self._keys[cid]
+            if latency is not None:
+                self._sorted_remove(self._by_latency, (latency, cid))
+            latency = info.get("elapsed_ms")
+            if latency is not None:
+                bisect.insort(self._by_latency, (latency, cid))
+            self._keys[cid] = (started, latency)
+            self._touch(cid)
+
+    # -- queries ------------------------------------------------------------
+
+    def _entries(self, cids) -> list[dict]:
+        return [{"correlation_id": cid, **self[cid]} for cid in cids if cid in self]
+
+    def seq(self, cid: str) -> Optional[int]:
+        """Sequence number of a chain's last insert or finish() (monotonic, usable as a cursor)."""
+        return self._seq.get(cid)
+
+    @property
+    def last_seq(self) -> int:
+        """Highest sequence number handed out so far."""
+        with self._lock:
+            return next(reversed(self._seq.values()), 0) if self._seq else 0
+
+    def since(self, cursor: int, limit: Optional[int] = None) -> tuple[list[dict], int]:
+        """
+        Chains added or finished after `cursor`, oldest change first, plus the
+        new cursor. Only the changed tail is walked, not the whole store.
+        """
+        with self._lock:
+            changed = []
+            for cid, seq in reversed(self._seq.items()):
+                if seq <= cursor:
+                    break
+                changed.append(cid)
+            changed.reverse()
+            if limit is not None:
+                changed = changed[-limit:]
+            return self._entries(changed), max(cursor, self.last_seq)
+
+    def children(self, cid: str) -> list[dict]:
+        """Chains whose parent_cid is `cid`, oldest first."""
+        with self._lock:
+            return self._entries(list(self._by_parent.get(cid, ())))
+
+    def by_tool(self, tool: str, limit: Optional[int] = None) -> list[dict]:
+        """Most recent chains for a tool, newest first."""
+        with self._lock:
+            cids = list(self._by_tool.get(tool, ()))[::-1][:limit]
+            return self._entries(cids)
+
+    def by_status(self, status: str, limit: Optional[int] = None) -> list[dict]:
+        """Most recent chains with a status ("success", "error", "running"), newest first."""
+        with self._lock:
+            cids = list(self._by_status.get(status, ()))[::-1][:limit]
+            return self._entries(cids)
+
+    def recent(self, limit: Optional[int] = None) -> list[dict]:
+        """Most recent chains, newest first."""
+        with self._lock:
+            return self._entries(list(self)[::-1][:limit])
+
+    def query(self, tool: Optional[str] = None, status: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              min_ms: Optional[float] = None, order: str = "recent",
+              cursor: Optional[str] = None, limit: int = 100) -> tuple[list[dict], Optional[str]]:
+        """
+        One page of chains matching every given filter, plus the cursor for the next page
+        (None on the last one). order="recent" pages newest-first by start_time,
+        order="latency" slowest-first by elapsed_ms (finished chains only).
+        since/until bound start_time (epoch seconds); min_ms bounds elapsed_ms.
+        The sorted index for `order` is range-limited first, so only chains in the
+        requested range are visited; if a tool/status bucket is smaller than that
+        range, the bucket is walked instead.
+        """
+        if order not in ("recent", "latency"):
+            raise ValueError(f"Unknown order: {order!r} (expected 'recent' or 'latency')")
+        if cursor is not None:
+            key, sep, cursor_cid = cursor.partition(":")
+            if not sep:
+                raise ValueError(f"Malformed cursor: {cursor!r}")
+            cursor_key = (float(key), cursor_cid)
+        # Positions in a tuple-sorted index: ("", ...) sorts before and ("\uffff", ...) after any cid
+        with self._lock:
+            if order == "recent":
+                index, slot = self._by_time, 0
+                lo = (since, "") if since is not None else None
+                hi = (until, "\uffff") if until is not None else None
+            else:
+                index, slot = self._by_latency, 1
+                lo = (min_ms, "") if min_ms is not None else None
+                hi = None
+            if cursor is not None and (hi is None or cursor_key < hi):
+                hi = cursor_key
+            start = bisect.bisect_left(index, lo) if lo is not None else 0
+            stop = bisect.bisect_left(index, hi) if hi is not None else len(index)
+
+            buckets = [b for b in (self._by_tool.get(tool, {}) if tool is not None else None,
+                                   self._by_status.get(status, {}) if status is not None else None)
+                       if b is not None]
+            smallest = min(buckets, key=len) if buckets else None
+            if smallest is not None and len(smallest) < stop - start:
+                keyed = ((self._keys[cid][slot], cid) for cid in smallest)
+                candidates = sorted(k for k in keyed if k[0] is not None
+                                    and (lo is None or k >= lo) and (hi is None or k < hi))
+                walk = reversed(candidates)
+            else:
+                walk = (index[i] for i in range(stop - 1, start - 1, -1))
+
+            page = []
+            for key in walk:
+                cid = key[1]
+                if tool is not None and cid not in self._by_tool.get(tool, ()):
+                    continue
+                if status is not None and cid not in self._by_status.get(status, ()):
+                    continue
+                started, latency = self._keys[cid]
+                if min_ms is not None and (latency is None or latency < min_ms):
+                    continue
+                if (since is not None and started < since) or (until is not None and started > until):
+                    continue
+                if len(page) == limit:
+                    last = page[-1]
+                    return self._entries([k[1] for k in page]), f"{last[0]!r}:{last[1]}"
+                page.append(key)
+            return self._entries([k[1] for k in page]), None
+
+    def root(self, cid: str) -> str:
+        """Walk parent links up to the oldest ancestor still in the store."""
+        with self._lock:
+            seen = {cid}
+            while True:
+                parent = self.get(cid, {}).get("parent_cid")
+                if parent is None or parent not in self or parent in seen:
+                    return cid
+                seen.add(parent)
+                cid = parent
+
+    def trace(self, cid: str) -> Optional[dict]:
+        """Full trace tree containing `cid`, rooted at its oldest ancestor."""
+        with self._lock:
+            if cid not in self:
+                return None
+            seen: set[str] = set()
+
+            def build(node: str) -> dict:
+                seen.add(node)
+                kids = [k for k in self._by_parent.get(node, ()) if k in self and k not in seen]
+                return {"correlation_id": node, **self[node], "children": [build(k) for k in kids]}
+
+            return build(self.root(cid))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": len(self),
+                "ring": len(self._ring),
+                "pinned": len(self._pinned),
+                "capacity": self.capacity,
+                "pinned_capacity": self.pinned_capacity,
+                "evicted": self.evicted,
+                "by_status": {status: len(cids) for status, cids in self._by_status.items()},
+            }
@@ -0,0 +1,231 @@
+# dag.py
+"""
+Dependency-graph scheduler for workflow steps.
+Each Step names the steps whose results it needs; DAG.run() starts a step as
+soon as all of them have finished, so independent branches (e.g. GitHub
+lookups while Sonar analyzes) overlap on the event loop. Steps record their
+start and end offsets from the start of the run, and the run reports its
+critical path: the chain of dependent steps with the largest total duration,
+which bounds the run's wall time - speeding up a step off that chain does not
+make the run faster.
+"""
+import asyncio
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from mcp_helpers import log
+
+DAG_HISTORY = int(os.getenv("MCP_DAG_HISTORY", "50"))  # finished runs kept for the dashboard
+
+
+class SkipStep(Exception):
+    """Raised by a step to mark itself skipped; its dependents still run and see None."""
+
+
+class Step:
+    """One node of a DAG: an async function of its dependencies' results."""
+
+    def __init__(self, name: str, func: Callable[[dict], Awaitable[Any]], deps: Iterable[str] = (),
+                 report: Optional[Callable[[Any], dict]] = None):
+        self.name = name
+        self.func = func  # called with {dependency name: its result}
+        self.deps = tuple(deps)
+        self.report = report  # result -> extra fields for the step's summary
+        self.status = "pending"  # -> success | skipped | failed | blocked
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.reason: Optional[str] = None
+        self.started: Optional[float] = None  # seconds since the run started
+        self.ended: Optional[float] = None
+
+    @property
+    def elapsed_ms(self) -> Optional[float]:
+        if self.started is None or self.ended is None:
+            return None
+        return (self.ended - self.started) * 1000
+
+    def summary(self) -> dict:
+        entry = {"step": self.name, "status": self.status, "deps": list(self.deps)}
+        if self.started is not None:
+            entry["started_ms"] = self.started * 1000
+            entry["ended_ms"] = self.ended * 1000 if self.ended is not None else None
+            entry["elapsed_ms"] = self.elapsed_ms
+        if self.status == "success" and self.report is not None:
+            entry.update(self.report(self.result))
+        if self.reason is not None:
+            entry["reason"] = self.reason
+        if self.error is not None:
+            entry["error"] = self.error
+        return entry
+
+
+class DAG:
+    """
+    A set of Steps run with as much concurrency as their dependencies allow.
+    A failed step blocks everything downstream of it; independent branches
+    keep running, and the run as a whole is reported as failed.
+    """
+
+    def __init__(self, name: str, steps: Iterable[Step]):
+        self.name = name
+        self.steps: dict[str, Step] = {}
+        for step in steps:
+            if step.name in self.steps:
+                raise ValueError(f"duplicate step {step.name!r}")
+            self.steps[step.name] = step
+        for step in self.steps.values():
+            for dep in step.deps:
+                if dep not in self.steps:
+                    raise ValueError(f"step {step.name!r} depends on unknown step {dep!r}")
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> list[str]:
+        """Step names with every step after its dependencies (declaration order among peers)."""
+        remaining = {name: len(step.deps) for name, step in self.steps.items()}
+        dependents: dict[str, list[str]] = {name: [] for name in self.steps}
+        for step in self.steps.values():
+            for dep in step.deps:
+                dependents[dep].append(step.name)
+        ready = deque(name for name, count in remaining.items() if count == 0)
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for dependent in dependents[name]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(order) != len(self.steps):
+            cycle = sorted(name for name, count in remaining.items() if count)
+            raise ValueError(f"dependency cycle among steps: {', '.join(cycle)}")
+        return order
+
+    async def _run_step(self, step: Step, origin: float) -> None:
+        step.started = time.perf_counter() - origin
+        try:
+            step.result = await step.func({dep: self.steps[dep].result for dep in step.deps})
+            step.status = "success"
+        except SkipStep as skip:
+            step.status = "skipped"
+            step.reason = str(skip) or None
+        except Exception as e:
+            step.status = "failed"
+            step.error = str(e) or repr(e)
+            log("✗ Step {} failed: {}", step.name, repr(e))
+        finally:
+            step.ended = time.perf_counter() - origin
+
+    async def run(self) -> dict:
+        """Run every step and return the run summary (also recorded in DAG_RUNS)."""
+        started_at = time.time()
+        origin = time.perf_counter()
+        pending = list(self.order)
+        running: dict[asyncio.Task, Step] = {}
+        try:
+            while pending or running:
+                for name in list(pending):
+                    step = self.steps[name]
+                    dep_status = [self.steps[dep].status for dep in step.deps]
+                    if any(s in ("failed", "blocked") for s in dep_status):
+                        step.status = "blocked"
+                        step.reason = "dependency failed"
+                        pending.remove(name)
+                    elif all(s in ("success", "skipped") for s in dep_status):
+                        step.status = "running"
+                        running[asyncio.create_task(self._run_step(step, origin))] = step
+                        pending.remove(name)
+                if not running:
+                    break
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del running[task]
+        finally:
+            for task in running:
+                task.cancel()
+
+        failed = [step for step in self.steps.values() if step.status == "failed"]
+        run = {
+            "name": self.name,
+            "status": "failed" if failed else "completed",
+            "started_at": started_at,
+            "elapsed_ms": (time.perf_counter() - origin) * 1000,
+            "steps": [self.steps[name].summary() for name in self.steps],
+            "critical_path": self.critical_path(),
+        }
+        if failed:
+            run["error"] = f"{failed[0].name}: {failed[0].error}"
+        DAG_RUNS.record(run)
+        return run
+
+    def critical_path(self) -> dict:
+        """
+        Longest chain of dependent steps by summed duration (steps that never
+        started count as zero). Returns the step names in order, the chain's
+        total duration and, for each step that ran, its slack: how much longer
+        it could have taken without lengthening the chain.
+        """
+        finish: dict[str, float] = {}  # longest duration of a chain ending with each step
+        via: dict[str, Optional[str]] = {}
+        for name in self.order:
+            step = self.steps[name]
+            before, via[name] = 0.0, None
+            for dep in step.deps:
+                if finish[dep] > before:
+                    before, via[name] = finish[dep], dep
+            finish[name] = before + (step.elapsed_ms or 0.0)
+        if not finish:
+            return {"steps": [], "elapsed_ms": 0.0, "slack_ms": {}}
+
+        # Longest chain starting with each step, for slack
+        tail: dict[str, float] = {}
+        for name in reversed(self.order):
+            tail.setdefault(name, 0.0)
+            for dep in self.steps[name].deps:
+                tail[dep] = max(tail.get(dep, 0.0), tail[name] + (self.steps[name].elapsed_ms or 0.0))
+
+        end = max(finish, key=finish.get)
+        length = finish[end]
+        path = []
+        name: Optional[str] = end
+        while name is not None:
+            path.append(name)
+            name = via[name]
+        path.reverse()
+        return {
+            "steps": path,
+            "elapsed_ms": length,
+            "slack_ms": {name: max(0.0, length - finish[name] - tail[name])
+                         for name in self.order if self.steps[name].started is not None},
+        }
+
+
+class RunHistory:
+    """Most recent finished DAG runs, read by the dashboard's threads."""
+
+    def __init__(self, capacity: int = DAG_HISTORY):
+        self._runs: deque[dict] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def record(self, run: dict) -> None:
+        with self._lock:
+            self._runs.append(run)
+            self.total += 1
+
+    def recent(self, limit: Optional[int] = None) -> list[dict]:
+        """Newest first."""
+        with self._lock:
+            runs = list(self._runs)
+        runs.reverse()
+        return runs[:limit] if limit is not None else runs
+
+    def clear(self) -> None:
+        with self._lock:
+            self._runs.clear()
+            self.total = 0
+
+
+DAG_RUNS = RunHistory()
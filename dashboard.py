@@ -4,36 +4,152 @@
 Observability dashboard - HTTP server exposing metrics, correlation chains, and stats.
 Run this to monitor your MCP workflow in real-time.
 """
+import os
 import json
+import gzip
 import time
 import sys
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from mcp_helpers import TOOL_STATS, CORRELATION_CHAIN, _CACHE, CACHE_TTL
+import hashlib
+import threading
+from typing import Optional
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from mcp_helpers import CORRELATION_CHAIN, _CACHE, extra_stats, latency_summary, stats_snapshot, log_stats
 from sse_tracker import SSE_EVENTS, get_sse_stats
+from dag import DAG_RUNS
+from http_pool import http_stats_snapshot
 
 
-class DashboardHandler(BaseHTTPRequestHandler):
-    """HTTP handler for observability dashboard."""
-    
-    def do_GET(self):
-        """Handle GET requests."""
-        if self.path == "/":
-            self.send_html_dashboard()
-        elif self.path == "/api/metrics":
-            self.send_json_metrics()
-        elif self.path == "/api/correlations":
-            self.send_json_correlations()
-        elif self.path == "/api/sse":
-            self.send_json_sse()
-        elif self.path == "/api/cache":
-            self.send_json_cache()
-        else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def send_html_dashboard(self):
-        """Send main HTML dashboard."""
-        html = """<!DOCTYPE html>
+GZIP_MIN_BYTES = int(os.getenv("MCP_DASHBOARD_GZIP_MIN_BYTES", "1024"))  # smaller bodies are sent uncompressed
+STREAM_INTERVAL = float(os.getenv("MCP_DASHBOARD_STREAM_INTERVAL", "0.5"))  # seconds between change checks
+STREAM_MAX_CLIENTS = int(os.getenv("MCP_DASHBOARD_STREAM_MAX_CLIENTS", "32"))
+STREAM_KEEPALIVE = 15.0  # seconds of silence before a keep-alive comment
+STREAM_RETRY_MS = 2000  # browser reconnect delay
+STREAM_MAX_ITEMS = 200  # newest correlations / SSE events per delta
+SNAPSHOT_INTERVAL = float(os.getenv("MCP_DASHBOARD_SNAPSHOT_INTERVAL", "1.0"))  # seconds between metric snapshots
+DEFAULT_CORRELATIONS = 100  # page size when ?limit= is not given
+MAX_PAGE_SIZE = 1000
+
+_open_streams = 0
+_streams_lock = threading.Lock()
+
+
+def tool_entry(name: str, stats: dict) -> dict:
+    """Dashboard view of one tool's stats (with its extra counters) and latency percentiles."""
+    latency = latency_summary(name)
+    lifetime = latency["lifetime"]["success"] if latency else {}
+    return {
+        **extra_stats(stats),
+        "count": stats["count"],
+        "total_ms": stats["total_ms"],
+        "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] > 0 else 0,
+        "p50_ms": lifetime.get("p50_ms"),
+        "p90_ms": lifetime.get("p90_ms"),
+        "p99_ms": lifetime.get("p99_ms"),
+        "max_ms": lifetime.get("max_ms"),
+        "latency": latency
+    }
+
+
+def metrics_totals(snapshot: dict) -> dict:
+    """Totals over tool calls (upstream HTTP requests are reported separately)."""
+    total_calls = sum(s["count"] for s in snapshot.values())
+    total_ms = sum(s["total_ms"] for s in snapshot.values())
+    return {
+        "total_calls": total_calls,
+        "avg_latency_ms": total_ms / total_calls if total_calls > 0 else 0,
+    }
+
+
+def metrics_data(snapshot: Optional[dict] = None, http: Optional[dict] = None) -> dict:
+    """Totals plus per-tool metrics, from one consistent TOOL_STATS snapshot, and per-host HTTP metrics."""
+    snapshot = stats_snapshot() if snapshot is None else snapshot
+    http = http_stats_snapshot() if http is None else http
+    return {
+        **metrics_totals(snapshot),
+        "tools": {name: tool_entry(name, stats) for name, stats in snapshot.items()},
+        "http": {host: tool_entry(f"http.{host}", stats) for host, stats in http.items()},
+        "logging": log_stats()
+    }
+
+
+def chain_summary(info: dict) -> dict:
+    return {
+        "correlation_id": info["correlation_id"],
+        "tool": info.get("tool"),
+        "status": info.get("status", "unknown"),
+        "elapsed_ms": info.get("elapsed_ms", 0),
+        "jsonrpc_id": info.get("jsonrpc_id"),
+        "parent_cid": info.get("parent_cid")
+    }
+
+
+def _param(params: dict, name: str, cast=str, default=None):
+    """Single query-string value converted with `cast`; ValueError (-> 400) if it doesn't parse."""
+    values = params.get(name)
+    if not values or values[-1] == "":
+        return default
+    try:
+        return cast(values[-1])
+    except ValueError:
+        raise ValueError(f"Invalid value for {name!r}: {values[-1]!r}")
+
+
+def _limit(params: dict, default: int) -> int:
+    return max(1, min(_param(params, "limit", int, default), MAX_PAGE_SIZE))
+
+
+def correlations_data(params: Optional[dict] = None) -> dict:
+    """
+    One page of correlation chains, slowest first by default.
+    Query: limit, cursor, tool, status, since/until (epoch seconds of start_time),
+    min_ms, order=latency|recent.
+    """
+    params = params or {}
+    chains, next_cursor = CORRELATION_CHAIN.query(
+        tool=_param(params, "tool"),
+        status=_param(params, "status"),
+        since=_param(params, "since", float),
+        until=_param(params, "until", float),
+        min_ms=_param(params, "min_ms", float),
+        order=_param(params, "order", default="latency"),
+        cursor=_param(params, "cursor"),
+        limit=_limit(params, DEFAULT_CORRELATIONS),
+    )
+    return {
+        "total": len(CORRELATION_CHAIN),
+        "chains": [chain_summary(info) for info in chains],
+        "next_cursor": next_cursor,
+        "store": CORRELATION_CHAIN.stats()
+    }
+
+
+def sse_data(params: Optional[dict] = None) -> dict:
+    """
+    SSE stats plus one page of events (newest `limit`, oldest first).
+    Query: limit, cursor (event seq), stream, since/until (epoch seconds).
+    """
+    params = params or {}
+    events, next_cursor = SSE_EVENTS.query(
+        stream=_param(params, "stream"),
+        since=_param(params, "since", float),
+        until=_param(params, "until", float),
+        cursor=_param(params, "cursor", int),
+        limit=_limit(params, 20),
+    )
+    data = get_sse_stats()
+    data["events"] = events
+    data["next_cursor"] = next_cursor
+    return data
+
+
+def workflows_data(params: Optional[dict] = None) -> dict:
+    """Recent workflow runs (newest first) with per-step timings and critical path. Query: limit."""
+    params = params or {}
+    return {"runs": DAG_RUNS.recent(_limit(params, 20)), "total": DAG_RUNS.total}
+
+
+DASHBOARD_HTML = """<!DOCTYPE html>
 <html>
 <head>
     <title>MCP Observability Dashboard</title>
@@ -55,34 +171,127 @@ class DashboardHandler(BaseHTTPRequestHandler):
         .refresh-btn:hover { background: #1177bb; }
     </style>
     <script>
-        async function refresh() {
-            const metrics = await fetch('/api/metrics').then(r => r.json());
-            const correlations = await fetch('/api/correlations').then(r => r.json());
-            const sse = await fetch('/api/sse').then(r => r.json());
-            const cache = await fetch('/api/cache').then(r => r.json());
-            
-            document.getElementById('tool-count').textContent = Object.keys(metrics.tools).length;
-            document.getElementById('total-calls').textContent = metrics.total_calls;
-            document.getElementById('avg-latency').textContent = metrics.avg_latency_ms.toFixed(1) + 'ms';
-            document.getElementById('correlation-count').textContent = correlations.total;
-            document.getElementById('sse-events').textContent = sse.total_events;
+        // Live state, filled by the /api/stream snapshot and patched by its deltas
+        const state = { tools: {}, http: {}, chains: new Map(), correlationTotal: 0, sseTotal: 0, cache: null, workflows: [] };
+        const MAX_CHAINS = 1000;
+        
+        function applySnapshot(snap) {
+            state.tools = snap.metrics.tools;
+            state.http = snap.metrics.http;
+            state.totals = snap.metrics;
+            state.chains = new Map(snap.correlations.chains.map(c => [c.correlation_id, c]));
+            state.correlationTotal = snap.correlations.total;
+            state.sseTotal = snap.sse.total_events;
+            state.cache = snap.cache;
+            state.workflows = snap.workflows.runs;
+            render();
+        }
+        
+        function applyDelta(delta) {
+            if (delta.metrics) {
+                Object.assign(state.tools, delta.metrics.tools);
+                state.http = delta.metrics.http;
+                state.totals = delta.metrics;
+            }
+            if (delta.correlations) {
+                for (const c of delta.correlations.chains) {
+                    state.chains.delete(c.correlation_id);
+                    state.chains.set(c.correlation_id, c);
+                }
+                while (state.chains.size > MAX_CHAINS) {
+                    state.chains.delete(state.chains.keys().next().value);
+                }
+                state.correlationTotal = delta.correlations.total;
+            }
+            if (delta.sse) state.sseTotal = delta.sse.total_events;
+            if (delta.cache) state.cache = delta.cache;
+            if (delta.workflows) state.workflows = delta.workflows.runs;
+            render();
+        }
+        
+        function render() {
+            const cache = state.cache;
+            document.getElementById('tool-count').textContent = Object.keys(state.tools).length;
+            document.getElementById('total-calls').textContent = state.totals.total_calls;
+            document.getElementById('avg-latency').textContent = state.totals.avg_latency_ms.toFixed(1) + 'ms';
+            document.getElementById('correlation-count').textContent = state.correlationTotal;
+            document.getElementById('sse-events').textContent = state.sseTotal;
             document.getElementById('cache-items').textContent = cache.total_items;
             document.getElementById('cache-hit-rate').textContent = (cache.hit_rate * 100).toFixed(1) + '%';
+            document.getElementById('cache-evictions').textContent = cache.evictions + ' / ' + cache.expirations;
             
-            renderToolStats(metrics.tools);
-            renderCorrelations(correlations.chains);
+            renderToolStats(state.tools);
+            renderHttpStats(state.http);
+            renderCorrelations([...state.chains.values()].sort((a, b) => b.elapsed_ms - a.elapsed_ms));
+            renderWorkflows(state.workflows);
+        }
+        
+        async function refresh() {
+            const [metrics, correlations, sse, cache, workflows] = await Promise.all(
+                ['/api/metrics', '/api/correlations', '/api/sse', '/api/cache', '/api/workflows'].map(url => fetch(url).then(r => r.json())));
+            applySnapshot({ metrics, correlations, sse, cache, workflows });
+        }
+        
+        function connect() {
+            if (!window.EventSource) {
+                setInterval(refresh, 2000);
+                return refresh();
+            }
+            const stream = new EventSource('/api/stream');
+            stream.addEventListener('snapshot', e => applySnapshot(JSON.parse(e.data)));
+            stream.addEventListener('delta', e => applyDelta(JSON.parse(e.data)));
+            stream.onerror = () => {
+                // The browser retries dropped streams itself; a refused one (e.g. too many tabs) falls back to polling
+                if (stream.readyState === EventSource.CLOSED) {
+                    setInterval(refresh, 2000);
+                    refresh();
+                }
+            };
         }
         
+        const CORE_TOOL_FIELDS = new Set(['count', 'total_ms', 'avg_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms']);
         function renderToolStats(tools) {
             const tbody = document.getElementById('tool-stats-body');
             tbody.innerHTML = '';
             for (const [name, stats] of Object.entries(tools)) {
                 const row = tbody.insertRow();
+                const ms = v => v == null ? '-' : v.toFixed(1) + 'ms';
+                const errors = stats.latency ? stats.latency.lifetime.error.count : 0;
+                // counters from bump_stat, e.g. coalesced calls, memo hits, cache hits/misses
+                const counters = Object.entries(stats)
+                    .filter(([key, value]) => typeof value === 'number' && !CORE_TOOL_FIELDS.has(key))
+                    .map(([key, value]) => `${key}=${value}`).join(' ') || '-';
                 row.innerHTML = `
                     <td>${name}</td>
                     <td>${stats.count}</td>
+                    <td>${errors}</td>
                     <td>${stats.total_ms.toFixed(1)}ms</td>
                     <td>${stats.avg_ms.toFixed(1)}ms</td>
+                    <td>${ms(stats.p50_ms)}</td>
+                    <td>${ms(stats.p90_ms)}</td>
+                    <td>${ms(stats.p99_ms)}</td>
+                    <td>${ms(stats.max_ms)}</td>
+                    <td>${counters}</td>
+                `;
+            }
+        }
+        
+        function renderHttpStats(hosts) {
+            const tbody = document.getElementById('http-stats-body');
+            tbody.innerHTML = '';
+            for (const [host, entry] of Object.entries(hosts)) {
+                const row = tbody.insertRow();
+                const ms = v => v == null ? '-' : v.toFixed(1) + 'ms';
+                row.innerHTML = `
+                    <td>${host}</td>
+                    <td>${entry.count}</td>
+                    <td>${entry.errors}</td>
+                    <td>${entry.avg_ms.toFixed(1)}ms</td>
+                    <td>${ms(entry.p50_ms)}</td>
+                    <td>${ms(entry.p99_ms)}</td>
+                    <td>${entry.max_active_connections}</td>
+                    <td>${ms(entry.max_pool_wait_ms)}</td>
+                    <td>${entry.rate_limited} / ${entry.retries}</td>
                 `;
             }
         }
@@ -101,8 +310,28 @@ class DashboardHandler(BaseHTTPRequestHandler):
             });
         }
         
-        setInterval(refresh, 2000);
-        window.onload = refresh;
+        function renderWorkflows(runs) {
+            const tbody = document.getElementById('workflow-body');
+            tbody.innerHTML = '';
+            runs.slice(0, 10).forEach(run => {
+                const ms = v => v == null ? '-' : v.toFixed(0) + 'ms';
+                const steps = run.steps.map(s => {
+                    const critical = run.critical_path.steps.includes(s.step);
+                    const label = `${s.step} ${s.status === 'success' ? ms(s.elapsed_ms) : s.status}`;
+                    return critical ? `<strong>${label}</strong>` : label;
+                }).join(', ');
+                const row = tbody.insertRow();
+                row.innerHTML = `
+                    <td>${run.name}</td>
+                    <td>${run.status}</td>
+                    <td>${ms(run.elapsed_ms)}</td>
+                    <td>${run.critical_path.steps.join(' → ')} (${ms(run.critical_path.elapsed_ms)})</td>
+                    <td><small>${steps}</small></td>
+                `;
+            });
+        }
+        
+        window.onload = connect;
     </script>
 </head>
 <body>
@@ -138,104 +367,319 @@ class DashboardHandler(BaseHTTPRequestHandler):
             <div class="metric-label">Cache Hit Rate</div>
             <div class="metric-value" id="cache-hit-rate">-</div>
         </div>
+        <div class="metric-card">
+            <div class="metric-label">Cache Evictions / Expirations</div>
+            <div class="metric-value" id="cache-evictions">-</div>
+        </div>
     </div>
     
     <h2>Tool Performance</h2>
     <table>
         <thead>
-            <tr><th>Tool</th><th>Calls</th><th>Total Time</th><th>Avg Latency</th></tr>
+            <tr><th>Tool</th><th>Calls</th><th>Errors</th><th>Total Time</th><th>Avg Latency</th><th>p50</th><th>p90</th><th>p99</th><th>Max</th><th>Counters</th></tr>
         </thead>
         <tbody id="tool-stats-body"></tbody>
     </table>
     
+    <h2>Upstream HTTP</h2>
+    <table>
+        <thead>
+            <tr><th>Host</th><th>Requests</th><th>Errors</th><th>Avg Latency</th><th>p50</th><th>p99</th><th>Max Connections</th><th>Max Pool Wait</th><th>Rate Limited / Retries</th></tr>
+        </thead>
+        <tbody id="http-stats-body"></tbody>
+    </table>
+    
+    <h2>Workflow Runs</h2>
+    <table>
+        <thead>
+            <tr><th>Run</th><th>Status</th><th>Wall Time</th><th>Critical Path</th><th>Steps (critical in bold)</th></tr>
+        </thead>
+        <tbody id="workflow-body"></tbody>
+    </table>
+    
     <h2>Recent Correlations</h2>
     <div id="correlations"></div>
 </body>
 </html>
 """
-        self.send_response(200)
-        self.send_header('Content-type', 'text/html')
-        self.end_headers()
-        self.wfile.write(html.encode())
+
+
+class Payload:
+    """An encoded response body with its ETag and (for large bodies) a gzipped copy."""
     
-    def send_json_metrics(self):
-        """Send tool metrics as JSON."""
-        total_calls = sum(s["count"] for s in TOOL_STATS.values())
-        total_ms = sum(s["total_ms"] for s in TOOL_STATS.values())
-        avg_latency = total_ms / total_calls if total_calls > 0 else 0
-        
-        tools = {}
-        for name, stats in TOOL_STATS.items():
-            tools[name] = {
-                "count": stats["count"],
-                "total_ms": stats["total_ms"],
-                "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] > 0 else 0
-            }
-        
-        data = {
-            "total_calls": total_calls,
-            "avg_latency_ms": avg_latency,
-            "tools": tools
-        }
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+    __slots__ = ("body", "etag", "content_type", "_gzipped")
     
-    def send_json_correlations(self):
-        """Send correlation chains as JSON."""
-        chains = []
-        for cid, info in CORRELATION_CHAIN.items():
-            chains.append({
-                "correlation_id": cid,
-                "tool": info.get("tool"),
-                "status": info.get("status", "unknown"),
-                "elapsed_ms": info.get("elapsed_ms", 0),
-                "jsonrpc_id": info.get("jsonrpc_id"),
-                "parent_cid": info.get("parent_cid")
-            })
-        
-        data = {
-            "total": len(chains),
-            "chains": sorted(chains, key=lambda x: x.get("elapsed_ms", 0), reverse=True)
+    def __init__(self, body: bytes, content_type: str = 'application/json'):
+        self.body = body
+        self.content_type = content_type
+        self.etag = 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self._gzipped: Optional[bytes] = None
+    
+    def gzipped(self) -> Optional[bytes]:
+        """Gzipped body (compressed once, on first use), or None if too small to bother."""
+        if self._gzipped is None and len(self.body) >= GZIP_MIN_BYTES:
+            self._gzipped = gzip.compress(self.body, compresslevel=5)
+        return self._gzipped
+    
+    @classmethod
+    def json(cls, data) -> "Payload":
+        return cls(json.dumps(data, default=str).encode())
+
+
+class Snapshot:
+    """Everything the default (unfiltered) endpoints serve, built once per tick."""
+    
+    def __init__(self):
+        self.built_at = time.monotonic()
+        self.stats = stats_snapshot()
+        self.http = http_stats_snapshot()
+        self.metrics = metrics_data(self.stats, self.http)
+        self.cache = _CACHE.stats()
+        self.payloads = {
+            "/api/metrics": Payload.json(self.metrics),
+            "/api/cache": Payload.json(self.cache),
+            "/api/sse": Payload.json(sse_data()),
+            "/api/correlations": Payload.json(correlations_data()),
+            "/api/workflows": Payload.json(workflows_data()),
         }
-        
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        for payload in self.payloads.values():
+            payload.gzipped()  # compress here rather than in a request thread
+
+
+class Snapshotter:
+    """
+    Background thread that rebuilds the Snapshot every `interval` seconds, so
+    any number of viewers share one computation and one JSON/gzip encoding.
+    It stops rebuilding after IDLE_AFTER seconds without requests; the next
+    request then builds a fresh snapshot itself.
+    """
+    
+    IDLE_AFTER = 30.0
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._snapshot: Optional[Snapshot] = None
+        self._last_request = 0.0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.builds = 0
+    
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="dashboard-snapshotter", daemon=True)
+                self._thread.start()
+    
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if time.monotonic() - self._last_request < self.IDLE_AFTER:
+                self._build()
+    
+    def _build(self) -> Snapshot:
+        snapshot = Snapshot()
+        self._snapshot = snapshot  # readers keep whichever snapshot they already grabbed
+        self.builds += 1
+        return snapshot
+    
+    def current(self) -> Snapshot:
+        """Latest snapshot; built on the spot if missing or older than one tick plus slack."""
+        now = time.monotonic()
+        self._last_request = now
+        snapshot = self._snapshot
+        if snapshot is None or now - snapshot.built_at > self.interval * 2:
+            with self._lock:  # one request rebuilds, concurrent ones wait for it
+                snapshot = self._snapshot
+                if snapshot is None or now - snapshot.built_at > self.interval * 2:
+                    snapshot = self._build()
+        return snapshot
+
+
+SNAPSHOTS = Snapshotter(SNAPSHOT_INTERVAL)
+_HTML_PAYLOAD = Payload(DASHBOARD_HTML.encode(), 'text/html')
+
+
+class DashboardHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for observability dashboard.
+    Each request runs on its own thread. Unfiltered API requests are answered
+    with the pre-encoded buffers of the current Snapshot; filtered ones are
+    computed from the stores' indexes. Responses carry an ETag (unchanged data
+    is answered with 304) and large bodies are gzipped for clients that accept it.
+    """
+    
+    protocol_version = "HTTP/1.1"  # keep-alive for polling browsers; every response sets Content-Length
+    disable_nagle_algorithm = True  # headers and body are separate writes; don't stall keep-alive on delayed ACKs
+    
+    def do_GET(self):
+        """Handle GET requests."""
+        url = urlsplit(self.path)
+        path, params = url.path, parse_qs(url.query)
+        try:
+            if path == "/":
+                self.send_html_dashboard()
+            elif path in ("/api/metrics", "/api/cache") or (
+                    path in ("/api/sse", "/api/correlations", "/api/workflows") and not params):
+                self.send_payload(SNAPSHOTS.current().payloads[path])
+            elif path == "/api/correlations":
+                self.send_json_correlations(params)
+            elif path == "/api/sse":
+                self.send_json_sse(params)
+            elif path == "/api/workflows":
+                self.send_json(workflows_data(params))
+            elif path == "/api/stream":
+                self.send_event_stream()
+            elif path.startswith("/api/trace/"):
+                self.send_json_trace(unquote(path[len("/api/trace/"):]))
+            else:
+                self.send_not_found()
+        except ValueError as e:
+            body = json.dumps({"error": str(e)}).encode()
+            self.send_response(400)
+            self.send_header('Content-type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    
+    def send_not_found(self):
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
     
-    def send_json_sse(self):
-        """Send SSE statistics as JSON."""
-        data = get_sse_stats()
-        data["events"] = SSE_EVENTS[-20:]  # Last 20 events
+    def send_payload(self, payload: Payload):
+        """Send a 200 with ETag/304 handling, using the gzipped copy if the client accepts it."""
+        if payload.etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', payload.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
         
+        body = payload.body
         self.send_response(200)
-        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-type', payload.content_type)
+        self.send_header('ETag', payload.etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and payload.gzipped() is not None:
+            body = payload.gzipped()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
     
-    def send_json_cache(self):
-        """Send cache statistics as JSON."""
-        now = time.time()
-        valid_items = sum(1 for ts, _ in _CACHE.values() if now - ts < CACHE_TTL)
-        
-        # Simulate hit rate (in production, track actual hits/misses)
-        hit_rate = 0.75 if _CACHE else 0.0
+    def send_json(self, data):
+        self.send_payload(Payload.json(data))
+    
+    def send_html_dashboard(self):
+        """Send main HTML dashboard."""
+        self.send_payload(_HTML_PAYLOAD)
+    
+    def send_json_correlations(self, params: dict):
+        """Send a filtered page of correlation chains as JSON."""
+        self.send_json(correlations_data(params))
+    
+    def send_json_trace(self, cid: str):
+        """Send the full trace tree (root ancestor and all descendants) containing a correlation."""
+        trace = CORRELATION_CHAIN.trace(cid)
+        if trace is None:
+            self.send_not_found()
+            return
         
-        data = {
-            "total_items": len(_CACHE),
-            "valid_items": valid_items,
-            "expired_items": len(_CACHE) - valid_items,
-            "ttl_seconds": CACHE_TTL,
-            "hit_rate": hit_rate
-        }
+        self.send_json(trace)
+    
+    def send_json_sse(self, params: dict):
+        """Send SSE statistics and a filtered page of events as JSON."""
+        self.send_json(sse_data(params))
+    
+    def send_event_stream(self):
+        """
+        Push dashboard updates as Server-Sent Events: one full `snapshot` event,
+        then a `delta` event whenever tools, correlations, SSE events, cache
+        stats or finished workflow runs change (checked every STREAM_INTERVAL seconds).
+        """
+        global _open_streams
+        with _streams_lock:
+            if _open_streams >= STREAM_MAX_CLIENTS:
+                self.send_response(503)
+                self.send_header('Retry-After', '10')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            _open_streams += 1
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        try:
+            self.send_response(200)
+            self.send_header('Content-type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            
+            _, chain_cursor = CORRELATION_CHAIN.since(0)
+            _, event_cursor = SSE_EVENTS.since(0)
+            snapshot = SNAPSHOTS.current()
+            tools, http, cache = snapshot.stats, snapshot.http, snapshot.cache
+            runs_seen = DAG_RUNS.total
+            payloads = snapshot.payloads
+            self.write_raw_event("snapshot", b'{"metrics": %s, "correlations": %s, "sse": %s, "cache": %s, "workflows": %s}' % (
+                payloads["/api/metrics"].body, payloads["/api/correlations"].body,
+                payloads["/api/sse"].body, payloads["/api/cache"].body, payloads["/api/workflows"].body,
+            ), retry_ms=STREAM_RETRY_MS)
+            
+            last_write = time.monotonic()
+            while True:
+                time.sleep(STREAM_INTERVAL)
+                delta = {}
+                
+                snapshot = SNAPSHOTS.current()
+                if snapshot.stats is not tools:
+                    changed = {name: snapshot.metrics["tools"][name]
+                               for name, rec in snapshot.stats.items() if tools.get(name) != rec}
+                    if changed or snapshot.http != http:
+                        delta["metrics"] = {**metrics_totals(snapshot.stats), "tools": changed,
+                                            "http": snapshot.metrics["http"]}
+                    tools, http = snapshot.stats, snapshot.http
+                
+                chains, chain_cursor = CORRELATION_CHAIN.since(chain_cursor, limit=STREAM_MAX_ITEMS)
+                if chains:
+                    delta["correlations"] = {
+                        "chains": [chain_summary(info) for info in chains],
+                        "total": len(CORRELATION_CHAIN),
+                    }
+                
+                events, event_cursor = SSE_EVENTS.since(event_cursor, limit=STREAM_MAX_ITEMS)
+                if events:
+                    delta["sse"] = {"events": events, "total_events": get_sse_stats()["total_events"]}
+                
+                if snapshot.cache != cache:
+                    delta["cache"] = cache = snapshot.cache
+                
+                if DAG_RUNS.total != runs_seen:
+                    runs_seen = DAG_RUNS.total
+                    delta["workflows"] = workflows_data()
+                
+                if delta:
+                    self.write_event("delta", delta)
+                    last_write = time.monotonic()
+                elif time.monotonic() - last_write >= STREAM_KEEPALIVE:
+                    self.wfile.write(b": keep-alive\n\n")
+                    self.wfile.flush()
+                    last_write = time.monotonic()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # browser tab closed
+        finally:
+            with _streams_lock:
+                _open_streams -= 1
+    
+    def write_event(self, event: str, data, retry_ms: Optional[int] = None):
+        self.write_raw_event(event, json.dumps(data, default=str).encode(), retry_ms)
+    
+    def write_raw_event(self, event: str, data: bytes, retry_ms: Optional[int] = None):
+        """Write one SSE event whose data is already-encoded single-line JSON."""
+        head = f"event: {event}\n" + (f"retry: {retry_ms}\n" if retry_ms is not None else "")
+        self.wfile.write(head.encode() + b"data: " + data + b"\n\n")
+        self.wfile.flush()
     
     def log_message(self, format, *args):
         """Suppress default logging."""
@@ -244,7 +688,8 @@ class DashboardHandler(BaseHTTPRequestHandler):
 
 def run_dashboard(port: int = 8080):
     """Run the observability dashboard server."""
-    server = HTTPServer(('0.0.0.0', port), DashboardHandler)
+    server = ThreadingHTTPServer(('0.0.0.0', port), DashboardHandler)
+    SNAPSHOTS.start()
     print(f"   Observability Dashboard running at http://localhost:{port}", file=sys.stderr)
     print(f"   View metrics, correlations, and performance stats in your browser", file=sys.stderr)
     server.serve_forever()
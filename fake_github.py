@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Local fake of the GitHub API endpoints the workflow's PR step uses, for
+trying the workflow (and counting its requests) without touching GitHub.
+
+Usage:
+    python fake_github.py [port] [--no-graphql]
+    GITHUB_API_URL=http://localhost:9100 python workflow.py "<figma_url>"
+
+Repositories spring into existence on first use with a "main" branch.
+Repository and ref lookups carry ETags and answer If-None-Match with 304.
+GET /_stats returns request counts; POST /_push/<owner>/<repo> moves the
+default branch to a new commit (so cached base SHAs go stale).
+--no-graphql answers /graphql with 404 to exercise the REST fallback.
+"""
+import re
+import sys
+import json
+import uuid
+import base64
+import hashlib
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def _sha() -> str:
+    return hashlib.sha1(uuid.uuid4().bytes).hexdigest()
+
+
+class FakeGitHub:
+    """In-memory repositories, branches and pull requests."""
+
+    def __init__(self, graphql: bool = True):
+        self.graphql = graphql
+        self.repos: dict[str, dict] = {}
+        self.requests: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def repo(self, full_name: str) -> dict:
+        if full_name not in self.repos:
+            self.repos[full_name] = {
+                "full_name": full_name,
+                "node_id": "R_" + hashlib.sha1(full_name.encode()).hexdigest()[:12],
+                "default_branch": "main",
+                "branches": {"main": _sha()},
+                "objects": {},
+                "pulls": [],
+            }
+        return self.repos[full_name]
+
+    def repo_by_node_id(self, node_id: str) -> dict:
+        for repo in self.repos.values():
+            if repo["node_id"] == node_id:
+                return repo
+        raise KeyError(f"Could not resolve to a node with the global id of '{node_id}'")
+
+    def create_ref(self, repo: dict, ref: str, sha: str) -> None:
+        branch = ref.removeprefix("refs/heads/")
+        if branch in repo["branches"]:
+            raise ValueError("Reference already exists")
+        repo["branches"][branch] = sha
+
+    def commit(self, repo: dict, parents: list[str], files: dict[str, str], message: str) -> str:
+        sha = _sha()
+        repo["objects"][sha] = {"parents": parents, "files": files, "message": message}
+        return sha
+
+    def open_pull(self, repo: dict, head: str, base: str, title: str, body: str) -> dict:
+        if head not in repo["branches"]:
+            raise ValueError(f"Head sha can't be blank, Base sha can't be blank, No commits between {base} and {head}")
+        number = len(repo["pulls"]) + 1
+        pull = {"number": number, "head": head, "base": base, "title": title, "body": body,
+                "html_url": f"https://github.example/{repo['full_name']}/pull/{number}"}
+        repo["pulls"].append(pull)
+        return pull
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    github: FakeGitHub = FakeGitHub()
+
+    def do_GET(self):
+        gh = self.github
+        path = self.path.split("?", 1)[0]
+        if path == "/_stats":
+            return self.send_json(200, {"requests": dict(gh.requests), "repos": {
+                name: {"branches": repo["branches"], "pulls": repo["pulls"]} for name, repo in gh.repos.items()}})
+        with gh.lock:
+            match = re.fullmatch(r"/repos/([^/]+/[^/]+)", path)
+            if match:
+                repo = gh.repo(match.group(1))
+                self.count("GET /repos/{repo}")
+                return self.send_conditional({"full_name": repo["full_name"], "node_id": repo["node_id"],
+                                              "default_branch": repo["default_branch"]})
+            match = re.fullmatch(r"/repos/([^/]+/[^/]+)/git/ref/heads/(.+)", path)
+            if match:
+                repo = gh.repo(match.group(1))
+                self.count("GET /repos/{repo}/git/ref/heads/{branch}")
+                sha = repo["branches"].get(match.group(2))
+                if sha is None:
+                    return self.send_json(404, {"message": "Not Found"})
+                return self.send_conditional({"ref": f"refs/heads/{match.group(2)}", "object": {"sha": sha, "type": "commit"}})
+        self.send_json(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        gh = self.github
+        path = self.path.split("?", 1)[0]
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.headers.get("Authorization"):
+            return self.send_json(401, {"message": "Requires authentication"})
+        with gh.lock:
+            match = re.fullmatch(r"/_push/([^/]+/[^/]+)", path)
+            if match:
+                repo = gh.repo(match.group(1))
+                repo["branches"][repo["default_branch"]] = _sha()
+                return self.send_json(200, {"sha": repo["branches"][repo["default_branch"]]})
+            if path.endswith("/graphql"):
+                self.count("POST /graphql")
+                if not gh.graphql:
+                    return self.send_json(404, {"message": "Not Found"})
+                return self.send_json(200, self.graphql(payload))
+            match = re.fullmatch(r"/repos/([^/]+/[^/]+)/(git/trees|git/commits|git/refs|pulls)", path)
+            if not match:
+                return self.send_json(404, {"message": "Not Found"})
+            repo, kind = gh.repo(match.group(1)), match.group(2)
+            self.count(f"POST /repos/{{repo}}/{kind}")
+            if kind == "git/trees":
+                files = {entry["path"]: entry.get("content", "") for entry in payload["tree"]}
+                sha = _sha()
+                repo["objects"][sha] = {"base_tree": payload.get("base_tree"), "files": files}
+                return self.send_json(201, {"sha": sha})
+            if kind == "git/commits":
+                tree = repo["objects"].get(payload["tree"], {})
+                sha = gh.commit(repo, payload["parents"], tree.get("files", {}), payload["message"])
+                return self.send_json(201, {"sha": sha})
+            try:
+                if kind == "git/refs":
+                    gh.create_ref(repo, payload["ref"], payload["sha"])
+                    return self.send_json(201, {"ref": payload["ref"], "object": {"sha": payload["sha"]}})
+                pull = gh.open_pull(repo, payload["head"], payload["base"], payload["title"], payload.get("body", ""))
+                return self.send_json(201, pull)
+            except ValueError as e:
+                return self.send_json(422, {"message": str(e)})
+
+    def graphql(self, payload: dict) -> dict:
+        """Execute the createRef / createCommitOnBranch / createPullRequest fields present in the query, in order."""
+        gh, query, variables = self.github, payload.get("query", ""), payload.get("variables", {})
+        data, errors = {}, []
+        try:
+            if "createRef(" in query:
+                ref = variables["ref"]
+                repo = gh.repo_by_node_id(ref["repositoryId"])
+                gh.create_ref(repo, ref["name"], ref["oid"])
+                data["createRef"] = {"ref": {"name": ref["name"]}}
+            if "createCommitOnBranch(" in query:
+                commit = variables["commit"]
+                repo = gh.repo(commit["branch"]["repositoryNameWithOwner"])
+                branch = commit["branch"]["branchName"]
+                head = repo["branches"].get(branch)
+                if head != commit["expectedHeadOid"]:
+                    raise ValueError(f"Expected branch to point to \"{commit['expectedHeadOid']}\" but it did not")
+                files = {add["path"]: base64.b64decode(add["contents"]).decode()
+                         for add in commit["fileChanges"].get("additions", [])}
+                repo["branches"][branch] = gh.commit(repo, [head], files, commit["message"]["headline"])
+                data["createCommitOnBranch"] = {"commit": {"oid": repo["branches"][branch]}}
+            if "createPullRequest(" in query:
+                pr = variables["pr"]
+                repo = gh.repo_by_node_id(pr["repositoryId"])
+                pull = gh.open_pull(repo, pr["headRefName"], pr["baseRefName"], pr["title"], pr.get("body", ""))
+                data["createPullRequest"] = {"pullRequest": {"number": pull["number"], "url": pull["html_url"]}}
+        except (KeyError, ValueError) as e:
+            errors.append({"message": str(e).strip("'\"")})
+        return {"data": data, "errors": errors} if errors else {"data": data}
+
+    def count(self, route: str) -> None:
+        self.github.requests[route] += 1
+
+    def send_conditional(self, data: dict):
+        body = json.dumps(data).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+        if self.headers.get("If-None-Match") == etag:
+            self.github.requests["304 Not Modified"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(200, data, {"ETag": etag})
+
+    def send_json(self, status: int, data: dict, headers: dict = None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        print(f"   fake_github: {format % args}", file=sys.stderr)
+
+
+def run_fake_github(port: int = 9100, graphql: bool = True):
+    FakeGitHubHandler.github = FakeGitHub(graphql=graphql)
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeGitHubHandler)
+    print(f"   Fake GitHub API running at http://localhost:{port} (GraphQL {'on' if graphql else 'off'})", file=sys.stderr)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    run_fake_github(int(args[0]) if args else 9100, graphql="--no-graphql" not in sys.argv)
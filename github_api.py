@@ -0,0 +1,207 @@
+# github_api.py
+"""
+GitHub calls behind the workflow's pull request step.
+The default branch, its head SHA and the repository's node id are cached per
+repository and revalidated with conditional requests (If-None-Match); GitHub
+answers unchanged resources with a 304 that does not count against the rate
+limit, and concurrent lookups for one repository share a single request.
+Branch, commit and pull request are created by one GraphQL request (createRef
++ createCommitOnBranch + createPullRequest); where GraphQL is unavailable or
+disabled, the REST fallback needs four calls (tree, commit, ref, pull).
+All requests go through the pooled client for GITHUB_API_URL.
+"""
+import os
+import base64
+import asyncio
+from typing import Optional
+import httpx
+from mcp_helpers import log
+from http_pool import get_client
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL = os.getenv("MCP_GITHUB_GRAPHQL", "1").lower() in ("1", "true", "yes")
+
+_CREATE_PR_MUTATION = """
+mutation CreatePullRequest($ref: CreateRefInput!, $commit: CreateCommitOnBranchInput!, $pr: CreatePullRequestInput!) {
+  createRef(input: $ref) { ref { name } }
+  createCommitOnBranch(input: $commit) { commit { oid } }
+  createPullRequest(input: $pr) { pullRequest { number url } }
+}
+"""
+
+# {"owner/repo": {"default_branch", "node_id", "sha", "repo_etag", "ref_etag"}}
+_BASE_CACHE: dict[str, dict] = {}
+_BASE_LOOKUPS: dict[str, asyncio.Future] = {}
+_graphql_unavailable = False
+
+GITHUB_STATS = {"base_lookups": 0, "not_modified": 0, "coalesced": 0, "graphql_prs": 0, "rest_prs": 0}
+
+
+def graphql_url(api_url: Optional[str] = None) -> str:
+    """GraphQL endpoint for a REST base URL (GitHub Enterprise serves REST at /api/v3, GraphQL at /api/graphql)."""
+    api_url = api_url or GITHUB_API_URL
+    if api_url.endswith("/api/v3"):
+        return api_url[:-len("/v3")] + "/graphql"
+    return api_url + "/graphql"
+
+
+def _headers(extra: Optional[dict] = None) -> dict:
+    headers = {
+        "Authorization": f"token {os.getenv('GITHUB_TOKEN')}",
+        "Accept": "application/vnd.github+json",
+    }
+    if extra:
+        headers.update(extra)
+    return headers
+
+
+async def _conditional_get(client: httpx.AsyncClient, url: str, etag: Optional[str]) -> Optional[httpx.Response]:
+    """GET `url`, revalidating `etag`; returns None when the cached copy is still current."""
+    response = await client.get(url, headers=_headers({"If-None-Match": etag} if etag else None))
+    if response.status_code == 304:
+        GITHUB_STATS["not_modified"] += 1
+        return None
+    response.raise_for_status()
+    return response
+
+
+async def _fetch_base(repo: str) -> dict:
+    client = get_client(GITHUB_API_URL)
+    cached = dict(_BASE_CACHE.get(repo, {}))
+    GITHUB_STATS["base_lookups"] += 1
+
+    repo_resp = await _conditional_get(client, f"{GITHUB_API_URL}/repos/{repo}", cached.get("repo_etag"))
+    if repo_resp is not None:
+        data = repo_resp.json()
+        if data["default_branch"] != cached.get("default_branch"):
+            cached.pop("ref_etag", None)
+        cached.update(default_branch=data["default_branch"], node_id=data.get("node_id"),
+                      repo_etag=repo_resp.headers.get("ETag"))
+
+    ref_url = f"{GITHUB_API_URL}/repos/{repo}/git/ref/heads/{cached['default_branch']}"
+    ref_resp = await _conditional_get(client, ref_url, cached.get("ref_etag"))
+    if ref_resp is not None:
+        cached.update(sha=ref_resp.json()["object"]["sha"], ref_etag=ref_resp.headers.get("ETag"))
+
+    _BASE_CACHE[repo] = cached
+    return cached
+
+
+async def repo_base(repo: str) -> dict:
+    """
+    Default branch, its head SHA and the repository node id for "owner/repo".
+    Always revalidated, but unchanged data costs two 304s and no JSON parsing.
+    """
+    lookup = _BASE_LOOKUPS.get(repo)
+    if lookup is None:
+        lookup = asyncio.ensure_future(_fetch_base(repo))
+        _BASE_LOOKUPS[repo] = lookup
+        lookup.add_done_callback(lambda _: _BASE_LOOKUPS.pop(repo, None))
+    else:
+        GITHUB_STATS["coalesced"] += 1
+    base = await asyncio.shield(lookup)
+    return {"default_branch": base["default_branch"], "sha": base["sha"], "node_id": base.get("node_id")}
+
+
+async def create_pull_request(repo: str, base: dict, branch: str, files: dict[str, str],
+                              title: str, body: str, message: str) -> dict:
+    """
+    Create `branch` from base["sha"], commit `files` onto it and open a pull
+    request against base["default_branch"]. Returns {"number", "html_url"}.
+    """
+    global _graphql_unavailable
+    if GITHUB_GRAPHQL and not _graphql_unavailable and base.get("node_id"):
+        try:
+            return await _create_pr_graphql(repo, base, branch, files, title, body, message)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in (404, 410):
+                raise
+            log("GitHub GraphQL API unavailable ({}), using REST", e.response.status_code)
+            _graphql_unavailable = True
+    return await _create_pr_rest(repo, base, branch, files, title, body, message)
+
+
+async def _create_pr_graphql(repo: str, base: dict, branch: str, files: dict[str, str],
+                             title: str, body: str, message: str) -> dict:
+    # Top-level mutation fields run in order, so the commit sees the new ref and the PR sees the commit
+    variables = {
+        "ref": {"repositoryId": base["node_id"], "name": f"refs/heads/{branch}", "oid": base["sha"]},
+        "commit": {
+            "branch": {"repositoryNameWithOwner": repo, "branchName": branch},
+            "expectedHeadOid": base["sha"],
+            "message": {"headline": message},
+            "fileChanges": {"additions": [
+                {"path": path, "contents": base64.b64encode(content.encode()).decode()}
+                for path, content in files.items()
+            ]},
+        },
+        "pr": {
+            "repositoryId": base["node_id"],
+            "baseRefName": base["default_branch"],
+            "headRefName": branch,
+            "title": title,
+            "body": body,
+        },
+    }
+    client = get_client(GITHUB_API_URL)
+    response = await client.post(graphql_url(), json={"query": _CREATE_PR_MUTATION, "variables": variables},
+                                 headers=_headers())
+    response.raise_for_status()
+    result = response.json()
+    if result.get("errors"):
+        messages = "; ".join(error.get("message", str(error)) for error in result["errors"])
+        raise Exception(f"GitHub GraphQL error: {messages}")
+    pull_request = result["data"]["createPullRequest"]["pullRequest"]
+    GITHUB_STATS["graphql_prs"] += 1
+    return {"number": pull_request["number"], "html_url": pull_request["url"]}
+
+
+async def _create_pr_rest(repo: str, base: dict, branch: str, files: dict[str, str],
+                          title: str, body: str, message: str) -> dict:
+    client = get_client(GITHUB_API_URL)
+    headers = _headers()
+    repo_url = f"{GITHUB_API_URL}/repos/{repo}"
+
+    # Create tree with new files
+    tree_resp = await client.post(f"{repo_url}/git/trees", headers=headers, json={
+        "base_tree": base["sha"],
+        "tree": [
+            {"path": path, "mode": "100644", "type": "blob", "content": content}
+            for path, content in files.items()
+        ],
+    })
+    tree_resp.raise_for_status()
+
+    # Create commit
+    commit_resp = await client.post(f"{repo_url}/git/commits", headers=headers, json={
+        "message": message,
+        "tree": tree_resp.json()["sha"],
+        "parents": [base["sha"]],
+    })
+    commit_resp.raise_for_status()
+
+    # Create the branch directly at the new commit
+    ref_resp = await client.post(f"{repo_url}/git/refs", headers=headers, json={
+        "ref": f"refs/heads/{branch}",
+        "sha": commit_resp.json()["sha"],
+    })
+    if ref_resp.status_code != 201:
+        log("Branch creation failed: {} {}", ref_resp.status_code, ref_resp.text)
+        raise Exception(f"Branch creation failed: {ref_resp.status_code} {ref_resp.text}")
+
+    # Create PR
+    pr_resp = await client.post(f"{repo_url}/pulls", headers=headers, json={
+        "title": title,
+        "head": branch,
+        "base": base["default_branch"],
+        "body": body,
+    })
+    pr_resp.raise_for_status()
+    pr_json = pr_resp.json()
+    GITHUB_STATS["rest_prs"] += 1
+    return {"number": pr_json.get("number"), "html_url": pr_json.get("html_url")}
+
+
+def clear_cache() -> None:
+    """Forget cached repository bases (e.g. after switching tokens)."""
+    _BASE_CACHE.clear()
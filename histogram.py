@@ -0,0 +1,131 @@
+# histogram.py
+"""
+Fixed-memory latency histograms for per-tool percentiles.
+Buckets are log-spaced (8 per power of two, ~9% relative error) from 10us to
+one hour, so p50/p90/p99 cost the same memory after ten calls or ten million.
+Each tool keeps lifetime totals plus a sliding time window, split by outcome.
+"""
+import math
+import os
+import time
+import threading
+from typing import Optional
+
+LATENCY_WINDOW = float(os.getenv("MCP_LATENCY_WINDOW", "60"))  # seconds
+LATENCY_WINDOW_SLOTS = 6
+
+_MIN_MS = 0.01
+_MAX_MS = 3600_000.0
+_BUCKETS_PER_DOUBLING = 8
+_NUM_BUCKETS = math.ceil(math.log2(_MAX_MS / _MIN_MS) * _BUCKETS_PER_DOUBLING) + 2  # + underflow/overflow
+
+
+def _bucket(ms: float) -> int:
+    if ms <= _MIN_MS:
+        return 0
+    return min(int(math.log2(ms / _MIN_MS) * _BUCKETS_PER_DOUBLING) + 1, _NUM_BUCKETS - 1)
+
+
+def _upper_bound(index: int) -> float:
+    return _MIN_MS * 2 ** (index / _BUCKETS_PER_DOUBLING)
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (milliseconds)."""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * _NUM_BUCKETS
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float) -> None:
+        self.counts[_bucket(ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile (0-100), capped at the max seen."""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * q / 100.0))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(_upper_bound(i), self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"count": 0, "mean_ms": None, "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+        return {
+            "count": self.count,
+            "mean_ms": self.total_ms / self.count,
+            "p50_ms": self.percentile(50),
+            "p90_ms": self.percentile(90),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+        }
+
+
+class WindowedHistogram:
+    """Sliding-window histogram made of a ring of per-slot histograms."""
+
+    def __init__(self, window: float = LATENCY_WINDOW, slots: int = LATENCY_WINDOW_SLOTS):
+        self.window = window
+        self._slot_len = window / slots
+        self._slots = [LatencyHistogram() for _ in range(slots)]
+        self._epochs = [-1] * slots  # which time slot each ring entry currently holds
+
+    def record(self, ms: float, now: Optional[float] = None) -> None:
+        epoch = int((time.monotonic() if now is None else now) / self._slot_len)
+        i = epoch % len(self._slots)
+        if self._epochs[i] != epoch:
+            self._slots[i] = LatencyHistogram()
+            self._epochs[i] = epoch
+        self._slots[i].record(ms)
+
+    def merged(self, now: Optional[float] = None) -> LatencyHistogram:
+        epoch = int((time.monotonic() if now is None else now) / self._slot_len)
+        oldest = epoch - len(self._slots) + 1
+        out = LatencyHistogram()
+        for slot, slot_epoch in zip(self._slots, self._epochs):
+            if slot_epoch >= oldest:
+                out.merge(slot)
+        return out
+
+
+class ToolLatency:
+    """Lifetime and windowed histograms for one tool, split into success and error."""
+
+    def __init__(self):
+        self.lifetime = {"success": LatencyHistogram(), "error": LatencyHistogram()}
+        self.window = {"success": WindowedHistogram(), "error": WindowedHistogram()}
+        self._lock = threading.Lock()  # summaries are read from the dashboard's threads
+
+    def record(self, ms: float, ok: bool = True) -> None:
+        outcome = "success" if ok else "error"
+        with self._lock:
+            self.lifetime[outcome].record(ms)
+            self.window[outcome].record(ms)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "lifetime": {k: h.summary() for k, h in self.lifetime.items()},
+                "window": {k: h.merged().summary() for k, h in self.window.items()},
+                "window_seconds": LATENCY_WINDOW,
+            }
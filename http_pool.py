@@ -0,0 +1,355 @@
+# http_pool.py
+"""
+Shared, pooled HTTP clients for upstream APIs (SonarQube, GitHub).
+One long-lived httpx.AsyncClient is kept per host so keep-alive connections
+are reused across polls, pages and tools instead of paying TCP/TLS setup on
+every call. Pool usage is reported per host in HTTP_STATS, apart from
+TOOL_STATS so that raw requests are not counted as tool calls.
+Requests to each host also pass a token bucket (MCP_HTTP_RATE / per-host
+MCP_HTTP_RATE_LIMITS); 429/503 Retry-After and exhausted X-RateLimit-*
+budgets pause the host's bucket and the request is retried a few times.
+"""
+import os
+import time
+import email.utils
+import asyncio
+import importlib.util
+from contextlib import asynccontextmanager
+from typing import Any, Optional
+from urllib.parse import urlsplit
+import httpx
+from mcp_helpers import log, record_latency
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("MCP_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("MCP_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("MCP_HTTP_KEEPALIVE_EXPIRY", "30"))  # seconds
+HTTP_TIMEOUT = float(os.getenv("MCP_HTTP_TIMEOUT", "30"))  # seconds
+HTTP_CONNECT_TIMEOUT = float(os.getenv("MCP_HTTP_CONNECT_TIMEOUT", "10"))  # seconds
+HTTP2_ENABLED = os.getenv("MCP_HTTP2", "false").lower() in ("1", "true", "yes")
+HTTP_RATE = float(os.getenv("MCP_HTTP_RATE", "20"))  # requests/second per host; 0 = unlimited
+HTTP_BURST = float(os.getenv("MCP_HTTP_BURST", "40"))
+HTTP_RATE_LIMITS = os.getenv("MCP_HTTP_RATE_LIMITS", "")  # "host=rate/burst,..." overrides
+HTTP_MAX_RETRIES = int(os.getenv("MCP_HTTP_MAX_RETRIES", "2"))  # retries after a rate-limit response
+HTTP_MAX_RETRY_WAIT = float(os.getenv("MCP_HTTP_MAX_RETRY_WAIT", "60"))  # longer waits are not retried
+
+_RETRY_STATUSES = (429, 503)
+_RETRY_AFTER_STATUSES = _RETRY_STATUSES + (403,)  # GitHub's secondary rate limits are 403 + Retry-After
+
+# {host: request, pool and rate-limit counters}; latency histograms are recorded as "http.<host>"
+HTTP_STATS: dict[str, dict[str, Any]] = {}
+
+# {(host, owning event loop): client}; httpx clients are bound to the loop that created them
+_CLIENTS: dict[tuple[str, asyncio.AbstractEventLoop], httpx.AsyncClient] = {}
+# {event loop: parked task that closes the loop's clients when the loop shuts down}
+_REAPERS: dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+
+
+class TokenBucket:
+    """
+    Request-rate limiter shared by everything that talks to one host.
+    Callers reserve a token up front and sleep until it is due, so waiters
+    are served in arrival order without a lock tied to an event loop.
+    pause_until() holds every caller back until an upstream-imposed time.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        now = time.monotonic()
+        wait = max(self._paused_until - now, 0.0)
+        if self.rate <= 0:
+            return wait
+        start = max(now, self._paused_until)
+        self._tokens = min(self.burst, self._tokens + (start - self._updated) * self.rate)
+        self._updated = start
+        self._tokens -= 1.0
+        if self._tokens < 0:
+            wait += -self._tokens / self.rate
+        return wait
+
+    def pause_until(self, deadline: float) -> None:
+        """No request may start before `deadline` (monotonic)."""
+        if deadline > self._paused_until:
+            self._paused_until = deadline
+
+
+def _parse_rate_limits(spec: str) -> dict[str, tuple[float, float]]:
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, _, value = item.partition("=")
+        rate, _, burst = value.partition("/")
+        try:
+            limits[host.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            log("Ignoring malformed MCP_HTTP_RATE_LIMITS entry: {}", item)
+    return limits
+
+
+_HOST_LIMITS = _parse_rate_limits(HTTP_RATE_LIMITS)
+_BUCKETS: dict[str, TokenBucket] = {}
+
+
+def http_stats_snapshot() -> dict[str, dict[str, Any]]:
+    """Point-in-time copy of HTTP_STATS, safe to read from another thread (e.g. the dashboard)."""
+    return {host: dict(rec) for host, rec in list(HTTP_STATS.items())}
+
+
+def bucket_for(host: str) -> TokenBucket:
+    """The token bucket for a host (shared across clients and event loops)."""
+    bucket = _BUCKETS.get(host)
+    if bucket is None:
+        rate, burst = _HOST_LIMITS.get(host, (HTTP_RATE, HTTP_BURST))
+        bucket = _BUCKETS.setdefault(host, TokenBucket(rate, burst))
+    return bucket
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Seconds the upstream asks us to wait: Retry-After (delta or HTTP date) on
+    403/429/503, or until X-RateLimit-Reset once X-RateLimit-Remaining hits 0.
+    None if the response carries no such instruction.
+    """
+    headers = response.headers
+    value = headers.get("Retry-After")
+    if value and response.status_code in _RETRY_AFTER_STATUSES:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    if headers.get("X-RateLimit-Remaining") == "0":
+        reset = headers.get("X-RateLimit-Reset")
+        try:
+            reset_at = float(reset)
+        except (TypeError, ValueError):
+            return None
+        # GitHub sends epoch seconds; some APIs send seconds-until-reset
+        return max(reset_at - time.time(), 0.0) if reset_at > 1e9 else max(reset_at, 0.0)
+    if response.status_code == 429:
+        return 1.0  # rate limited without saying for how long
+    return None
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        log("MCP_HTTP2 is set but the 'h2' package is missing (pip install 'httpx[http2]'). Using HTTP/1.1.")
+        return False
+    return True
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body wrapper that frees the pool slot once the body is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class _PooledTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the real transport to account for pool usage and request rate.
+    The host's token bucket is waited on first (rate_wait_ms); then a
+    semaphore sized to the connection limit gates requests, so time spent
+    acquiring it is the time a request waited for a free connection.
+    """
+
+    def __init__(self, host: str, inner: httpx.AsyncBaseTransport, max_active: int):
+        self._name = f"http.{host}"
+        self._inner = inner
+        self._slots = asyncio.Semaphore(max_active)
+        self._bucket = bucket_for(host)
+        self._stats = HTTP_STATS.setdefault(host, {
+            "count": 0,
+            "total_ms": 0.0,
+            "errors": 0,
+            "active_connections": 0,
+            "max_active_connections": 0,
+            "pool_wait_ms": 0.0,
+            "max_pool_wait_ms": 0.0,
+            "rate_wait_ms": 0.0,
+            "max_rate_wait_ms": 0.0,
+            "rate_limited": 0,
+            "retries": 0,
+        })
+
+    def _release(self, started: float, error: bool = False) -> None:
+        stats = self._stats
+        elapsed = (time.perf_counter() - started) * 1000.0
+        stats["active_connections"] -= 1
+        stats["count"] += 1
+        stats["total_ms"] += elapsed
+        if error:
+            stats["errors"] += 1
+        record_latency(self._name, elapsed, ok=not error)
+        self._slots.release()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # Only requests whose body is in memory can be sent again
+        replayable = isinstance(request.stream, httpx.ByteStream)
+        attempt = 0
+        while True:
+            await self._throttle()
+            response = await self._send(request)
+            delay = _retry_after(response)
+            if delay is None:
+                return response
+            self._stats["rate_limited"] += 1
+            self._bucket.pause_until(time.monotonic() + min(delay, HTTP_MAX_RETRY_WAIT))
+            # 429/503, or GitHub's 403 (secondary limit or exhausted budget); a 2xx only pauses the bucket
+            retry = response.status_code in _RETRY_AFTER_STATUSES
+            if not retry or not replayable or attempt >= HTTP_MAX_RETRIES or delay > HTTP_MAX_RETRY_WAIT:
+                return response
+            attempt += 1
+            self._stats["retries"] += 1
+            log("{} {} rate limited ({}), retrying in {:.1f}s (attempt {}/{})",
+                request.method, request.url.host, response.status_code, delay, attempt, HTTP_MAX_RETRIES)
+            await response.aclose()
+
+    async def _throttle(self) -> None:
+        """Wait for the host's token bucket; the wait is recorded as rate_wait_ms."""
+        wait = self._bucket.reserve()
+        if wait <= 0:
+            return
+        await asyncio.sleep(wait)
+        stats = self._stats
+        waited_ms = wait * 1000.0
+        stats["rate_wait_ms"] += waited_ms
+        stats["max_rate_wait_ms"] = max(stats["max_rate_wait_ms"], waited_ms)
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        stats = self._stats
+        queued = time.perf_counter()
+        await self._slots.acquire()
+        started = time.perf_counter()
+        waited_ms = (started - queued) * 1000.0
+        stats["pool_wait_ms"] += waited_ms
+        stats["max_pool_wait_ms"] = max(stats["max_pool_wait_ms"], waited_ms)
+        stats["active_connections"] += 1
+        stats["max_active_connections"] = max(stats["max_active_connections"], stats["active_connections"])
+
+        try:
+            response = await self._inner.handle_async_request(request)
+        except BaseException:
+            self._release(started, error=True)
+            raise
+
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self._release(started)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, release),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def get_client(base_url: str, auth: Optional[Any] = None, headers: Optional[dict[str, str]] = None) -> httpx.AsyncClient:
+    """
+    Return the shared client for the host of `base_url`, creating it on first use.
+    Auth and default headers are fixed by the first caller for that host.
+    """
+    host = urlsplit(base_url).netloc or base_url
+    loop = asyncio.get_running_loop()
+    client = _CLIENTS.get((host, loop))
+    if client is not None and not client.is_closed:
+        return client
+    _forget_closed_loops()
+    if loop not in _REAPERS:
+        _REAPERS[loop] = loop.create_task(_close_at_loop_exit(), name="http-pool-reaper")
+
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    http2 = _http2_available()
+    inner = httpx.AsyncHTTPTransport(limits=limits, http2=http2)
+    client = httpx.AsyncClient(
+        auth=auth,
+        headers=headers,
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        transport=_PooledTransport(host, inner, HTTP_MAX_CONNECTIONS),
+    )
+    _CLIENTS[(host, loop)] = client
+    log("Opened pooled HTTP client for {} (max_connections={}, http2={})", host, HTTP_MAX_CONNECTIONS, http2)
+    return client
+
+
+async def close_clients() -> None:
+    """Close every pooled client owned by the running loop."""
+    loop = asyncio.get_running_loop()
+    for key, client in list(_CLIENTS.items()):
+        host, owner = key
+        if owner is not loop:
+            continue
+        del _CLIENTS[key]
+        try:
+            await client.aclose()
+        except Exception as e:
+            log("Error closing HTTP client for {}: {}", host, repr(e))
+
+
+async def _close_at_loop_exit() -> None:
+    """
+    Parked until the loop shuts down: asyncio.run() cancels leftover tasks while
+    the loop still runs, so the loop's clients are closed even if nobody called
+    close_clients() (e.g. one asyncio.run() per batch).
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.create_future()
+    except asyncio.CancelledError:
+        await close_clients()
+        raise
+    finally:
+        _REAPERS.pop(loop, None)
+
+
+def _forget_closed_loops() -> None:
+    """Drop clients whose loop ended without shutting down its tasks; they can no longer be closed."""
+    for key, client in list(_CLIENTS.items()):
+        if key[1].is_closed():
+            del _CLIENTS[key]
+            if not client.is_closed:
+                log("HTTP client for {} outlived its event loop; dropped without closing", key[0])
+    for loop in [loop for loop in _REAPERS if loop.is_closed()]:
+        del _REAPERS[loop]
+
+
+@asynccontextmanager
+async def pooled_clients():
+    """Context manager that closes pooled clients on exit."""
+    try:
+        yield
+    finally:
+        await close_clients()
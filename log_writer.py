@@ -0,0 +1,131 @@
+# log_writer.py
+"""
+Background log writer.
+log() callers only format the message and append a record to a bounded
+in-memory queue; a writer thread drains it in batches, redacts secrets,
+renders text or JSON lines and writes each batch to stderr with one write and
+one flush. A slow stderr reader (e.g. the MCP host on the stdio transport)
+then delays log output instead of the event loop. When the queue is full new
+records are dropped and counted; the next batch reports how many were lost.
+"""
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# Correlation id of the tool call running in the current task (set by @instrument)
+CURRENT_CID: ContextVar[Optional[str]] = ContextVar("mcp_current_cid", default=None)
+
+_LEVEL_NAMES = {10: "DEBUG", 20: "INFO", 30: "WARNING", 40: "ERROR"}
+
+
+class LogWriter:
+    """Bounded log queue drained by a daemon thread; close() flushes what is left."""
+
+    def __init__(self, redact: Callable[[str], str], fmt: str = "text", max_queue: int = 10000,
+                 flush_interval: float = 0.05, batch_size: int = 512, background: bool = True):
+        self.redact = redact
+        self.fmt = fmt
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.background = background
+        self._queue: deque[tuple] = deque()
+        self._wake = threading.Event()
+        self._write_lock = threading.Lock()  # one batch at a time (writer thread vs flush())
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._reported_drops = 0
+
+    def write(self, level: int, message: str, cid: Optional[str] = None) -> None:
+        """
+        Queue one already-formatted message (or write it now if not running in the
+        background). `cid` defaults to the current task's CURRENT_CID.
+        """
+        record = (level, time.time(), message, cid if cid is not None else CURRENT_CID.get())
+        if not self.background or self._closed:
+            with self._write_lock:
+                self._emit([record])
+            return
+        if len(self._queue) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._queue.append(record)
+        if self._thread is None:
+            self._start()
+        if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _start(self) -> None:
+        with self._write_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            # Let a burst accumulate so it goes out as one write
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything queued so far."""
+        with self._write_lock:
+            while self._queue or self.dropped != self._reported_drops:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                self._emit(batch)
+
+    def _emit(self, batch: list[tuple]) -> None:
+        if self.dropped != self._reported_drops:
+            lost, self._reported_drops = self.dropped - self._reported_drops, self.dropped
+            batch.append((30, time.time(), f"[log] {lost} log record(s) dropped: queue full ({self.max_queue})", None))
+        lines = [self._render(record) for record in batch]
+        try:
+            stream = sys.stderr  # looked up per batch so redirect_stderr() is honoured
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+        except (OSError, ValueError):
+            return  # stderr closed (e.g. interpreter shutdown); nothing else to do
+        self.written += len(batch)
+        self.batches += 1
+
+    def _render(self, record: tuple) -> str:
+        level, ts, message, cid = record
+        message = self.redact(message)
+        if self.fmt != "json":
+            return message
+        entry = {
+            "ts": round(ts, 6),
+            "level": _LEVEL_NAMES.get(level, str(level)),
+            "msg": message,
+        }
+        if cid is not None:
+            entry["cid"] = cid
+        return json.dumps(entry, ensure_ascii=False)
+
+    def close(self) -> None:
+        """Flush remaining records; later writes go straight to stderr."""
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "format": self.fmt,
+            "background": self.background,
+            "queued": len(self._queue),
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+        }
@@ -1,118 +1,287 @@
 # mcp_helpers.py
 import time
-import sys
 import os
-import uuid
+import random
+import atexit
 import asyncio
-import re
-from typing import Any, Callable, Coroutine
+import tempfile
+from typing import Any, Callable, Coroutine, Optional
 from functools import wraps
 
-# simple in-memory cache: {key: (ts, value)}
-_CACHE: dict[str, tuple[float, Any]] = {}
+from cache_store import make_cache
+from histogram import ToolLatency
+from correlation_store import CorrelationStore
+from redaction import SECRET_ENGINE, SECRET_RULES
+from log_writer import LogWriter, CURRENT_CID
+
+# bounded cache with LRU eviction and per-key TTLs; "sqlite" shares it across processes
+CACHE_BACKEND = os.getenv("MCP_CACHE_BACKEND", "memory")  # memory | sqlite
+CACHE_PATH = os.getenv("MCP_CACHE_PATH", os.path.join(tempfile.gettempdir(), "mcp_cache.sqlite3"))
 CACHE_TTL = float(os.getenv("MCP_CACHE_TTL", "60"))  # seconds
+CACHE_MAX_ENTRIES = int(os.getenv("MCP_CACHE_MAX_ENTRIES", "10000"))  # 0 = unlimited
+CACHE_MAX_BYTES = int(os.getenv("MCP_CACHE_MAX_BYTES", "0"))  # approximate; 0 = unlimited
+CACHE_SWEEP_INTERVAL = float(os.getenv("MCP_CACHE_SWEEP_INTERVAL", "30"))  # seconds
+_CACHE = make_cache(CACHE_BACKEND, CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_SWEEP_INTERVAL, CACHE_PATH)
 
 # simple per-tool stats
 TOOL_STATS: dict[str, dict[str, Any]] = {}
 
+# per-tool latency histograms (percentiles, success vs error, lifetime + sliding window)
+TOOL_LATENCY: dict[str, ToolLatency] = {}
+
 # rate limiting per-tool using semaphores (conservative)
 _RATE_LIMITS: dict[str, asyncio.Semaphore] = {}
 
+# log levels (MCP_LOG_LEVEL); messages below the threshold are never formatted
+LOG_DEBUG, LOG_INFO, LOG_WARNING, LOG_ERROR = 10, 20, 30, 40
+_LOG_LEVELS = {"DEBUG": LOG_DEBUG, "INFO": LOG_INFO, "WARNING": LOG_WARNING, "ERROR": LOG_ERROR, "OFF": 100}
+_LOG_THRESHOLD = _LOG_LEVELS.get(os.getenv("MCP_LOG_LEVEL", "INFO").upper(), LOG_INFO)
+
+# instrumentation cost control: off | counters | full
+INSTRUMENT_LEVELS = ("off", "counters", "full")
+INSTRUMENT_LEVEL = os.getenv("MCP_INSTRUMENT_LEVEL", "full").lower()
+if INSTRUMENT_LEVEL not in INSTRUMENT_LEVELS:
+    INSTRUMENT_LEVEL = "full"
+CORRELATION_SAMPLE_RATE = float(os.getenv("MCP_CORRELATION_SAMPLE_RATE", "1.0"))  # fraction of calls traced
+
 # correlation tracking: {correlation_id: {"tool": str, "start_time": float, "jsonrpc_id": str, ...}}
-CORRELATION_CHAIN: dict[str, dict[str, Any]] = {}
+# bounded ring buffer; slow (>= MCP_SLOW_CALL_MS) and errored chains are kept after eviction
+CORRELATION_CHAIN = CorrelationStore(
+    capacity=int(os.getenv("MCP_CORRELATION_CAPACITY", "10000")),
+    pinned_capacity=int(os.getenv("MCP_CORRELATION_PINNED", "1000")),
+    slow_ms=float(os.getenv("MCP_SLOW_CALL_MS", "1000")),
+)
 
-# Secret patterns to redact from logs
-SECRET_PATTERNS = [
-    re.compile(r'(token|auth|password|secret|key|credential|bearer)[\'\"]?\s*[:=]\s*[\'\"]?([^\s\'"]+)', re.IGNORECASE),
-    re.compile(r'(ghp_[a-zA-Z0-9]{36})', re.IGNORECASE),  # GitHub PAT
-    re.compile(r'(gho_[a-zA-Z0-9]{36})', re.IGNORECASE),  # GitHub OAuth
-    re.compile(r'(Bearer\s+[^\s]+)', re.IGNORECASE),
-]
+# Secret patterns to redact from logs (rules with literal pre-filters live in redaction.py)
+SECRET_PATTERNS = [rule.pattern for rule in SECRET_RULES]
 
 def redact_secrets(text: str) -> str:
     """Redact secrets from text using pattern matching."""
-    for pattern in SECRET_PATTERNS:
-        text = pattern.sub(r'\1=<REDACTED>', text)
-    return text
+    return SECRET_ENGINE.redact(text)
+
+# log output: records are queued and written to stderr in batches by a background thread
+LOG_FORMAT = os.getenv("MCP_LOG_FORMAT", "text").lower()  # text | json (JSON lines with level, ts, cid)
+_LOG_WRITER = LogWriter(
+    redact_secrets,
+    fmt=LOG_FORMAT,
+    max_queue=int(os.getenv("MCP_LOG_QUEUE_SIZE", "10000")),
+    flush_interval=float(os.getenv("MCP_LOG_FLUSH_INTERVAL", "0.05")),
+    background=os.getenv("MCP_LOG_ASYNC", "1") != "0",
+)
+atexit.register(_LOG_WRITER.close)
+
+def flush_logs() -> None:
+    """Write out every queued log record now."""
+    _LOG_WRITER.flush()
+
+def log_stats() -> dict:
+    """Queue depth, written/dropped counts of the log writer."""
+    return _LOG_WRITER.stats()
+
+def log_enabled(level: int = LOG_INFO) -> bool:
+    """True if a message at `level` would be written."""
+    return level >= _LOG_THRESHOLD
+
+def log_at(level: int, msg: str, *args, **kwargs) -> None:
+    """
+    Log at `level`; formatting only happens if the message will be written.
+    The message is queued; redaction and the stderr write happen on the writer thread.
+    """
+    if level < _LOG_THRESHOLD:
+        return
+    _LOG_WRITER.write(level, msg.format(*args, **kwargs))
+
+def _log_cid(level: int, cid: str, msg: str, *args) -> None:
+    """log_at() for @instrument's own records, tagged with their correlation id."""
+    if level < _LOG_THRESHOLD:
+        return
+    _LOG_WRITER.write(level, msg.format(*args), cid)
 
 def log(msg: str, *args, **kwargs) -> None:
     """Log to stderr only (never print secrets)."""
-    formatted = msg.format(*args, **kwargs)
-    safe_msg = redact_secrets(formatted)
-    print(safe_msg, file=sys.stderr)
+    log_at(LOG_INFO, msg, *args, **kwargs)
 
 def cache_get(key: str):
-    now = time.time()
-    v = _CACHE.get(key)
-    if v:
-        ts, val = v
-        if now - ts < CACHE_TTL:
-            return val
-        del _CACHE[key]
-    return None
-
-def cache_set(key: str, value: Any):
-    _CACHE[key] = (time.time(), value)
+    return _CACHE.get(key)
+
+def cache_set(key: str, value: Any, ttl: Optional[float] = None):
+    """Store a value; `ttl` overrides MCP_CACHE_TTL for this key."""
+    _CACHE.set(key, value, ttl)
+
+def cache_delete(key: str) -> None:
+    _CACHE.delete(key)
+
+def cache_keys(prefix: str = "") -> list[str]:
+    """Unexpired cache keys starting with `prefix`."""
+    return _CACHE.keys(prefix)
+
+def bump_stat(tool_name: str, field: str, amount: float = 1) -> None:
+    """Increment an extra counter (e.g. cache hits) on a tool's TOOL_STATS entry."""
+    rec = TOOL_STATS.setdefault(tool_name, {"count": 0, "total_ms": 0.0})
+    rec[field] = rec.get(field, 0) + amount
+
+def extra_stats(stats: dict) -> dict:
+    """The bump_stat counters of a TOOL_STATS entry: every field but count and total_ms."""
+    return {field: value for field, value in stats.items() if field not in ("count", "total_ms")}
+
+def record_latency(tool_name: str, elapsed_ms: float, ok: bool = True) -> None:
+    """Add one call to the tool's latency histograms."""
+    hist = TOOL_LATENCY.get(tool_name)
+    if hist is None:
+        hist = TOOL_LATENCY.setdefault(tool_name, ToolLatency())
+    hist.record(elapsed_ms, ok)
+
+def stats_snapshot() -> dict[str, dict[str, Any]]:
+    """Point-in-time copy of TOOL_STATS, safe to read from another thread (e.g. the dashboard)."""
+    # list() and dict() copies run without releasing the GIL, so each record is read whole
+    return {name: dict(rec) for name, rec in list(TOOL_STATS.items())}
+
+def latency_summary(tool_name: str) -> Optional[dict]:
+    """Percentile summary for a tool, or None if it has no recorded calls."""
+    hist = TOOL_LATENCY.get(tool_name)
+    return hist.summary() if hist else None
 
 def ensure_rate_limit(tool_name: str, max_parallel: int = 4):
     if tool_name not in _RATE_LIMITS:
         _RATE_LIMITS[tool_name] = asyncio.Semaphore(max_parallel)
     return _RATE_LIMITS[tool_name]
 
+def _copy_result(result: Any) -> Any:
+    # Each caller gets its own top-level dict so @instrument can attach its _mcp_meta
+    return dict(result) if isinstance(result, dict) else result
+
+def coalesce(tool_name: str, ttl: float = 0.0):
+    """
+    Single-flight decorator: concurrent calls with identical arguments share one
+    in-flight execution, and results are optionally memoized for `ttl` seconds.
+    Place it under @instrument so every caller is still measured. Counts of
+    coalesced calls and memo hits are added to TOOL_STATS[tool_name].
+    """
+    def deco(func: Callable[..., Coroutine[Any, Any, Any]]):
+        in_flight: dict[str, asyncio.Future] = {}
+        memo: dict[str, tuple[float, Any]] = {}
+
+        def finished(key: str, task: asyncio.Future) -> None:
+            if in_flight.get(key) is task:
+                del in_flight[key]
+            if task.cancelled() or task.exception() is not None:
+                return
+            if ttl > 0:
+                now = time.monotonic()
+                if len(memo) >= 1024:
+                    for k in [k for k, (expires_at, _) in memo.items() if expires_at <= now]:
+                        del memo[k]
+                memo[key] = (now + ttl, task.result())
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = repr((args, sorted(kwargs.items())))
+            if ttl > 0:
+                hit = memo.get(key)
+                if hit and hit[0] > time.monotonic():
+                    bump_stat(tool_name, "memo_hits")
+                    return _copy_result(hit[1])
+
+            task = in_flight.get(key)
+            if task is None:
+                # Run in its own task so one caller's cancellation doesn't fail the others
+                task = asyncio.ensure_future(func(*args, **kwargs))
+                in_flight[key] = task
+                task.add_done_callback(lambda t: finished(key, t))
+            else:
+                bump_stat(tool_name, "coalesced")
+            return _copy_result(await asyncio.shield(task))
+        return wrapper
+    return deco
+
+def set_instrument_level(level: str, sample_rate: Optional[float] = None) -> None:
+    """Change the instrumentation level (off | counters | full) and correlation sample rate at runtime."""
+    global INSTRUMENT_LEVEL, CORRELATION_SAMPLE_RATE
+    if level not in INSTRUMENT_LEVELS:
+        raise ValueError(f"Unknown instrument level: {level!r} (expected one of {INSTRUMENT_LEVELS})")
+    INSTRUMENT_LEVEL = level
+    if sample_rate is not None:
+        CORRELATION_SAMPLE_RATE = sample_rate
+
 def instrument(tool_name: str):
-    """Decorator to measure latency, assign correlation id, and record stats."""
+    """
+    Decorator to measure latency, assign correlation id, and record stats.
+    MCP_INSTRUMENT_LEVEL controls the cost: "off" only applies the rate limit,
+    "counters" records TOOL_STATS, "full" also captures correlation chains and
+    START/END logs for a MCP_CORRELATION_SAMPLE_RATE fraction of calls (errors
+    are always captured).
+    """
     def deco(func: Callable[..., Coroutine[Any, Any, Any]]):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            print(f"INSTRUMENTED CALL: {tool_name}")  # DEBUG: Confirm decorator is triggered
-            cid = str(uuid.uuid4())[:8]
-            start = time.time()
-            
             # Extract JSON-RPC ID if present in kwargs
             jsonrpc_id = kwargs.pop('_jsonrpc_id', None)
             parent_cid = kwargs.pop('_parent_cid', None)
+            level = INSTRUMENT_LEVEL
+            sem = ensure_rate_limit(tool_name)
+            if level == "off":
+                async with sem:
+                    return await func(*args, **kwargs)
             
-            # Store correlation info
-            CORRELATION_CHAIN[cid] = {
-                "tool": tool_name,
-                "start_time": start,
-                "jsonrpc_id": jsonrpc_id,
-                "parent_cid": parent_cid,
-                "args": str(args)[:100],  # Truncate for safety
-            }
+            start = time.perf_counter()
+            cid = None
+            if level == "full" and (CORRELATION_SAMPLE_RATE >= 1.0 or random.random() < CORRELATION_SAMPLE_RATE):
+                cid = _start_correlation(tool_name, jsonrpc_id, parent_cid, args)
             
-            log("[cid={}] START tool={} jsonrpc_id={} parent={}", cid, tool_name, jsonrpc_id or "N/A", parent_cid or "N/A")
-            sem = ensure_rate_limit(tool_name)
             async with sem:
+                # log records written inside the call carry its cid (JSON log format)
+                cid_token = CURRENT_CID.set(cid) if cid is not None else None
                 try:
                     result = await func(*args, **kwargs)
-                    elapsed = (time.time() - start) * 1000.0
-                    rec = TOOL_STATS.setdefault(tool_name, {"count":0, "total_ms":0.0})
-                    rec["count"] += 1
-                    rec["total_ms"] += elapsed
-                    log("[cid={}] END tool={} elapsed_ms={:.1f}", cid, tool_name, elapsed)
-                    
-                    # Update correlation chain
-                    CORRELATION_CHAIN[cid]["end_time"] = time.time()
-                    CORRELATION_CHAIN[cid]["elapsed_ms"] = elapsed
-                    CORRELATION_CHAIN[cid]["status"] = "success"
-                    
-                    # attach correlation id + latency metadata if result is a dict
-                    if isinstance(result, dict):
-                        result.setdefault("_mcp_meta", {})["correlation_id"] = cid
-                        result["_mcp_meta"]["latency_ms"] = round(elapsed,1)
-                        if jsonrpc_id:
-                            result["_mcp_meta"]["jsonrpc_id"] = jsonrpc_id
-                    return result
                 except Exception as e:
-                    elapsed = (time.time() - start) * 1000.0
-                    log("[cid={}] ERROR tool={} elapsed_ms={:.1f} error={}", cid, tool_name, elapsed, repr(e))
-                    
-                    # Update correlation chain
-                    CORRELATION_CHAIN[cid]["end_time"] = time.time()
-                    CORRELATION_CHAIN[cid]["elapsed_ms"] = elapsed
-                    CORRELATION_CHAIN[cid]["status"] = "error"
-                    CORRELATION_CHAIN[cid]["error"] = str(e)
+                    elapsed = (time.perf_counter() - start) * 1000.0
+                    record_latency(tool_name, elapsed, ok=False)
+                    if level == "full":
+                        if cid is None:
+                            cid = _start_correlation(tool_name, jsonrpc_id, parent_cid, args, elapsed)
+                        _log_cid(LOG_ERROR, cid, "[cid={}] ERROR tool={} elapsed_ms={:.1f} error={}", cid, tool_name, elapsed, repr(e))
+                        
+                        # Update correlation chain
+                        CORRELATION_CHAIN.finish(cid, "error", end_time=time.time(), elapsed_ms=elapsed, error=str(e))
                     raise
+                finally:
+                    if cid_token is not None:
+                        CURRENT_CID.reset(cid_token)
+            
+            elapsed = (time.perf_counter() - start) * 1000.0
+            rec = TOOL_STATS.get(tool_name)
+            if rec is None:
+                rec = TOOL_STATS.setdefault(tool_name, {"count": 0, "total_ms": 0.0})
+            rec["count"] += 1
+            rec["total_ms"] += elapsed
+            record_latency(tool_name, elapsed)
+            
+            if cid is not None:
+                _log_cid(LOG_INFO, cid, "[cid={}] END tool={} elapsed_ms={:.1f}", cid, tool_name, elapsed)
+                
+                # Update correlation chain
+                CORRELATION_CHAIN.finish(cid, "success", end_time=time.time(), elapsed_ms=elapsed)
+                
+                # attach correlation id + latency metadata if result is a dict
+                if isinstance(result, dict):
+                    result.setdefault("_mcp_meta", {})["correlation_id"] = cid
+                    result["_mcp_meta"]["latency_ms"] = round(elapsed,1)
+                    if jsonrpc_id:
+                        result["_mcp_meta"]["jsonrpc_id"] = jsonrpc_id
+            return result
         return wrapper
     return deco
+
+def _start_correlation(tool_name: str, jsonrpc_id: Optional[str], parent_cid: Optional[str],
+                       args: tuple, elapsed_ms: float = 0.0) -> str:
+    """Open a correlation chain entry and log START; returns the new correlation id."""
+    cid = os.urandom(4).hex()  # 8 hex chars, far cheaper than uuid4()
+    CORRELATION_CHAIN[cid] = {
+        "tool": tool_name,
+        "start_time": time.time() - elapsed_ms / 1000.0,
+        "jsonrpc_id": jsonrpc_id,
+        "parent_cid": parent_cid,
+        "args": str(args)[:100],  # Truncate for safety
+    }
+    _log_cid(LOG_INFO, cid, "[cid={}] START tool={} jsonrpc_id={} parent={}", cid, tool_name, jsonrpc_id or "N/A", parent_cid or "N/A")
+    return cid
@@ -0,0 +1,372 @@
+# patch_engine.py
+"""
+Rule-driven source fixes for Sonar issues.
+Each supported rule has a detector (used by the simulated analysis) and a fix
+that deletes the offending statement: `no-console` removes console.* calls,
+`no-dead-code` removes functions that nothing references. Sonar's own rule
+keys are mapped onto these (e.g. typescript:S106 -> no-console). Fixes are
+line-based and conservative: a statement is only removed when it has its
+lines to itself (it starts a line, its brackets balance and nothing but `;` or
+a comment follows it) and removing it cannot change what the neighbouring code
+means (it is not the body of a brace-less if/else/for/while/do, and the next
+line does not continue the expression). Anything else is reported as unfixed,
+with the reason. Every changed file comes back with a unified diff.
+
+Large file sets are patched in a process pool. Regex work on many files then
+neither blocks the event loop nor contends for the GIL. Only the standard
+library is imported here, so pool workers start cheaply.
+"""
+import os
+import re
+import asyncio
+import difflib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+PATCH_WORKERS = int(os.getenv("MCP_PATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_PARALLEL_FILE_THRESHOLD = 8  # files; below this, worker IPC costs more than it saves
+_SOURCE_SUFFIXES = (".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx")
+
+RULE_ALIASES = {
+    "javascript:S106": "no-console",  # standard outputs used for logging
+    "typescript:S106": "no-console",
+    "javascript:S2228": "no-console",  # console logging
+    "typescript:S2228": "no-console",
+    "javascript:S1144": "no-dead-code",  # unused private functions
+    "typescript:S1144": "no-dead-code",
+}
+
+_CONSOLE_METHODS = r"console\.(?:log|debug|info|warn|error|trace|dir|table)\s*\("
+_CONSOLE_CALL = re.compile(r"^\s*" + _CONSOLE_METHODS)  # fixable: the call starts its line
+_CONSOLE_ANY = re.compile(r"(?<![\w$.])" + _CONSOLE_METHODS)
+_FUNCTION_DECL = re.compile(
+    r"^\s*(?:async\s+)?function\s*\*?\s*([A-Za-z_$][\w$]*)\s*\("
+    r"|^\s*(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)"
+)
+_OPEN, _CLOSE = "([{", ")]}"
+_STATEMENT_TAIL = re.compile(r"\s*;?\s*(?://.*|/\*.*?\*/\s*)?")  # what may follow a removed statement
+_LINE_COMMENT = re.compile(r"^\s*(?://|/?\*)")
+_CONTROL_HEADER = re.compile(r"^\s*(?:}\s*)?(?:if|for|while|else\s+if)\b")
+_CONTROL_BARE = re.compile(r"(?:^|[\s}])(?:else|do)$")
+_CONTINUES_FROM = re.compile(r"(?:[-+*/%&|^!~?:<>=,(\[.]|=>|\b(?:return|typeof|void|await|yield|new|in|of|instanceof))$")
+_CONTINUES_INTO = re.compile(r"^(?:\?\.|[-+*/%&|^?:<>=,.(\[]|(?:in|instanceof)\b)")
+_CASE_LABEL = re.compile(r"^\s*(?:case\b.*|default\s*):$")
+
+
+def canonical_rule(rule: Optional[str]) -> Optional[str]:
+    """Engine rule for a Sonar rule key, or None if there is no automatic fix."""
+    if rule in ("no-console", "no-dead-code"):
+        return rule
+    return RULE_ALIASES.get(rule or "")
+
+
+def _statement_end(lines: list[str], start: int) -> Optional[tuple[int, str]]:
+    """
+    The statement starting at lines[start]: the index of the line where the
+    brackets opened since `start` are closed again (string literals and //
+    comments skipped), and the text after that closing bracket. None if they
+    never balance.
+    """
+    depth = 0
+    opened = False
+    quote = None
+    for index in range(start, len(lines)):
+        line = lines[index]
+        tail = None
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if quote:
+                if ch == "\\":
+                    i += 1
+                elif ch == quote:
+                    quote = None
+            elif ch in "'\"`":
+                quote = ch
+            elif ch == "/" and line.startswith("//", i):
+                break
+            elif ch in _OPEN:
+                depth += 1
+                opened = True
+            elif ch in _CLOSE:
+                depth -= 1
+                if depth <= 0 and tail is None:
+                    tail = i + 1
+            i += 1
+        if quote in ("'", '"'):
+            quote = None  # unterminated single-line string; don't carry it over
+        if opened and depth <= 0 and quote is None:
+            # The body may start on the next line (`=>` at line end, or `{` on its own line)
+            following = lines[index + 1].lstrip() if index + 1 < len(lines) else ""
+            code = line.rstrip()
+            if code.endswith("=>") or (following.startswith("{") and not code.endswith(";")):
+                continue
+            return index, line[tail:] if tail is not None else ""
+    return None
+
+
+def _strip_comment(line: str) -> str:
+    """`line` without a trailing // or /* */ comment (approximate: ignores string literals)."""
+    return re.sub(r"/\*.*?\*/\s*$", "", line.split("//", 1)[0]).rstrip()
+
+
+def _significant(lines: list[str], index: int, step: int) -> Optional[int]:
+    """Nearest line from `index` in direction `step` that holds code, or None."""
+    index += step
+    while 0 <= index < len(lines):
+        if lines[index].strip() and not _LINE_COMMENT.match(lines[index]):
+            return index
+        index += step
+    return None
+
+
+def _header_line(lines: list[str], index: int) -> int:
+    """Line where the parenthesis closed at the end of lines[index] was opened (for multi-line conditions)."""
+    depth = 0
+    for j in range(index, -1, -1):
+        for ch in reversed(_strip_comment(lines[j])):
+            if ch == ")":
+                depth += 1
+            elif ch == "(":
+                depth -= 1
+        if depth <= 0:
+            return j
+    return index
+
+
+def _removal_hazard(lines: list[str], start: int, end: int, tail: str) -> Optional[str]:
+    """Why removing lines[start:end + 1] could change or break the code around it, or None if it is safe."""
+    if not _STATEMENT_TAIL.fullmatch(tail):
+        return "other code follows the statement on its line"
+    before = _significant(lines, start, -1)
+    if before is not None:
+        previous = _strip_comment(lines[before])
+        if _CONTROL_BARE.search(previous) or (
+                previous.endswith(")") and _CONTROL_HEADER.match(lines[_header_line(lines, before)])):
+            return "statement is the body of a brace-less if/else/for/while/do"
+        if _CONTINUES_FROM.search(previous) and not _CASE_LABEL.match(previous):
+            return "statement continues an expression from the previous line"
+    after = _significant(lines, end, 1)
+    if after is not None and _CONTINUES_INTO.match(lines[after].lstrip()):
+        return "the next line continues the statement's expression"
+    return None
+
+
+def _dead_functions(source: str, lines: list[str]) -> dict[int, str]:
+    """{line index: name} of function declarations whose name occurs nowhere else."""
+    found = {}
+    for index, line in enumerate(lines):
+        match = _FUNCTION_DECL.match(line)
+        if not match:
+            continue
+        name = match.group(1) or match.group(2)
+        if len(re.findall(r"(?<![\w$])" + re.escape(name) + r"(?![\w$])", source)) == 1:
+            found[index] = name
+    return found
+
+
+def detect(path: str, source: str) -> list[dict]:
+    """Issues the engine knows in one file: [{"rule", "line" (1-based), "message"}]."""
+    if not path.endswith(_SOURCE_SUFFIXES):
+        return []
+    lines = source.splitlines()
+    issues = [
+        {"rule": "no-console", "line": index + 1, "message": "Unexpected console statement"}
+        for index, line in enumerate(lines) if not _LINE_COMMENT.match(line) and _CONSOLE_ANY.search(line)
+    ]
+    issues += [
+        {"rule": "no-dead-code", "line": index + 1, "message": f"Unused function '{name}'"}
+        for index, name in _dead_functions(source, lines).items()
+    ]
+    issues.sort(key=lambda issue: issue["line"])
+    return issues
+
+
+def fix(path: str, source: str, fixes: list[tuple[str, Optional[int]]]) -> tuple[str, list, list]:
+    """
+    Apply (rule, line) fixes to one file; a None line fixes every occurrence of
+    the rule. Returns the new source, the fixes that were applied and
+    [(fix, reason)] for those that were not.
+    """
+    lines = source.splitlines(keepends=True)
+    stripped = [line.rstrip("\r\n") for line in lines]
+    dead = _dead_functions(source, stripped) if any(rule == "no-dead-code" for rule, _ in fixes) else {}
+
+    def statement(rule: str, index: int) -> tuple[Optional[tuple[int, int]], Optional[str]]:
+        """(removable line range, None) or (None, why not) for a fix at lines[index]."""
+        if rule == "no-console":
+            if not _CONSOLE_CALL.match(stripped[index]):
+                if _CONSOLE_ANY.search(stripped[index]):
+                    return None, "console call is part of a larger statement"
+                return None, "no console call on this line"
+        elif index not in dead:
+            return None, "no unused function declared on this line"
+        found = _statement_end(stripped, index)
+        if found is None:
+            return None, "statement end not found (unbalanced brackets)"
+        end, tail = found
+        hazard = _removal_hazard(stripped, index, end, tail)
+        return (None, hazard) if hazard else ((index, end), None)
+
+    ranges = []
+    applied, skipped = [], []
+    for rule, line in fixes:
+        if line is not None:
+            candidates = [line - 1] if 0 < line <= len(lines) else []
+        else:
+            candidates = [index for index in range(len(lines))
+                          if (index in dead if rule == "no-dead-code" else _CONSOLE_ANY.search(stripped[index]))]
+        reason = "line is outside the file" if line is not None and not candidates else "nothing to fix"
+        hit = False
+        for index in candidates:
+            found, why = statement(rule, index)
+            if found:
+                ranges.append(found)
+                hit = True
+            else:
+                reason = why
+        if hit:
+            applied.append((rule, line))
+        else:
+            skipped.append(((rule, line), reason))
+    if not ranges:
+        return source, [], skipped
+
+    remove = set()
+    for start, end in ranges:
+        remove.update(range(start, end + 1))
+    kept = []
+    gap = False  # lines were removed since the last kept line
+    for index, line in enumerate(lines):
+        if index in remove:
+            gap = True
+            continue
+        # Don't leave two blank lines where a statement was
+        if gap and not stripped[index].strip() and (not kept or not kept[-1].strip()):
+            continue
+        kept.append(line)
+        gap = False
+    if gap and kept and not kept[-1].strip():
+        kept.pop()  # nor a blank line at the end of the file
+    return "".join(kept), applied, skipped
+
+
+def patch_file(path: str, source: str, fixes: list[tuple[str, Optional[int]]]) -> tuple[str, str, list, list, str]:
+    """Pool worker: fix one file; returns (path, new source, applied fixes, skipped fixes, unified diff)."""
+    patched, applied, skipped = fix(path, source, fixes)
+    diff = "".join(difflib.unified_diff(
+        source.splitlines(keepends=True), patched.splitlines(keepends=True),
+        fromfile=f"a/{path}", tofile=f"b/{path}",
+    )) if patched != source else ""
+    return path, patched, applied, skipped, diff
+
+
+def detect_file(path: str, source: str) -> tuple[str, list[dict]]:
+    """Pool worker: detect issues in one file."""
+    return path, detect(path, source)
+
+
+def _issue_path(issue: dict, files: dict[str, str]) -> Optional[str]:
+    """File an issue refers to ("location": "path:line" or Sonar's "component": "project:path")."""
+    if issue.get("component"):
+        ref = issue["component"].split(":", 1)[-1]
+    else:
+        ref = (issue.get("location") or "").rsplit(":", 1)[0]
+    if not ref:
+        return None
+    if ref in files:
+        return ref
+    for path in files:
+        if path.endswith("/" + ref) or ref.endswith("/" + path):
+            return path
+    return None
+
+
+def _issue_line(issue: dict) -> Optional[int]:
+    if issue.get("line") is not None:
+        return int(issue["line"])
+    location = issue.get("location") or ""
+    tail = location.rsplit(":", 1)[-1] if ":" in location else ""
+    return int(tail) if tail.isdigit() else None
+
+
+def _issue_ref(issue: dict) -> str:
+    return issue.get("id") or issue.get("key") or f"{issue.get('rule')}@{issue.get('location')}"
+
+
+class PatchEngine:
+    """Runs detection and fixes, in a lazily started process pool for large file sets."""
+
+    def __init__(self, max_workers: int = PATCH_WORKERS):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs an event loop and logging threads is not safe
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def _map(self, func, jobs: list[tuple]) -> list:
+        if len(jobs) < _PARALLEL_FILE_THRESHOLD or self.max_workers <= 1:
+            return [func(*job) for job in jobs]
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        return await asyncio.gather(*(loop.run_in_executor(pool, func, *job) for job in jobs))
+
+    async def analyze(self, files: dict[str, str]) -> list[dict]:
+        """Fixable issues in `files`, with "location" set to "path:line"."""
+        results = await self._map(detect_file, [(path, source) for path, source in files.items()])
+        issues = []
+        for path, found in results:
+            for issue in found:
+                issue["location"] = f"{path}:{issue['line']}"
+                issues.append(issue)
+        return issues
+
+    async def apply(self, files: dict[str, str], issues: list[dict]) -> dict:
+        """
+        Fix `issues` in `files`. Returns the full patched file set, the changed
+        paths with their unified diffs, the fixed issue refs and the unfixed
+        ones as [{"issue", "reason"}].
+        """
+        plan: dict[str, list[tuple[str, Optional[int]]]] = {}
+        owners: dict[tuple[str, str, Optional[int]], list[str]] = {}
+        unfixed = []
+        for issue in issues:
+            rule, path = canonical_rule(issue.get("rule")), _issue_path(issue, files)
+            if rule is None or path is None:
+                reason = f"no automatic fix for rule {issue.get('rule')}" if rule is None else "file not in the task"
+                unfixed.append({"issue": _issue_ref(issue), "reason": reason})
+                continue
+            line = _issue_line(issue)
+            if (rule, line) not in plan.setdefault(path, []):
+                plan[path].append((rule, line))
+            owners.setdefault((path, rule, line), []).append(_issue_ref(issue))
+
+        patched = dict(files)
+        diffs, fixed = {}, []
+        jobs = [(p, files[p], f) for p, f in plan.items()]
+        for path, new_source, applied, skipped, diff in await self._map(patch_file, jobs):
+            done, reasons = set(applied), dict(skipped)
+            for rule, line in plan[path]:
+                refs = owners[(path, rule, line)]
+                if (rule, line) in done:
+                    fixed.extend(refs)
+                else:
+                    unfixed.extend({"issue": ref, "reason": reasons.get((rule, line), "not fixed")} for ref in refs)
+            if diff:
+                patched[path] = new_source
+                diffs[path] = diff
+        return {"files": patched, "changed": sorted(diffs), "diffs": diffs, "fixed": fixed, "unfixed": unfixed}
+
+    def shutdown(self) -> None:
+        """Stop the worker processes (a later call starts a new pool)."""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+PATCH_ENGINE = PatchEngine()
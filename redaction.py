@@ -0,0 +1,62 @@
+# redaction.py
+"""
+Secret redaction for log lines.
+Rules run in order, each on the previous rule's output (same result as
+applying the regexes one after another). Every rule lists literals one of
+which must occur in a line for its regex to possibly match, so the common
+case - a line mentioning no token, key or auth header - costs one lower()
+and a few substring checks instead of a regex pass per rule.
+"""
+import re
+from typing import Iterable, NamedTuple
+
+
+# The only non-ASCII characters that re.IGNORECASE matches against ASCII letters
+# (İ, ı, ſ and the Kelvin sign); lower() does not map them, so lines containing
+# them skip the literal pre-filter.
+_ASCII_FOLDING = re.compile("[\u0130\u0131\u017f\u212a]")
+
+
+class RedactionRule(NamedTuple):
+    pattern: re.Pattern
+    replacement: str
+    literals: tuple[str, ...]  # lowercase; the pattern can only match if one of these occurs
+    requires: tuple[str, ...] = ()  # and, if given, one of these as well
+
+
+class RedactionEngine:
+    """Applies RedactionRules in order, skipping rules whose literals are absent."""
+
+    def __init__(self, rules: Iterable[RedactionRule]):
+        self.rules = tuple(rules)
+
+    def redact(self, text: str) -> str:
+        if not text.isascii() and _ASCII_FOLDING.search(text):
+            for rule in self.rules:
+                text = rule.pattern.sub(rule.replacement, text)
+            return text
+        lowered = text.lower()
+        for rule in self.rules:
+            # Replacements only insert "=<REDACTED>", which cannot create
+            # another rule's literal, so checking the original line is exact
+            if not any(lit in lowered for lit in rule.literals):
+                continue
+            if rule.requires and not any(lit in lowered for lit in rule.requires):
+                continue
+            text = rule.pattern.sub(rule.replacement, text)
+        return text
+
+
+SECRET_RULES = (
+    RedactionRule(
+        re.compile(r'(token|auth|password|secret|key|credential|bearer)[\'\"]?\s*[:=]\s*[\'\"]?([^\s\'"]+)', re.IGNORECASE),
+        r'\1=<REDACTED>',
+        ("token", "auth", "password", "secret", "key", "credential", "bearer"),
+        (":", "="),
+    ),
+    RedactionRule(re.compile(r'(ghp_[a-zA-Z0-9]{36})', re.IGNORECASE), r'\1=<REDACTED>', ("ghp_",)),  # GitHub PAT
+    RedactionRule(re.compile(r'(gho_[a-zA-Z0-9]{36})', re.IGNORECASE), r'\1=<REDACTED>', ("gho_",)),  # GitHub OAuth
+    RedactionRule(re.compile(r'(Bearer\s+[^\s]+)', re.IGNORECASE), r'\1=<REDACTED>', ("bearer",)),
+)
+
+SECRET_ENGINE = RedactionEngine(SECRET_RULES)
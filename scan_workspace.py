@@ -0,0 +1,163 @@
+# scan_workspace.py
+"""
+Persistent per-project scanner workspaces.
+Each project_key gets one directory that survives between scans, so only
+changed files are rewritten, deleted files are removed, and sonar-scanner's
+local caches (.scannerwork) stay warm. Stale workspaces are pruned by age
+and total size.
+"""
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+from mcp_helpers import log
+
+WORKSPACE_ROOT = Path(os.getenv("SONAR_WORKSPACE_ROOT", str(Path(tempfile.gettempdir()) / "mcp_sonar_workspaces")))
+WORKSPACE_MAX_AGE = float(os.getenv("SONAR_WORKSPACE_MAX_AGE", str(7 * 24 * 3600)))  # seconds since last scan
+WORKSPACE_MAX_MB = float(os.getenv("SONAR_WORKSPACE_MAX_MB", "1024"))  # total across all workspaces
+WORKSPACE_WRITE_THREADS = int(os.getenv("SONAR_WORKSPACE_WRITE_THREADS", "8"))
+WORKSPACE_PRUNE_INTERVAL = 600.0  # seconds between prune passes
+
+_PARALLEL_WRITE_THRESHOLD = 32  # files; below this a thread pool costs more than it saves
+_MANIFEST = "manifest.json"
+_SOURCES = "src"
+
+_last_prune = 0.0
+
+
+def workspace_for(project_key: str) -> Path:
+    """Workspace directory for a project (readable name + short hash to avoid collisions)."""
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", project_key)[:64]
+    suffix = hashlib.sha256(project_key.encode()).hexdigest()[:8]
+    return WORKSPACE_ROOT / f"{safe}-{suffix}"
+
+
+def _resolve_inside(root: Path, rel_path: str) -> Path:
+    target = (root / rel_path).resolve()
+    if not target.is_relative_to(root.resolve()):
+        raise ValueError(f"File path escapes the workspace: {rel_path}")
+    return target
+
+
+def _write_file(target: Path, content: str) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(content)
+
+
+def _remove_file(root: Path, target: Path) -> None:
+    try:
+        target.unlink()
+    except FileNotFoundError:
+        return
+    # Drop directories left empty by the deletion
+    parent = target.parent
+    while parent != root and not any(parent.iterdir()):
+        parent.rmdir()
+        parent = parent.parent
+
+
+def materialize(project_key: str, files: dict[str, str], digests: dict[str, str]) -> tuple[Path, dict]:
+    """
+    Sync the project's workspace to `files` and return (source dir, stats).
+    Only files whose digest differs from the last materialization are written.
+    """
+    workspace = workspace_for(project_key)
+    sources = workspace / _SOURCES
+    sources.mkdir(parents=True, exist_ok=True)
+    os.utime(workspace)  # in use from now on: a concurrent prune pass must not take it
+    manifest_path = workspace / _MANIFEST
+    try:
+        manifest = json.loads(manifest_path.read_text())
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    to_write = []
+    for rel_path, digest in digests.items():
+        target = _resolve_inside(sources, rel_path)
+        if manifest.get(rel_path) != digest or not target.exists():
+            to_write.append((target, files[rel_path]))
+    to_delete = [_resolve_inside(sources, p) for p in manifest if p not in digests]
+
+    if len(to_write) >= _PARALLEL_WRITE_THRESHOLD:
+        with ThreadPoolExecutor(max_workers=WORKSPACE_WRITE_THREADS) as pool:
+            list(pool.map(lambda item: _write_file(*item), to_write))
+    else:
+        for target, content in to_write:
+            _write_file(target, content)
+    for target in to_delete:
+        _remove_file(sources, target)
+
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(digests))
+    os.replace(tmp, manifest_path)  # also refreshes the workspace's last-used time
+
+    stats = {"written": len(to_write), "deleted": len(to_delete), "unchanged": len(digests) - len(to_write)}
+    log("Workspace {}: {} written, {} deleted, {} unchanged", workspace, stats["written"], stats["deleted"], stats["unchanged"])
+    return sources, stats
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _last_used(workspace: Path) -> float:
+    """Latest of the last completed sync (manifest) and the last sync started (directory)."""
+    try:
+        started = workspace.stat().st_mtime
+    except FileNotFoundError:
+        return 0.0
+    try:
+        return max(started, (workspace / _MANIFEST).stat().st_mtime)
+    except FileNotFoundError:
+        return started
+
+
+def prune_workspaces(keep: Iterable[Path] = (), force: bool = False) -> list[Path]:
+    """
+    Delete workspaces unused for WORKSPACE_MAX_AGE, then the least recently
+    used ones until the total is under WORKSPACE_MAX_MB. Workspaces in `keep`
+    (those being scanned) and any synced since this pass started are never
+    removed. Runs at most once per WORKSPACE_PRUNE_INTERVAL unless forced.
+    """
+    global _last_prune
+    now = time.time()
+    if not force and now - _last_prune < WORKSPACE_PRUNE_INTERVAL:
+        return []
+    _last_prune = now
+    if not WORKSPACE_ROOT.is_dir():
+        return []
+
+    keep = set(keep)
+    entries = []
+    for workspace in WORKSPACE_ROOT.iterdir():
+        if workspace.is_dir() and workspace not in keep:
+            entries.append((_last_used(workspace), _dir_size(workspace), workspace))
+    entries.sort()  # least recently used first
+    total = sum(size for _, size, _ in entries) + sum(_dir_size(path) for path in keep if path.is_dir())
+    budget = WORKSPACE_MAX_MB * 1024 * 1024
+
+    removed = []
+    for last_used, size, workspace in entries:
+        if now - last_used <= WORKSPACE_MAX_AGE and total <= budget:
+            break
+        if _last_used(workspace) >= now:
+            continue  # a scan started syncing it during this pass
+        shutil.rmtree(workspace, ignore_errors=True)
+        total -= size
+        removed.append(workspace)
+    if removed:
+        log("Pruned {} stale scanner workspace(s)", len(removed))
+    return removed
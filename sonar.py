@@ -4,22 +4,45 @@ import sys
 import time
 import json
 import asyncio
-import tempfile
+import hashlib
 import shutil
 import subprocess
+import weakref
+from contextlib import aclosing, asynccontextmanager
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Optional
 import httpx
 from mcp.server.fastmcp import FastMCP
-from mcp_helpers import instrument, log, cache_get, cache_set
+from mcp_helpers import instrument, coalesce, log, cache_get, cache_set, cache_delete, cache_keys, bump_stat
+from http_pool import get_client, pooled_clients
+from ce_watcher import CeTaskWatcher
+from scan_workspace import materialize, prune_workspaces, workspace_for
+from patch_engine import PATCH_ENGINE
 from dotenv import load_dotenv
 load_dotenv()
 
-mcp = FastMCP("sonar")
+
+@asynccontextmanager
+async def _lifespan(server: FastMCP):
+    """Release shared upstream resources when the MCP server stops."""
+    try:
+        async with pooled_clients():
+            resume_pending_tasks()
+            yield {}
+    finally:
+        await _CE_WATCHER.stop()
+        PATCH_ENGINE.shutdown()
+
+mcp = FastMCP("sonar", lifespan=_lifespan)
 
 SONAR_BASE = os.getenv("SONAR_BASE_URL")  # e.g. https://sonarcloud.io or your SonarQube instance
 SONAR_TOKEN = os.getenv("SONAR_TOKEN")
 SONAR_ORGANIZATION = os.getenv("SONAR_ORGANIZATION", "")  # for SonarCloud
+SONAR_PAGE_CONCURRENCY = int(os.getenv("SONAR_PAGE_CONCURRENCY", "4"))  # parallel issue-page fetches
+SONAR_TASK_TTL = float(os.getenv("SONAR_TASK_TTL", "3600"))  # task records and scan fingerprints outlive MCP_CACHE_TTL
+SONAR_STATUS_MEMO_TTL = float(os.getenv("SONAR_STATUS_MEMO_TTL", "0"))  # seconds; 0 = coalesce only
+SONAR_QUALITY_GATE_MEMO_TTL = float(os.getenv("SONAR_QUALITY_GATE_MEMO_TTL", "0"))  # seconds; 0 = coalesce only
+SONAR_MAX_ISSUES = 10000  # /api/issues/search rejects pages beyond the first 10k results
 if not SONAR_BASE or not SONAR_TOKEN:
     log("SONAR_BASE_URL or SONAR_TOKEN not set. Sonar server will require these to function.")
     SONAR_BASE = SONAR_BASE or "http://localhost:9000"  # dummy default
@@ -27,9 +50,24 @@ if not SONAR_BASE or not SONAR_TOKEN:
 
 AUTH = (SONAR_TOKEN, "")
 
+def _sonar_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for the configured Sonar host."""
+    return get_client(SONAR_BASE, auth=AUTH)
+
+_WORKSPACE_LOCKS: dict[str, asyncio.Lock] = {}
+_REANALYSES: dict[str, asyncio.Task] = {}  # pending (simulated) reanalysis per patched task
+_PATCH_LOCKS: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+# One background watcher polls every pending CE task in bulk
+_CE_WATCHER = CeTaskWatcher(SONAR_BASE, _sonar_client)
+
 # Real scanner integration helpers
-async def _run_sonar_scanner(project_key: str, project_dir: Path) -> Optional[str]:
-    """Run sonar-scanner CLI and return the compute engine task ID."""
+async def _run_sonar_scanner(project_key: str, project_dir: Path,
+                             inclusions: Optional[list[str]] = None) -> Optional[str]:
+    """
+    Run sonar-scanner CLI and return the compute engine task ID.
+    `inclusions` limits the analysis to those paths (sonar.inclusions).
+    """
     scanner_cmd = ["sonar-scanner"]
     
     # Check if scanner is available
@@ -46,6 +84,8 @@ async def _run_sonar_scanner(project_key: str, project_dir: Path) -> Optional[st
     
     if SONAR_ORGANIZATION:
         scanner_args.append(f"-Dsonar.organization={SONAR_ORGANIZATION}")
+    if inclusions:
+        scanner_args.append(f"-Dsonar.inclusions={','.join(inclusions)}")
     
     try:
         proc = await asyncio.create_subprocess_exec(
@@ -77,117 +117,263 @@ async def _run_sonar_scanner(project_key: str, project_dir: Path) -> Optional[st
         log("Error running sonar-scanner: {}", repr(e))
         return None
 
-async def _poll_ce_task(task_id: str, max_attempts: int = 60) -> dict:
-    """Poll SonarQube compute engine task status until complete."""
-    async with httpx.AsyncClient(auth=AUTH, timeout=20.0) as client:
-        for attempt in range(max_attempts):
-            try:
-                r = await client.get(f"{SONAR_BASE}/api/ce/task", params={"id": task_id})
-                if r.status_code == 200:
-                    data = r.json()
-                    task_status = data.get("task", {}).get("status")
-                    
-                    if task_status in ("SUCCESS", "FAILED", "CANCELED"):
-                        return data
-                    
-                    log("CE task {} status: {}", task_id, task_status)
-                    await asyncio.sleep(2)
-                else:
-                    log("CE task poll failed: HTTP {}", r.status_code)
-                    await asyncio.sleep(2)
-            except Exception as e:
-                log("Error polling CE task: {}", repr(e))
-                await asyncio.sleep(2)
-    
-    return {"task": {"status": "TIMEOUT"}}
+async def _poll_ce_task(task_id: str, timeout: Optional[float] = 120.0) -> dict:
+    """Wait for a compute engine task to complete via the shared batched watcher."""
+    return await _CE_WATCHER.wait(task_id, timeout)
 
-async def _fetch_issues(project_key: str, chunk_size: int = 100) -> list[dict]:
-    """Fetch issues from SonarQube with pagination/chunking."""
-    all_issues = []
-    page = 1
-    
-    async with httpx.AsyncClient(auth=AUTH, timeout=30.0) as client:
-        while True:
-            try:
-                r = await client.get(
-                    f"{SONAR_BASE}/api/issues/search",
-                    params={
-                        "componentKeys": project_key,
-                        "ps": chunk_size,
-                        "p": page,
-                        "resolved": "false"
-                    }
-                )
-                
-                if r.status_code != 200:
-                    log("Failed to fetch issues: HTTP {}", r.status_code)
-                    break
-                
-                data = r.json()
-                issues = data.get("issues", [])
-                all_issues.extend(issues)
-                
-                total = data.get("total", 0)
-                if len(all_issues) >= total:
-                    break
-                
-                page += 1
-                await asyncio.sleep(0.1)  # Rate limiting
-                
-            except Exception as e:
-                log("Error fetching issues: {}", repr(e))
-                break
+async def wait_for_task(task_id: str, timeout: Optional[float] = 120.0) -> dict:
+    """
+    Wait until a real or simulated scan task finishes, without polling `status`.
+    Returns the final task payload ({"task": {"status": ...}}); status is TIMEOUT on timeout.
+    """
+    rec = cache_get(f"sonar_task:{task_id}") or {}
+    return await _CE_WATCHER.wait(task_id, timeout, remote=bool(rec.get("real")))
+
+def resume_pending_tasks() -> list[str]:
+    """
+    Re-register unfinished real tasks found in the cache with the CE watcher.
+    With a shared cache backend this lets a restarted server pick up scans
+    submitted before the restart (or by another process) without rescanning.
+    """
+    resumed = []
+    for key in cache_keys("sonar_task:"):
+        rec = cache_get(key)
+        if rec and rec.get("real") and rec.get("status") in ("PENDING", "IN_PROGRESS"):
+            task_id = key.split(":", 1)[1]
+            _CE_WATCHER.watch(task_id)
+            resumed.append(task_id)
+    if resumed:
+        log("Resumed tracking {} pending Sonar task(s)", len(resumed))
+    return resumed
+
+async def _fetch_issue_page(client: httpx.AsyncClient, project_key: str, page: int, chunk_size: int) -> Optional[dict]:
+    """Fetch one page of /api/issues/search; returns None if the page failed."""
+    try:
+        r = await client.get(
+            f"{SONAR_BASE}/api/issues/search",
+            params={
+                "componentKeys": project_key,
+                "ps": chunk_size,
+                "p": page,
+                "resolved": "false"
+            },
+            timeout=30.0
+        )
+        if r.status_code != 200:
+            log("Failed to fetch issues page {}: HTTP {}", page, r.status_code)
+            return None
+        return r.json()
+    except Exception as e:
+        log("Error fetching issues page {}: {}", page, repr(e))
+        return None
+
+def _spawn_remaining_pages(client: httpx.AsyncClient, project_key: str, first: dict,
+                           chunk_size: int, max_concurrency: int) -> list[asyncio.Task]:
+    """
+    Start tasks for pages 2..N (from the first page's total), at most max_concurrency
+    in flight. Each task returns (page number, page data or None).
+    """
+    total = first.get("paging", {}).get("total", first.get("total", 0))
+    if total > SONAR_MAX_ISSUES:
+        log("Project {} has {} issues; the search API only returns the first {}", project_key, total, SONAR_MAX_ISSUES)
+        total = SONAR_MAX_ISSUES
+    last_page = -(-total // chunk_size)
+    sem = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def fetch(page: int) -> tuple[int, Optional[dict]]:
+        async with sem:
+            return page, await _fetch_issue_page(client, project_key, page, chunk_size)
+
+    return [asyncio.create_task(fetch(page)) for page in range(2, last_page + 1)]
+
+async def _iter_issue_pages(project_key: str, chunk_size: int = 100,
+                            max_concurrency: int = SONAR_PAGE_CONCURRENCY) -> AsyncIterator[tuple[int, list[dict]]]:
+    """
+    Yield (page number, issues) for each page of /api/issues/search as it arrives.
+    The first page gives the total; remaining pages are fetched concurrently and
+    complete in any order. Failed pages are skipped.
+    """
+    client = _sonar_client()
+    first = await _fetch_issue_page(client, project_key, 1, chunk_size)
+    if first is None:
+        return
     
-    return all_issues
+    tasks = _spawn_remaining_pages(client, project_key, first, chunk_size, max_concurrency)
+    try:
+        yield 1, first.get("issues", [])
+        for next_page in asyncio.as_completed(tasks):
+            page, data = await next_page
+            if data is not None:
+                yield page, data.get("issues", [])
+    finally:
+        # Caller stopped early: don't leave page fetches running
+        for task in tasks:
+            task.cancel()
+
+async def _iter_issues(project_key: str, chunk_size: int = 100,
+                       max_concurrency: int = SONAR_PAGE_CONCURRENCY) -> AsyncIterator[dict]:
+    """
+    Streaming variant of _fetch_issues: yields issues as each page arrives, so
+    callers can start work early. Use it under contextlib.aclosing() so that
+    stopping early cancels the outstanding page fetches right away.
+    """
+    async with aclosing(_iter_issue_pages(project_key, chunk_size, max_concurrency)) as pages:
+        async for _, issues in pages:
+            for issue in issues:
+                yield issue
+
+async def _fetch_issues(project_key: str, chunk_size: int = 100,
+                        max_concurrency: int = SONAR_PAGE_CONCURRENCY) -> list[dict]:
+    """
+    Fetch issues from SonarQube with pagination/chunking, in page order
+    (pages are fetched concurrently, see _iter_issue_pages).
+    """
+    pages = {}
+    async for page, issues in _iter_issue_pages(project_key, chunk_size, max_concurrency):
+        pages[page] = issues
+    return [issue for page in sorted(pages) for issue in pages[page]]
+
+def _file_digests(files: dict[str, str]) -> dict[str, str]:
+    """SHA-256 of each file's content, keyed by path."""
+    return {path: hashlib.sha256(content.encode()).hexdigest() for path, content in files.items()}
+
+def _fileset_digest(digests: dict[str, str]) -> str:
+    """Order-independent digest of a whole file set (paths + contents)."""
+    h = hashlib.sha256()
+    for path in sorted(digests):
+        h.update(path.encode())
+        h.update(b"\0")
+        h.update(digests[path].encode())
+        h.update(b"\n")
+    return h.hexdigest()
+
+def _diff_digests(previous: Optional[dict[str, str]], current: dict[str, str]) -> dict[str, list[str]]:
+    """Paths changed since the previous submission of the project."""
+    previous = previous or {}
+    return {
+        "changed": sorted(p for p, d in current.items() if previous.get(p) != d),
+        "removed": sorted(p for p in previous if p not in current),
+    }
+
+def _cached_scan(project_key: str, fileset: str) -> Optional[dict]:
+    """Result for an identical earlier submission that is finished or still running."""
+    task_id = cache_get(f"scan_fileset:{project_key}:{fileset}")
+    rec = cache_get(f"sonar_task:{task_id}") if task_id else None
+    if not rec or rec.get("status") in ("FAILED", "CANCELED", "TIMEOUT"):
+        return None
+    out = {
+        "taskId": task_id,
+        "status": rec.get("status"),
+        "mode": "real" if rec.get("real") else "simulated",
+        "cached": True,
+        "fileset": fileset,
+        "changed_files": [],
+        "removed_files": [],
+    }
+    if "issues" in rec:
+        out["issues"] = rec["issues"]
+    return out
 
 @instrument("sonar.scan")
 @mcp.tool()
 async def scan(project_key: str, files: dict[str, str]) -> dict:
     """
     Submit files for real SonarQube analysis using sonar-scanner.
-    Creates temp directory, writes files, runs scanner, returns task ID.
+    Syncs the project's persistent workspace (changed files only), runs scanner, returns task ID.
     Falls back to simulation if scanner not available.
+    Byte-identical resubmissions return the earlier task (and its issues) without rescanning;
+    otherwise `changed_files`/`removed_files` list what differs from the project's last submission.
     """
-    # Try real scanner first
-    temp_dir = Path(tempfile.mkdtemp(prefix=f"sonar_{project_key}_"))
+    digests = _file_digests(files)
+    fileset = _fileset_digest(digests)
+    cached = _cached_scan(project_key, fileset)
+    if cached:
+        bump_stat("sonar.scan", "cache_hits")
+        log("Scan cache hit for project {}: reusing task {}", project_key, cached["taskId"])
+        return cached
+    bump_stat("sonar.scan", "cache_misses")
     
-    try:
-        # Write files to temp directory
-        for file_path, content in files.items():
-            full_path = temp_dir / file_path
-            full_path.parent.mkdir(parents=True, exist_ok=True)
-            full_path.write_text(content)
-        
-        log("Created temp project at {} with {} files", temp_dir, len(files))
-        
-        # Run scanner
-        task_id = await _run_sonar_scanner(project_key, temp_dir)
-        
-        if task_id:
-            # Real scanner succeeded
-            cache_set(f"sonar_task:{task_id}", {
-                "project": project_key,
-                "status": "PENDING",
-                "real": True,
-                "temp_dir": str(temp_dir)
-            })
-            return {"taskId": task_id, "status": "PENDING", "mode": "real"}
-        
-    except Exception as e:
-        log("Real scanner error: {}", repr(e))
+    changes = _diff_digests(cache_get(f"scan_manifest:{project_key}"), digests)
+    incremental = {
+        "fileset": fileset,
+        "changed_files": changes["changed"],
+        "removed_files": changes["removed"],
+    }
+    if len(changes["changed"]) < len(files):
+        log("Scan for project {}: {} of {} files changed", project_key, len(changes["changed"]), len(files))
+    
+    # Try real scanner first
+    if shutil.which("sonar-scanner"):
+        try:
+            async with _workspace_lock(project_key):
+                # Sync the persistent workspace off the event loop, then scan it
+                project_dir, written = await asyncio.to_thread(materialize, project_key, files, digests)
+                # Other projects' scans hold their own locks; their workspaces are in use too
+                busy = [workspace_for(key) for key, lock in _WORKSPACE_LOCKS.items() if lock.locked()]
+                await asyncio.to_thread(prune_workspaces, busy)
+                
+                # Run scanner
+                task_id = await _run_sonar_scanner(project_key, project_dir)
+            
+            if task_id:
+                # Real scanner succeeded
+                cache_set(f"sonar_task:{task_id}", {
+                    "project": project_key,
+                    "files": files,
+                    "status": "PENDING",
+                    "real": True,
+                    "workspace": str(project_dir),
+                    **incremental
+                }, ttl=SONAR_TASK_TTL)
+                _remember_fileset(project_key, fileset, digests, task_id)
+                _CE_WATCHER.watch(task_id)
+                return {"taskId": task_id, "status": "PENDING", "mode": "real", "workspace": written, **incremental}
+            
+        except Exception as e:
+            log("Real scanner error: {}", repr(e))
+    else:
+        log("sonar-scanner not found in PATH. Falling back to simulation mode.")
     
     # Fallback to simulation
     log("Using simulation mode for project {}", project_key)
-    task_id = f"sim-task-{int(time.time()*1000)}"
+    task_id = _sim_task_id()
     cache_set(f"sonar_task:{task_id}", {
         "project": project_key,
         "files": files,
         "status": "PENDING",
-        "real": False
-    })
+        "real": False,
+        **incremental
+    }, ttl=SONAR_TASK_TTL)
+    _remember_fileset(project_key, fileset, digests, task_id)
     asyncio.create_task(_simulate_analysis(task_id))
     
-    return {"taskId": task_id, "status": "PENDING", "mode": "simulated"}
+    return {"taskId": task_id, "status": "PENDING", "mode": "simulated", **incremental}
+
+def _sim_task_id() -> str:
+    """A simulated task id not in use yet (several scans can start within one millisecond)."""
+    stamp = int(time.time() * 1000)
+    while cache_get(f"sonar_task:sim-task-{stamp}"):
+        stamp += 1
+    return f"sim-task-{stamp}"
+
+def _workspace_lock(project_key: str) -> asyncio.Lock:
+    """One scanner run per workspace at a time."""
+    return _WORKSPACE_LOCKS.setdefault(project_key, asyncio.Lock())
+
+def _remember_fileset(project_key: str, fileset: str, digests: dict[str, str], task_id: str) -> None:
+    cache_set(f"scan_fileset:{project_key}:{fileset}", task_id, ttl=SONAR_TASK_TTL)
+    cache_set(f"scan_manifest:{project_key}", digests, ttl=SONAR_TASK_TTL)
+
+def _update_task(task_id: str, **fields) -> dict:
+    """
+    Set `fields` on a task record and store it. The record is re-read here, with no
+    await before the write: a copy read before an await may be stale by now (other
+    coroutines update the same task, and the SQLite cache hands out copies).
+    """
+    rec = cache_get(f"sonar_task:{task_id}") or {}
+    rec.update(fields)
+    cache_set(f"sonar_task:{task_id}", rec, ttl=SONAR_TASK_TTL)
+    return rec
 
 async def _simulate_analysis(task_id: str):
     """Simulate analysis with staged SSE-like updates (for demo)."""
@@ -200,17 +386,29 @@ async def _simulate_analysis(task_id: str):
     ]
     for status, delay in steps:
         await asyncio.sleep(delay)
-        rec = cache_get(f"sonar_task:{task_id}") or {}
-        rec["status"] = status
-        # create a small faux issues list on ANALYZING->COMPUTING
+        # on ANALYZING->COMPUTING, report what the patch engine's rules find in the files
         if status == "COMPUTING":
-            rec["issues"] = [
-                {"id": "ISSUE-1", "rule": "no-dead-code", "message": "Unused function", "location": "src/App.tsx:12", "suggested_patch": "remove_unused_function"},
-                {"id": "ISSUE-2", "rule": "no-console", "message": "console.log found", "location": "src/utils.ts:8", "suggested_patch": "replace_with_logger"}
-            ]
-        cache_set(f"sonar_task:{task_id}", rec)
+            files = (cache_get(f"sonar_task:{task_id}") or {}).get("files", {})
+            found = await PATCH_ENGINE.analyze(files)
+            rec = cache_get(f"sonar_task:{task_id}") or {}
+            rec.update(status=status, issues=_number_issues(rec, found))
+            cache_set(f"sonar_task:{task_id}", rec, ttl=SONAR_TASK_TTL)
+        else:
+            _update_task(task_id, status=status)
+    _CE_WATCHER.resolve(task_id, {"task": {"id": task_id, "status": "FINISHED"}})
+
+def _number_issues(rec: dict, issues: list[dict]) -> list[dict]:
+    """Give simulated issues task-unique ids; the rule doubles as the suggested patch."""
+    seq = rec.get("issue_seq", 0)
+    for issue in issues:
+        seq += 1
+        issue["id"] = f"ISSUE-{seq}"
+        issue["suggested_patch"] = issue["rule"]
+    rec["issue_seq"] = seq
+    return issues
 
 @instrument("sonar.status")
+@coalesce("sonar.status", ttl=SONAR_STATUS_MEMO_TTL)
 @mcp.tool()
 async def status(task_id: str) -> dict:
     """Poll task status - supports both real and simulated tasks."""
@@ -220,21 +418,32 @@ async def status(task_id: str) -> dict:
     
     # Handle real SonarQube tasks
     if rec.get("real"):
-        ce_result = await _poll_ce_task(task_id, max_attempts=1)
-        task_status = ce_result.get("task", {}).get("status", "UNKNOWN")
-        
-        # Update cache
-        rec["status"] = task_status
-        cache_set(f"sonar_task:{task_id}", rec)
+        # The watcher polls in the background; answer from its last known state
+        watched = _CE_WATCHER.watch(task_id)
+        if watched.done():
+            task_status = watched.result().get("task", {}).get("status", "UNKNOWN")
+        else:
+            task_status = _CE_WATCHER.status(task_id) or rec.get("status", "PENDING")
         
         out = {"taskId": task_id, "status": task_status, "mode": "real"}
+        if task_status == rec.get("status") and "issues" in rec:
+            out["issues"] = rec["issues"]
+            out["issueCount"] = len(rec["issues"])
+            return out
+        
+        # Update cache
+        _update_task(task_id, status=task_status)
         
         # If finished, fetch issues
         if task_status == "SUCCESS":
             project_key = rec.get("project")
             issues = await _fetch_issues(project_key)
+            rec = cache_get(f"sonar_task:{task_id}") or {}
+            if "carried_issues" in rec:
+                # A rescan of the patched files only: the other files' issues carry over
+                issues = _carry_over(rec.pop("carried_issues"), rec.get("changed_files", [])) + issues
             rec["issues"] = issues
-            cache_set(f"sonar_task:{task_id}", rec)
+            cache_set(f"sonar_task:{task_id}", rec, ttl=SONAR_TASK_TTL)
             out["issues"] = issues
             out["issueCount"] = len(issues)
         
@@ -250,45 +459,178 @@ async def status(task_id: str) -> dict:
 @mcp.tool()
 async def apply_patch(task_id: str, patch_id: str) -> dict:
     """
-    Apply a suggested patch from the issues to the file set stored in the task.
-    Real world: you'd apply patch and resubmit analysis; here we mutate cached files then mark a 'reanalysis' run.
+    Apply a suggested patch from the issues to the file set stored in the task and reanalyze.
+    To apply several patches, use apply_patches (one reanalysis for all of them).
+    """
+    return await _apply_patch_ids(task_id, [patch_id])
+
+@instrument("sonar.apply_patches")
+@mcp.tool()
+async def apply_patches(task_id: str, patch_ids: list[str]) -> dict:
+    """
+    Fix the issues matching `patch_ids` (suggested patch, issue id/key or rule) in the task's
+    files with the patch engine, then start a single reanalysis of the files that changed.
+    Patches accumulate per task: `changed_files`, `diffs`, `patched_files`, `fixed` and
+    `unfixed` always cover every id applied to the task so far (`applied`), relative to the
+    files it analyzed, so a caller sharing the task with an earlier one gets the same patched
+    files even when `newly_applied` is empty. The task itself keeps its files and issues; the
+    reanalysis is a task of its own. Instead of sleeping, await
+    wait_for_task(reanalysis["taskId"]); `reanalysis` is None when no file changed (or the
+    real scanner could not be started). In real mode only the changed files are rescanned.
+    Only statements that have their lines to themselves are removed: e.g. a console
+    call inside `return`, after `&&` or as the body of a brace-less `if` is left
+    alone. Such issues are listed in `unfixed` as {"issue", "reason"}.
     """
+    return await _apply_patch_ids(task_id, patch_ids)
+
+async def _apply_patch_ids(task_id: str, patch_ids: list[str]) -> dict:
+    # One patch batch per task at a time, so concurrent callers see each other's patches
+    lock = _PATCH_LOCKS.get(task_id)
+    if lock is None:
+        lock = _PATCH_LOCKS[task_id] = asyncio.Lock()
+    async with lock:
+        return await _patch_task(task_id, patch_ids)
+
+async def _patch_task(task_id: str, patch_ids: list[str]) -> dict:
     rec = cache_get(f"sonar_task:{task_id}")
     if not rec:
         return {"error": "task not found"}
-    # naive patch application: record that patch was applied for demo
-    applied = rec.setdefault("applied_patches", [])
-    applied.append(patch_id)
-    rec["status"] = "REANALYZING"
-    cache_set(f"sonar_task:{task_id}", rec)
-    # re-simulate a short reanalysis
-    asyncio.create_task(_simulate_reanalysis(task_id))
-    return {"taskId": task_id, "applied": applied}
-
-async def _simulate_reanalysis(task_id: str):
+    applied = rec.get("applied_patches", [])
+    new = [patch_id for patch_id in dict.fromkeys(patch_ids) if patch_id not in applied]
+    patch = rec.get("patch") or {"fixed": [], "unfixed": [], "changed": [], "diffs": {}, "files": {}}
+    reanalysis = rec.get("reanalysis")
+    if new:
+        # Re-patch the analyzed files with every id so far: issue lines refer to those files
+        applied = applied + new
+        wanted = set(applied)
+        issues = [issue for issue in rec.get("issues", [])
+                  if wanted & {issue.get("suggested_patch"), issue.get("id"), issue.get("key"), issue.get("rule")}]
+        result = await PATCH_ENGINE.apply(rec.get("files", {}), issues)
+        changed = result["changed"]
+        log("Patch engine: {} issue(s) fixed, {} not fixable, {} file(s) changed",
+            len(result["fixed"]), len(result["unfixed"]), len(changed))
+        previous = patch["files"]
+        patch = {"fixed": result["fixed"], "unfixed": result["unfixed"], "changed": changed,
+                 "diffs": result["diffs"], "files": {path: result["files"][path] for path in changed}}
+        if patch["files"] != previous:
+            reanalysis = await _reanalyze(task_id, rec, result["files"], changed)
+        _update_task(task_id, applied_patches=applied, patch=patch, reanalysis=reanalysis)
+    if reanalysis:
+        current = cache_get(f"sonar_task:{reanalysis['taskId']}") or {}
+        reanalysis = {"taskId": reanalysis["taskId"], "status": current.get("status", reanalysis["status"])}
+    return {"taskId": task_id, "applied": applied, "newly_applied": new, "fixed": patch["fixed"],
+            "unfixed": patch["unfixed"], "changed_files": patch["changed"], "diffs": patch["diffs"],
+            "patched_files": patch["files"], "reanalysis": reanalysis}
+
+async def _reanalyze(task_id: str, rec: dict, files: dict[str, str], changed: list[str]) -> dict:
+    """Start the reanalysis of a task's patched files; it replaces one that is still running."""
+    bump_stat("sonar.apply_patches", "reanalyses")
+    project = rec.get("project", "")
+    if rec.get("real"):
+        return await _rescan(task_id, rec, files, changed)
+
+    pending = _REANALYSES.pop(task_id, None)
+    previous = (rec.get("reanalysis") or {}).get("taskId")
+    if pending and not pending.done() and previous:
+        # Reuse the unfinished reanalysis id, so its waiters get the newer batch's result
+        pending.cancel()
+        reanalysis_id = previous
+        old = cache_get(f"sonar_task:{reanalysis_id}") or {}
+        if cache_get(f"scan_fileset:{project}:{old.get('fileset')}") == reanalysis_id:
+            cache_delete(f"scan_fileset:{project}:{old.get('fileset')}")
+    else:
+        reanalysis_id = _sim_task_id()
+    digests = _file_digests(files)
+    fileset = _fileset_digest(digests)
+    cache_set(f"sonar_task:{reanalysis_id}", {
+        "project": project,
+        "files": files,
+        "status": "REANALYZING",
+        "real": False,
+        "fileset": fileset,
+        "changed_files": changed,
+        "removed_files": [],
+        "reanalysis_of": task_id,
+        "carried_issues": rec.get("issues", []),
+        "issue_seq": rec.get("issue_seq", 0),
+    }, ttl=SONAR_TASK_TTL)
+    _remember_fileset(project, fileset, digests, reanalysis_id)
+    reanalysis = asyncio.create_task(_simulate_reanalysis(reanalysis_id, changed))
+    _REANALYSES[task_id] = reanalysis
+    reanalysis.add_done_callback(lambda t: _REANALYSES.pop(task_id, None) if _REANALYSES.get(task_id) is t else None)
+    return {"taskId": reanalysis_id, "status": "REANALYZING"}
+
+async def _rescan(task_id: str, rec: dict, files: dict[str, str], changed: list[str]) -> Optional[dict]:
+    """
+    Run sonar-scanner on the patched files, analyzing only the changed paths. The
+    persistent workspace only rewrites those files; issues in the other files carry
+    over from the patched task once the rescan succeeds (see status).
+    """
+    project = rec["project"]
+    digests = _file_digests(files)
+    fileset = _fileset_digest(digests)
+    try:
+        async with _workspace_lock(project):
+            project_dir, _ = await asyncio.to_thread(materialize, project, files, digests)
+            rescan_id = await _run_sonar_scanner(project, project_dir, inclusions=changed)
+    except Exception as e:
+        log("Real scanner error: {}", repr(e))
+        rescan_id = None
+    if not rescan_id:
+        log("Rescan of task {} failed; patched files were not reanalyzed", task_id)
+        return None
+    cache_set(f"sonar_task:{rescan_id}", {
+        "project": project,
+        "files": files,
+        "status": "PENDING",
+        "real": True,
+        "workspace": str(project_dir),
+        "fileset": fileset,
+        "changed_files": changed,
+        "removed_files": [],
+        "reanalysis_of": task_id,
+        "carried_issues": rec.get("issues", []),
+    }, ttl=SONAR_TASK_TTL)
+    _remember_fileset(project, fileset, digests, rescan_id)
+    _CE_WATCHER.watch(rescan_id)
+    return {"taskId": rescan_id, "status": "PENDING"}
+
+def _carry_over(issues: list[dict], changed: list[str]) -> list[dict]:
+    """The issues outside the `changed` paths (which a reanalysis reports afresh)."""
+    changed_set = set(changed)
+    return [issue for issue in issues if _issue_file(issue) not in changed_set]
+
+def _issue_file(issue: dict) -> str:
+    """Path of an issue's file: Sonar's component is "project:path", simulated issues have "path:line"."""
+    if issue.get("component"):
+        return issue["component"].split(":", 1)[-1]
+    return (issue.get("location") or "").rsplit(":", 1)[0]
+
+async def _simulate_reanalysis(task_id: str, changed: list[str]):
+    """Re-analyze only the changed files; issues in the other files carry over from the patched task."""
     await asyncio.sleep(1.0)
+    files = (cache_get(f"sonar_task:{task_id}") or {}).get("files", {})
+    fresh = await PATCH_ENGINE.analyze({path: files[path] for path in changed if path in files})
     rec = cache_get(f"sonar_task:{task_id}") or {}
-    # on reanalysis we'll remove one issue to simulate fix
-    issues = rec.get("issues", [])
-    if issues:
-        issues = issues[:-1]
-        rec["issues"] = issues
-    rec["status"] = "FINISHED"
-    cache_set(f"sonar_task:{task_id}", rec)
+    kept = _carry_over(rec.pop("carried_issues", []), changed)
+    rec.update(issues=kept + _number_issues(rec, fresh), status="FINISHED")
+    cache_set(f"sonar_task:{task_id}", rec, ttl=SONAR_TASK_TTL)
+    _CE_WATCHER.resolve(task_id, {"task": {"id": task_id, "status": "FINISHED"}})
 
 @instrument("sonar.quality_gate")
+@coalesce("sonar.quality_gate", ttl=SONAR_QUALITY_GATE_MEMO_TTL)
 @mcp.tool()
 async def quality_gate(project_key: str) -> dict:
     """
     Check quality gate status for the project using the real SonarQube API.
     Fails loudly if the API is unreachable or returns an error.
     """
-    async with httpx.AsyncClient(auth=AUTH, timeout=20.0) as client:
-        r = await client.get(f"{SONAR_BASE}/api/qualitygates/project_status", params={"projectKey": project_key})
-        if r.status_code == 200:
-            return {"qualityGate": r.json()}
-        else:
-            raise RuntimeError(f"SonarQube quality gate API error: HTTP {r.status_code} - {r.text}")
+    client = _sonar_client()
+    r = await client.get(f"{SONAR_BASE}/api/qualitygates/project_status", params={"projectKey": project_key}, timeout=20.0)
+    if r.status_code == 200:
+        return {"qualityGate": r.json()}
+    else:
+        raise RuntimeError(f"SonarQube quality gate API error: HTTP {r.status_code} - {r.text}")
 
 if __name__ == "__main__":
     print("Starting MCP server...")
@@ -3,14 +3,234 @@
 SSE (Server-Sent Events) tracker for monitoring streaming events from SonarQube compute engine.
 Captures timing and correlates events with tool executions.
 """
+import os
+import re
+import json
 import time
 import asyncio
+import bisect
+import itertools
+import threading
+from collections import deque
 from typing import AsyncIterator, Optional
 import httpx
 from mcp_helpers import log, CORRELATION_CHAIN
 
+SSE_RETRY_MS = int(os.getenv("MCP_SSE_RETRY_MS", "3000"))  # reconnect delay until the server sends `retry:`
+SSE_MAX_RECONNECTS = int(os.getenv("MCP_SSE_MAX_RECONNECTS", "5"))
+
+
+class SSEEventStore:
+    """
+    Bounded SSE event log with a per-stream index.
+    Events go into one ring buffer (newest `capacity` overall) and into a
+    per-stream deque (newest `stream_capacity` per correlation_id). Counters are
+    maintained on append, so stats and per-stream reads never scan the log.
+    A stream is forgotten once all of its events have been evicted.
+    """
+
+    def __init__(self, capacity: int = 5000, stream_capacity: int = 500):
+        self.capacity = capacity
+        self.stream_capacity = stream_capacity
+        self._events: deque[dict] = deque()
+        self._streams: dict[str, deque[dict]] = {}
+        self._counts: dict[str, int] = {}  # events ever appended per retained stream
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self.total = 0
+        self.evicted = 0
+
+    def append(self, event: dict) -> dict:
+        """Store an event (must carry a correlation_id); stamps it with a monotonic `seq`."""
+        cid = event["correlation_id"]
+        event.setdefault("timestamp", time.time())
+        with self._lock:
+            event["seq"] = next(self._seq)
+            self.total += 1
+            self._events.append(event)
+            stream = self._streams.get(cid)
+            if stream is None:
+                stream = self._streams[cid] = deque(maxlen=self.stream_capacity)
+                self._counts[cid] = 0
+            stream.append(event)
+            self._counts[cid] += 1
+            while len(self._events) > self.capacity:
+                self._evict(self._events.popleft())
+        return event
+
+    def _evict(self, event: dict) -> None:
+        self.evicted += 1
+        cid = event["correlation_id"]
+        stream = self._streams[cid]
+        # Streams are in append order, so the evicted event is their oldest (unless maxlen already dropped it)
+        if stream and stream[0] is event:
+            stream.popleft()
+        if not stream:
+            del self._streams[cid]
+            del self._counts[cid]
+
+    def recent(self, limit: int = 20) -> list[dict]:
+        """Newest `limit` events across all streams, oldest first."""
+        with self._lock:
+            start = max(len(self._events) - limit, 0)
+            return list(itertools.islice(self._events, start, None))
+
+    def since(self, cursor: int, limit: Optional[int] = None) -> tuple[list[dict], int]:
+        """Retained events with seq > `cursor`, oldest first, plus the new cursor."""
+        with self._lock:
+            newer = []
+            for event in reversed(self._events):
+                if event["seq"] <= cursor:
+                    break
+                newer.append(event)
+            newer.reverse()
+            if limit is not None:
+                newer = newer[-limit:]
+            last = max(cursor, self._events[-1]["seq"]) if self._events else cursor
+            return newer, last
+
+    def query(self, stream: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, cursor: Optional[int] = None,
+              limit: int = 20) -> tuple[list[dict], Optional[int]]:
+        """
+        The newest `limit` events matching the filters (oldest first), plus the cursor
+        for the next, older page (None on the last one). `cursor` is an event seq;
+        since/until bound the event timestamp. Events are appended in time order,
+        so the ranges are found by bisecting the ring (or the stream's deque).
+        """
+        with self._lock:
+            events = self._streams.get(stream, ()) if stream is not None else self._events
+            start = bisect.bisect_left(events, since, key=lambda e: e["timestamp"]) if since is not None else 0
+            stop = bisect.bisect_right(events, until, key=lambda e: e["timestamp"]) if until is not None else len(events)
+            if cursor is not None:
+                stop = min(stop, bisect.bisect_left(events, cursor, key=lambda e: e["seq"]))
+            first = max(start, stop - limit)
+            page = list(itertools.islice(events, first, stop)) if stop > first else []
+            return page, (page[0]["seq"] if first > start else None)
+
+    def stream(self, correlation_id: str) -> list[dict]:
+        """Retained events of one stream, oldest first."""
+        with self._lock:
+            return list(self._streams.get(correlation_id, ()))
+
+    def streams(self) -> list[str]:
+        with self._lock:
+            return list(self._streams)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total_events": self.total,
+                "streams": len(self._streams),
+                "events_by_stream": dict(self._counts),
+                "retained_events": len(self._events),
+                "evicted_events": self.evicted,
+                "capacity": self.capacity,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._streams.clear()
+            self._counts.clear()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __iter__(self):
+        return iter(self.recent(len(self._events)))
+
+
 # SSE event storage
-SSE_EVENTS: list[dict] = []
+SSE_EVENTS = SSEEventStore(
+    capacity=int(os.getenv("MCP_SSE_EVENT_CAPACITY", "5000")),
+    stream_capacity=int(os.getenv("MCP_SSE_STREAM_CAPACITY", "500")),
+)
+
+
+class SSEParser:
+    """
+    Incremental text/event-stream parser working on raw bytes.
+    Follows the HTML "event stream interpretation" rules: CRLF, CR and LF line
+    endings (also split across chunks), comments, multi-line data, event/id/retry
+    fields and a leading BOM. Only the trailing partial line is buffered (as
+    bytes) between chunks, so cost stays linear in the stream size.
+    """
+
+    _EOL = re.compile(r"\r\n|\r|\n")
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._scan = 0  # bytes of _buf already known to contain no line ending
+        self._skip_lf = False  # last chunk ended in CR; a leading LF belongs to it
+        self._first_line = True
+        self._data: list[str] = []
+        self._event = ""
+        self.last_event_id = ""
+        self.retry_ms: Optional[int] = None
+
+    def feed(self, chunk: bytes) -> list[dict]:
+        """Consume a chunk and return the events completed by it."""
+        if self._skip_lf and chunk[:1] == b"\n":
+            chunk = chunk[1:]
+        self._skip_lf = False
+        buf = self._buf
+        buf += chunk
+        end = max(buf.rfind(b"\n", self._scan), buf.rfind(b"\r", self._scan)) + 1
+        if not end:
+            self._scan = len(buf)
+            return []
+        if buf[end - 1] == 0x0D and end == len(buf):
+            self._skip_lf = True
+        # Line endings never occur inside a UTF-8 sequence, so complete lines decode on their own
+        text = buf[:end].decode("utf-8", errors="replace")
+        del buf[:end]
+        self._scan = len(buf)
+        lines = self._EOL.split(text)
+        lines.pop()  # empty remainder after the final line ending
+        if self._first_line:
+            self._first_line = False
+            lines[0] = lines[0].removeprefix("\ufeff")
+        events = []
+        for line in lines:
+            event = self._line(line)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def _line(self, line: str) -> Optional[dict]:
+        if not line:
+            return self._dispatch()
+        if line[0] == ":":
+            return None  # comment / keep-alive
+        name, sep, value = line.partition(":")
+        if sep and value[:1] == " ":
+            value = value[1:]
+        if name == "data":
+            self._data.append(value)
+        elif name == "event":
+            self._event = value
+        elif name == "id":
+            if "\0" not in value:
+                self.last_event_id = value
+        elif name == "retry":
+            if value.isascii() and value.isdigit():
+                self.retry_ms = int(value)
+        return None
+
+    def _dispatch(self) -> Optional[dict]:
+        data, event = self._data, self._event
+        self._data, self._event = [], ""
+        if not data:
+            return None
+        return {"event": event or "message", "id": self.last_event_id, "data": "\n".join(data)}
+
+
+def _decode_data(data: str):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return {"raw": data}
 
 
 async def track_sse_events(
@@ -21,6 +241,8 @@ async def track_sse_events(
 ) -> AsyncIterator[dict]:
     """
     Track SSE events from a URL, correlating them with a correlation ID.
+    Dropped connections are re-established (up to MCP_SSE_MAX_RECONNECTS times)
+    after the server's `retry` delay, resuming with Last-Event-ID.
     
     Args:
         url: SSE endpoint URL
@@ -33,68 +255,83 @@ async def track_sse_events(
     """
     start_time = time.time()
     event_count = 0
+    reconnects = 0
+    last_event_id = ""
+    retry_ms = SSE_RETRY_MS
     
     log("[cid={}] SSE: Starting stream from {}", correlation_id, url)
     
     try:
         async with httpx.AsyncClient(auth=auth, timeout=timeout) as client:
-            async with client.stream('GET', url) as response:
-                if response.status_code != 200:
-                    log("[cid={}] SSE: Failed to connect, status={}", correlation_id, response.status_code)
-                    return
-                
-                buffer = ""
-                async for chunk in response.aiter_text():
-                    buffer += chunk
-                    
-                    # Process complete events (separated by double newline)
-                    while '\n\n' in buffer:
-                        event_text, buffer = buffer.split('\n\n', 1)
+            while True:
+                headers = {"Accept": "text/event-stream", "Cache-Control": "no-cache"}
+                if last_event_id:
+                    headers["Last-Event-ID"] = last_event_id
+                parser = SSEParser()
+                parser.last_event_id = last_event_id
+                try:
+                    async with client.stream('GET', url, headers=headers) as response:
+                        if response.status_code == 204:
+                            log("[cid={}] SSE: Server closed the stream (204)", correlation_id)
+                            return
+                        if response.status_code != 200:
+                            log("[cid={}] SSE: Failed to connect, status={}", correlation_id, response.status_code)
+                            return
                         
-                        # Parse SSE event
-                        event_data = {}
-                        for line in event_text.split('\n'):
-                            if line.startswith('data: '):
-                                try:
-                                    import json
-                                    event_data = json.loads(line[6:])
-                                except:
-                                    event_data = {'raw': line[6:]}
-                        
-                        if event_data:
-                            event_count += 1
-                            event_record = {
-                                "correlation_id": correlation_id,
-                                "event_number": event_count,
-                                "timestamp": time.time(),
-                                "offset_ms": (time.time() - start_time) * 1000,
-                                "data": event_data
-                            }
-                            
-                            SSE_EVENTS.append(event_record)
-                            log("[cid={}] SSE: Event #{} at {:.1f}ms: {}", 
-                                correlation_id, event_count, event_record["offset_ms"], 
-                                str(event_data)[:100])
+                        async for chunk in response.aiter_bytes():
+                            for event in parser.feed(chunk):
+                                event_count += 1
+                                now = time.time()
+                                event_record = {
+                                    "correlation_id": correlation_id,
+                                    "event_number": event_count,
+                                    "event": event["event"],
+                                    "id": event["id"],
+                                    "timestamp": now,
+                                    "offset_ms": (now - start_time) * 1000,
+                                    "data": _decode_data(event["data"])
+                                }
+                                
+                                SSE_EVENTS.append(event_record)
+                                log("[cid={}] SSE: Event #{} at {:.1f}ms: {}", 
+                                    correlation_id, event_count, event_record["offset_ms"], 
+                                    str(event_record["data"])[:100])
+                                
+                                yield event_record
                             
-                            yield event_record
-                    
-                    # Check timeout
-                    if time.time() - start_time > timeout:
-                        log("[cid={}] SSE: Timeout after {:.1f}s", correlation_id, timeout)
-                        break
+                            # Check timeout
+                            if time.time() - start_time > timeout:
+                                log("[cid={}] SSE: Timeout after {:.1f}s", correlation_id, timeout)
+                                return
+                except httpx.TransportError as e:
+                    log("[cid={}] SSE: Connection lost - {}", correlation_id, repr(e))
+                finally:
+                    last_event_id = parser.last_event_id
+                    if parser.retry_ms is not None:
+                        retry_ms = parser.retry_ms
+                
+                # The stream ended without a terminal event: reconnect where we left off
+                remaining = timeout - (time.time() - start_time)
+                if reconnects >= SSE_MAX_RECONNECTS or remaining <= retry_ms / 1000:
+                    return
+                reconnects += 1
+                log("[cid={}] SSE: Reconnecting in {}ms (attempt {}, Last-Event-ID={!r})",
+                    correlation_id, retry_ms, reconnects, last_event_id)
+                await asyncio.sleep(retry_ms / 1000)
     
     except Exception as e:
         log("[cid={}] SSE: Error - {}", correlation_id, repr(e))
     
     finally:
         elapsed = (time.time() - start_time) * 1000
-        log("[cid={}] SSE: Stream ended after {:.1f}ms, {} events received", 
-            correlation_id, elapsed, event_count)
+        log("[cid={}] SSE: Stream ended after {:.1f}ms, {} events received, {} reconnects", 
+            correlation_id, elapsed, event_count, reconnects)
         
         # Update correlation chain
         if correlation_id in CORRELATION_CHAIN:
             CORRELATION_CHAIN[correlation_id]["sse_events"] = event_count
             CORRELATION_CHAIN[correlation_id]["sse_duration_ms"] = elapsed
+            CORRELATION_CHAIN[correlation_id]["sse_reconnects"] = reconnects
 
 
 async def monitor_sonar_ce_task_sse(task_id: str, base_url: str, auth: tuple, correlation_id: str) -> None:
@@ -114,16 +351,4 @@ async def monitor_sonar_ce_task_sse(task_id: str, base_url: str, auth: tuple, co
 
 def get_sse_stats() -> dict:
     """Get SSE statistics."""
-    if not SSE_EVENTS:
-        return {"total_events": 0, "streams": 0}
-    
-    streams = set(e["correlation_id"] for e in SSE_EVENTS)
-    
-    return {
-        "total_events": len(SSE_EVENTS),
-        "streams": len(streams),
-        "events_by_stream": {
-            cid: len([e for e in SSE_EVENTS if e["correlation_id"] == cid])
-            for cid in streams
-        }
-    }
+    return SSE_EVENTS.stats()
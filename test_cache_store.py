@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Tests for cache_store: LRU eviction order, TTL expiry and per-key TTLs, for both backends.
+
+Run with `python -m pytest test_cache_store.py` (or `python test_cache_store.py`).
+"""
+import os
+import tempfile
+import time
+
+from cache_store import CacheBackend, make_cache
+
+
+def _caches(ttl: float = 60.0, max_entries: int = 0, max_bytes: int = 0):
+    """A memory and a SQLite cache with the same settings (the sweeper is effectively off)."""
+    path = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+    return [make_cache(backend, ttl, max_entries, max_bytes, sweep_interval=3600, path=path)
+            for backend in ("memory", "sqlite")]
+
+
+def _tick():
+    """SQLite orders by wall-clock access time: keep consecutive accesses apart."""
+    time.sleep(0.01)
+
+
+def test_evicts_least_recently_used_first():
+    for cache in _caches(max_entries=3):
+        for key in ("a", "b", "c"):
+            cache.set(key, key.upper())
+            _tick()
+        assert cache.get("a") == "A"  # a is now the most recently used
+        _tick()
+        cache.set("d", "D")
+        assert cache.get("b") is None, type(cache).__name__
+        assert sorted(cache.keys()) == ["a", "c", "d"], type(cache).__name__
+        assert cache.stats()["evictions"] == 1
+        cache.close()
+
+
+def test_overwriting_a_key_does_not_evict():
+    for cache in _caches(max_entries=2):
+        cache.set("a", 1)
+        _tick()
+        cache.set("b", 2)
+        _tick()
+        cache.set("a", 3)
+        assert (cache.get("a"), cache.get("b"), cache.stats()["evictions"]) == (3, 2, 0), type(cache).__name__
+        cache.close()
+
+
+def test_byte_budget_evicts_oldest():
+    for cache in _caches(max_bytes=30):
+        cache.set("a", "x" * 10)
+        _tick()
+        cache.set("b", "y" * 10)
+        _tick()
+        cache.set("c", "z" * 10)  # ~36 bytes of JSON in total: one entry has to go
+        assert cache.get("a") is None and cache.get("c") == "z" * 10, type(cache).__name__
+        cache.close()
+
+
+def test_entries_expire_after_ttl():
+    for cache in _caches(ttl=0.05):
+        cache.set("a", 1)
+        assert cache.get("a") == 1 and "a" in cache
+        time.sleep(0.1)
+        assert "a" not in cache and cache.keys() == [], type(cache).__name__
+        assert cache.get("a") is None
+        stats = cache.stats()
+        assert stats["expirations"] == 1 and stats["hits"] == 1 and stats["misses"] == 1, stats
+        cache.close()
+
+
+def test_per_key_ttl_overrides_default():
+    for cache in _caches(ttl=0.05):
+        cache.set("short", 1)
+        cache.set("long", 2, ttl=60)
+        cache.set("shorter", 3, ttl=0.01)
+        time.sleep(0.03)
+        assert sorted(cache.keys()) == ["long", "short"], type(cache).__name__
+        time.sleep(0.05)
+        assert cache.keys() == ["long"] and cache.get("long") == 2, type(cache).__name__
+        assert cache.sweep() == 2
+        assert len(cache) == 1
+        cache.close()
+
+
+def test_make_cache_rejects_bad_configuration():
+    for args in (("redis", 60.0), ("sqlite", 60.0)):  # unknown backend; sqlite without a path
+        try:
+            make_cache(*args)
+        except ValueError:
+            continue
+        raise AssertionError(f"make_cache{args} should fail")
+    try:
+        CacheBackend(60.0)
+    except TypeError:
+        pass
+    else:
+        raise AssertionError("CacheBackend is abstract")
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
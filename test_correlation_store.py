@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Tests for correlation_store: ring wraparound, pinning, and indexes that stay in step with evictions.
+
+Run with `python -m pytest test_correlation_store.py` (or `python test_correlation_store.py`).
+"""
+from typing import Optional
+
+from correlation_store import RUNNING, CorrelationStore
+
+
+def _add(store: CorrelationStore, n: int, tool: str = "sonar.scan", elapsed_ms: float = 10.0,
+         status: str = "success", parent: Optional[str] = None) -> str:
+    cid = f"c{n}"
+    store[cid] = {"tool": tool, "parent_cid": parent, "start_time": 1000.0 + n}
+    store.finish(cid, status, elapsed_ms=elapsed_ms)
+    return cid
+
+
+def _check_indexes(store: CorrelationStore) -> None:
+    """Every index holds exactly the chains in the store, under their current keys."""
+    live = set(store)
+    assert set(store._keys) == live and set(store._seq) == live
+    for index, field, default in ((store._by_tool, "tool", None), (store._by_parent, "parent_cid", None),
+                                  (store._by_status, "status", RUNNING)):
+        indexed = [cid for bucket in index.values() for cid in bucket]
+        assert len(indexed) == len(set(indexed)) and all(index.values()), field
+        for key, bucket in index.items():
+            assert all(store[cid].get(field, default) == key for cid in bucket), field
+        assert set(indexed) == {cid for cid in live if store[cid].get(field, default) is not None}, field
+    assert store._by_time == sorted((store[cid]["start_time"], cid) for cid in live)
+    assert store._by_latency == sorted((store[cid]["elapsed_ms"], cid) for cid in live
+                                       if store[cid].get("elapsed_ms") is not None)
+
+
+def test_ring_wraps_around_oldest_first():
+    store = CorrelationStore(capacity=5, pinned_capacity=2)
+    for n in range(12):
+        _add(store, n)
+        assert len(store) == min(n + 1, 5)
+        _check_indexes(store)
+    assert list(store) == [f"c{n}" for n in range(7, 12)]
+    assert "c6" not in store and store.get("c6") is None
+    stats = store.stats()
+    assert (stats["ring"], stats["pinned"], stats["evicted"]) == (5, 0, 7)
+    assert stats["by_status"] == {"success": 5}
+
+
+def test_slow_and_failed_chains_are_pinned_within_their_own_bound():
+    store = CorrelationStore(capacity=3, pinned_capacity=2, slow_ms=500)
+    _add(store, 0, elapsed_ms=900)  # slow
+    _add(store, 1, status="error")
+    _add(store, 2)
+    _add(store, 3, elapsed_ms=2000)  # slow
+    for n in range(4, 8):
+        _add(store, n)
+        _check_indexes(store)
+    # c0, c1 and c3 were pinned on eviction; the oldest pinned one (c0) made room for c3
+    assert list(store) == ["c1", "c3", "c5", "c6", "c7"]
+    assert store.stats()["pinned"] == 2 and store.stats()["evicted"] == 3  # c0, c2, c4
+    assert [c["correlation_id"] for c in store.by_status("error")] == ["c1"]
+    assert [c["correlation_id"] for c in store.query(order="latency", min_ms=500)[0]] == ["c3"]
+
+
+def test_queries_after_eviction_only_see_live_chains():
+    store = CorrelationStore(capacity=4, pinned_capacity=0)
+    for n in range(10):
+        _add(store, n, tool="sonar.scan" if n % 2 else "sonar.status", elapsed_ms=n)
+    _check_indexes(store)
+    assert [c["correlation_id"] for c in store.by_tool("sonar.scan")] == ["c9", "c7"]
+    page, cursor = store.query(tool="sonar.status", limit=1)
+    assert [c["correlation_id"] for c in page] == ["c8"] and cursor is not None
+    page, cursor = store.query(tool="sonar.status", cursor=cursor, limit=1)
+    assert [c["correlation_id"] for c in page] == ["c6"] and cursor is None
+    assert [c["correlation_id"] for c in store.query(since=1000.0, until=1007.0)[0]] == ["c7", "c6"]
+    assert [c["correlation_id"] for c in store.query(order="latency", min_ms=0)[0]] == ["c9", "c8", "c7", "c6"]
+
+
+def test_parent_links_and_cursors_survive_eviction():
+    store = CorrelationStore(capacity=3, pinned_capacity=0)
+    root = _add(store, 0, tool="workflow")
+    cursor = store.last_seq
+    _add(store, 1, parent=root)
+    _add(store, 2, parent=root)
+    assert [c["correlation_id"] for c in store.children(root)] == ["c1", "c2"]
+    _add(store, 3, parent="c1")  # evicts the root
+    _check_indexes(store)
+    assert root not in store
+    # Live children of an evicted parent can still be found; the trace starts at the oldest live ancestor
+    assert [c["correlation_id"] for c in store.children(root)] == ["c1", "c2"]
+    assert store.root("c3") == "c1" and store.trace("c3")["correlation_id"] == "c1"
+    assert [c["correlation_id"] for c in store.trace("c3")["children"]] == ["c3"]
+    changed, cursor = store.since(cursor)
+    assert [c["correlation_id"] for c in changed] == ["c1", "c2", "c3"]
+    assert store.since(cursor) == ([], cursor)
+
+
+def test_replacing_and_deleting_chains_keeps_indexes_in_step():
+    store = CorrelationStore(capacity=3, pinned_capacity=1, slow_ms=100)
+    _add(store, 0, elapsed_ms=150)
+    store["c0"] = {"tool": "sonar.status", "start_time": 900.0}  # replaced: running again
+    _check_indexes(store)
+    assert [c["correlation_id"] for c in store.by_status(RUNNING)] == ["c0"]
+    assert store.query(order="latency")[0] == []
+    store.finish("c0", "error", elapsed_ms=5)
+    for n in range(1, 5):
+        _add(store, n)
+    _check_indexes(store)
+    assert "c0" in store and store.stats()["pinned"] == 1
+    del store["c0"]
+    _check_indexes(store)
+    assert store.by_status("error") == []
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
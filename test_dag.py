@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Tests for dag: dependency ordering, skips, failures and the critical path.
+
+Run with `python -m pytest test_dag.py` (or `python test_dag.py`).
+"""
+import asyncio
+
+from dag import DAG, DAG_RUNS, SkipStep, Step
+
+
+def _step(name: str, trace: list, deps=(), result=None, delay: float = 0.0, error: Exception = None) -> Step:
+    """A step that logs its start/end (with the dependency results it saw) and returns `result`."""
+    async def func(results: dict):
+        trace.append(("start", name, results))
+        await asyncio.sleep(delay)
+        trace.append(("end", name, None))
+        if error is not None:
+            raise error
+        return result
+    return Step(name, func, deps=deps)
+
+
+def _events(trace: list, kind: str) -> dict:
+    return {name: i for i, (event, name, _) in enumerate(trace) if event == kind}
+
+
+def test_steps_start_after_their_dependencies_and_branches_overlap():
+    trace = []
+    dag = DAG("order", [
+        _step("report", trace, deps=("lint", "build"), result="r"),
+        _step("fetch", trace, result="src", delay=0.02),
+        _step("lint", trace, deps=("fetch",), result="ok", delay=0.02),
+        _step("build", trace, deps=("fetch",), result="bin", delay=0.02),
+    ])
+    assert dag.order == ["fetch", "lint", "build", "report"]
+    run = asyncio.run(dag.run())
+    assert run["status"] == "completed"
+    starts, ends = _events(trace, "start"), _events(trace, "end")
+    for step in dag.steps.values():
+        assert all(ends[dep] < starts[step.name] for dep in step.deps), step.name
+    # lint and build only need fetch: they run side by side
+    assert starts["build"] < ends["lint"] and starts["lint"] < ends["build"]
+    seen = {name: results for event, name, results in trace if event == "start"}
+    assert seen["report"] == {"lint": "ok", "build": "bin"} and seen["lint"] == {"fetch": "src"}
+    assert [s["step"] for s in run["steps"]] == ["report", "fetch", "lint", "build"]  # declaration order
+    assert DAG_RUNS.recent(1)[0] is run
+
+
+def test_invalid_graphs_are_rejected():
+    trace = []
+    for steps, message in (
+        ([_step("a", trace), _step("a", trace)], "duplicate step 'a'"),
+        ([_step("a", trace, deps=("missing",))], "unknown step 'missing'"),
+        ([_step("a", trace, deps=("c",)), _step("b", trace, deps=("a",)), _step("c", trace, deps=("b",)),
+          _step("d", trace)], "dependency cycle among steps: a, b, c"),
+    ):
+        try:
+            DAG("bad", steps)
+        except ValueError as e:
+            assert message in str(e), str(e)
+        else:
+            raise AssertionError(message)
+
+
+def test_skipped_step_lets_dependents_run_with_none():
+    trace = []
+    dag = DAG("skip", [
+        _step("analysis", trace, result=[]),
+        _step("patch", trace, deps=("analysis",), error=SkipStep("no_issues")),
+        _step("pr", trace, deps=("analysis", "patch"), result="url"),
+    ])
+    run = asyncio.run(dag.run())
+    assert run["status"] == "completed" and "error" not in run
+    steps = {s["step"]: s for s in run["steps"]}
+    assert (steps["patch"]["status"], steps["patch"]["reason"]) == ("skipped", "no_issues")
+    assert steps["pr"]["status"] == "success"
+    assert [results for event, name, results in trace if (event, name) == ("start", "pr")] == [
+        {"analysis": [], "patch": None}]
+
+
+def test_failure_blocks_downstream_but_not_independent_branches():
+    trace = []
+    dag = DAG("fail", [
+        _step("scan", trace, error=RuntimeError("scanner crashed")),
+        _step("patch", trace, deps=("scan",)),
+        _step("pr", trace, deps=("patch", "base")),
+        _step("base", trace, result="main", delay=0.01),
+        _step("tests", trace, deps=("base",), result="t"),
+    ])
+    run = asyncio.run(dag.run())
+    assert run["status"] == "failed" and run["error"] == "scan: scanner crashed"
+    steps = {s["step"]: s for s in run["steps"]}
+    assert {name: s["status"] for name, s in steps.items()} == {
+        "scan": "failed", "patch": "blocked", "pr": "blocked", "base": "success", "tests": "success"}
+    assert steps["scan"]["error"] == "scanner crashed" and steps["pr"]["reason"] == "dependency failed"
+    assert "started_ms" not in steps["patch"]
+    assert not [name for event, name, _ in trace if name in ("patch", "pr")]
+
+
+def test_critical_path_is_the_longest_dependent_chain():
+    trace = []
+    dag = DAG("timing", [
+        _step("figma", trace),
+        _step("base", trace),
+        _step("scan", trace, deps=("figma",)),
+        _step("analysis", trace, deps=("scan",)),
+        _step("pr", trace, deps=("analysis", "base")),
+        _step("never", trace, deps=("base",)),
+    ])
+    # (started, ended) in seconds: figma→scan→analysis→pr is 0.1+0.2+0.5+0.1 = 0.9s, base only 0.3s
+    for name, (started, ended) in {"figma": (0.0, 0.1), "base": (0.0, 0.3), "scan": (0.1, 0.3),
+                                   "analysis": (0.3, 0.8), "pr": (0.8, 0.9)}.items():
+        dag.steps[name].started, dag.steps[name].ended = started, ended
+    path = dag.critical_path()
+    assert path["steps"] == ["figma", "scan", "analysis", "pr"]
+    assert abs(path["elapsed_ms"] - 900) < 1e-6
+    slack = path["slack_ms"]
+    assert "never" not in slack
+    assert all(abs(slack[name]) < 1e-6 for name in path["steps"])
+    assert abs(slack["base"] - 500) < 1e-6  # base could take 0.5s longer before it gates the PR
+
+    run = asyncio.run(DAG("run", [_step("slow", trace, delay=0.05), _step("fast", trace),
+                                  _step("after", trace, deps=("fast",))]).run())
+    assert run["critical_path"]["steps"] == ["slow"]
+    assert DAG("empty", []).critical_path() == {"steps": [], "elapsed_ms": 0.0, "slack_ms": {}}
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Tests for the dashboard's metrics payload (/api/metrics and the stream's snapshot/deltas).
+
+Run with `python -m pytest test_dashboard.py` (or `python test_dashboard.py`).
+"""
+import asyncio
+
+from dashboard import metrics_data
+from mcp_helpers import coalesce, instrument
+
+
+def test_tool_metrics_include_extra_counters():
+    snapshot = {
+        "sonar.scan": {"count": 2, "total_ms": 30.0, "cache_hits": 1, "cache_misses": 1},
+        "sonar.status": {"count": 4, "total_ms": 8.0, "coalesced": 3, "memo_hits": 2},
+    }
+    http = {"127.0.0.1:9000": {"count": 1, "total_ms": 5.0, "errors": 0, "retries": 2}}
+    metrics = metrics_data(snapshot, http)
+    scan = metrics["tools"]["sonar.scan"]
+    assert (scan["count"], scan["avg_ms"], scan["cache_hits"], scan["cache_misses"]) == (2, 15.0, 1, 1)
+    assert metrics["tools"]["sonar.status"]["coalesced"] == 3
+    assert metrics["tools"]["sonar.status"]["memo_hits"] == 2
+    assert metrics["http"]["127.0.0.1:9000"]["retries"] == 2
+    assert metrics["total_calls"] == 6
+
+
+def test_coalesce_counters_reach_the_metrics():
+    @instrument("test.coalesced_tool")
+    @coalesce("test.coalesced_tool", ttl=60)
+    async def tool(x: int) -> dict:
+        await asyncio.sleep(0.01)
+        return {"x": x}
+
+    async def calls():
+        await asyncio.gather(*(tool(1) for _ in range(3)))  # one execution, two coalesced
+        await tool(1)  # memoized
+
+    asyncio.run(calls())
+    entry = metrics_data()["tools"]["test.coalesced_tool"]
+    assert (entry["count"], entry["coalesced"], entry["memo_hits"]) == (4, 2, 1)
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
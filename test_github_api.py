@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Tests for github_api against fake_github: request counts per PR and ETag revalidation.
+
+Run with `python -m pytest test_github_api.py` (or `python test_github_api.py`).
+"""
+import asyncio
+import os
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer
+
+import github_api
+from fake_github import FakeGitHub, FakeGitHubHandler
+
+REPO = "octo/demo"
+FILES = {"src/components/Button.tsx": "export const Button = () => null;\n"}
+
+
+@contextmanager
+def fake_github(graphql: bool = True):
+    """A FakeGitHub on a free port, with github_api pointed at it and its caches reset."""
+    github = FakeGitHub(graphql=graphql)
+    handler = type("Handler", (FakeGitHubHandler,), {"github": github, "log_message": lambda *args: None})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    saved = github_api.GITHUB_API_URL, github_api._graphql_unavailable, os.environ.get("GITHUB_TOKEN")
+    github_api.GITHUB_API_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    github_api._graphql_unavailable = False
+    os.environ["GITHUB_TOKEN"] = "test-token"
+    github_api.clear_cache()
+    try:
+        yield github
+    finally:
+        github_api.GITHUB_API_URL, github_api._graphql_unavailable, token = saved
+        if token is None:
+            os.environ.pop("GITHUB_TOKEN", None)
+        else:
+            os.environ["GITHUB_TOKEN"] = token
+        github_api.clear_cache()
+        server.shutdown()
+        server.server_close()
+
+
+async def _open_pr(branch: str) -> dict:
+    base = await github_api.repo_base(REPO)
+    return await github_api.create_pull_request(REPO, base, branch, FILES, "Add Button", "body", "feat: add Button")
+
+
+def test_graphql_pr_is_one_request():
+    with fake_github() as github:
+        pr = asyncio.run(_open_pr("feature/button"))
+        assert pr["number"] == 1 and pr["html_url"].endswith(f"/{REPO}/pull/1")
+        assert github.requests["POST /graphql"] == 1
+        assert not [route for route in github.requests if route.startswith("POST /repos/")]
+        repo = github.repos[REPO]
+        head = repo["branches"]["feature/button"]
+        assert repo["objects"][head]["files"] == FILES
+        assert repo["objects"][head]["parents"] == [repo["branches"]["main"]]
+
+
+def test_base_lookup_revalidates_with_etag():
+    with fake_github() as github:
+        async def lookups():
+            first = await github_api.repo_base(REPO)
+            second = await github_api.repo_base(REPO)
+            return first, second
+
+        first, second = asyncio.run(lookups())
+        assert first == second
+        # Repository and ref were both unchanged: two 304s, no new data
+        assert github.requests["304 Not Modified"] == 2
+        assert github.requests["GET /repos/{repo}"] == 2
+
+        moved = github.repos[REPO]
+        moved["branches"]["main"] = "f" * 40
+        third = asyncio.run(github_api.repo_base(REPO))
+        assert third["sha"] == "f" * 40
+        assert github.requests["304 Not Modified"] == 3  # the repository itself is still unchanged
+
+
+def test_concurrent_base_lookups_share_one_request():
+    with fake_github() as github:
+        async def lookups():
+            return await asyncio.gather(*(github_api.repo_base(REPO) for _ in range(5)))
+
+        bases = asyncio.run(lookups())
+        assert all(base == bases[0] for base in bases)
+        assert github.requests["GET /repos/{repo}"] == 1
+
+
+def test_rest_fallback_when_graphql_unavailable():
+    with fake_github(graphql=False) as github:
+        pr = asyncio.run(_open_pr("feature/one"))
+        assert pr["number"] == 1
+        assert github.requests["POST /graphql"] == 1  # tried once, answered 404
+        for route in ("git/trees", "git/commits", "git/refs", "pulls"):
+            assert github.requests[f"POST /repos/{{repo}}/{route}"] == 1
+
+        # GraphQL is not tried again
+        asyncio.run(_open_pr("feature/two"))
+        assert github.requests["POST /graphql"] == 1
+        assert github.requests["POST /repos/{repo}/pulls"] == 2
+        assert github.repos[REPO]["objects"][github.repos[REPO]["branches"]["feature/two"]]["files"] == FILES
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Tests for histogram: percentile error bound, and lifetime vs windowed totals.
+
+Run with `python -m pytest test_histogram.py` (or `python test_histogram.py`).
+"""
+import math
+import random
+import time
+
+from histogram import LATENCY_WINDOW, LatencyHistogram, ToolLatency, WindowedHistogram
+
+BUCKET_RATIO = 2 ** (1 / 8)  # 8 buckets per doubling: a percentile is at most one bucket (~9%) high
+
+
+def _exact(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, the definition LatencyHistogram.percentile approximates."""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(len(ordered) * q / 100)) - 1]
+
+
+def test_percentiles_within_one_bucket():
+    rng = random.Random(7)
+    samples = [
+        [rng.uniform(1, 100) for _ in range(5000)],
+        [rng.lognormvariate(3, 1.5) for _ in range(5000)],  # long tail over several decades
+        [0.5] * 99 + [2500.0],
+    ]
+    for values in samples:
+        hist = LatencyHistogram()
+        for ms in values:
+            hist.record(ms)
+        for q in (50, 90, 99, 99.9):
+            exact = _exact(values, q)
+            assert exact <= hist.percentile(q) <= exact * BUCKET_RATIO, (q, exact, hist.percentile(q))
+        assert hist.percentile(100) == hist.max_ms == max(values)
+
+
+def test_summary_of_empty_and_merged_histograms():
+    empty = LatencyHistogram()
+    assert empty.percentile(50) is None and empty.summary()["p99_ms"] is None
+    a, b, both = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for ms in range(1, 200):
+        (a if ms % 2 else b).record(float(ms))
+        both.record(float(ms))
+    a.merge(b)
+    assert a.summary() == both.summary()
+
+
+def test_window_forgets_old_slots():
+    window = WindowedHistogram(window=60, slots=6)
+    window.record(5.0, now=0.0)
+    window.record(500.0, now=30.0)
+    assert window.merged(now=30.0).count == 2
+    # 0s has left the window at 65s; 30s has not
+    late = window.merged(now=65.0)
+    assert (late.count, late.max_ms) == (1, 500.0)
+    # A slot reused for a later time starts empty instead of adding to the old counts
+    window.record(7.0, now=120.0)  # same ring position as 0s and 60s
+    assert window.merged(now=120.0).count == 1
+    assert window.merged(now=200.0).count == 0
+
+
+def test_tool_latency_splits_lifetime_window_and_outcome():
+    latency = ToolLatency()
+    for ms in (1.0, 2.0, 3.0):
+        latency.record(ms)
+    latency.record(40.0, ok=False)
+    summary = latency.summary()
+    assert summary["lifetime"]["success"]["count"] == summary["window"]["success"]["count"] == 3
+    assert summary["lifetime"]["error"]["max_ms"] == summary["window"]["error"]["max_ms"] == 40.0
+    assert summary["window_seconds"] == LATENCY_WINDOW
+    # Once the window has moved on, only the lifetime totals still hold the calls
+    later = time.monotonic() + 2 * LATENCY_WINDOW
+    assert latency.window["success"].merged(now=later).count == 0
+    assert latency.lifetime["success"].count == 3
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
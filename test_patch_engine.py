@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Tests for patch_engine: fixes must never change what the surrounding code does.
+
+Run with `python -m pytest test_patch_engine.py` (or `python test_patch_engine.py`).
+"""
+import asyncio
+
+from patch_engine import PatchEngine, detect, fix
+
+
+def _fix_console(source: str):
+    return fix("src/a.js", source, [("no-console", None)])
+
+
+def test_removes_console_statement_on_its_own_lines():
+    source = "foo();\nconsole.log('a'); // debug\n\nbar();\n"
+    patched, applied, skipped = _fix_console(source)
+    assert patched == "foo();\n\nbar();\n"
+    assert applied == [("no-console", None)] and skipped == []
+
+
+def test_removes_multiline_console_call():
+    patched, applied, _ = _fix_console("foo()\nconsole.log(\n  'a',\n  b,\n)\nbar()\n")
+    assert patched == "foo()\nbar()\n"
+    assert applied
+
+
+def test_keeps_code_after_console_call_on_same_line():
+    source = "console.log(x); doThing();\n"
+    patched, applied, skipped = _fix_console(source)
+    assert patched == source and applied == []
+    assert skipped == [(("no-console", None), "other code follows the statement on its line")]
+
+
+def test_keeps_braceless_control_bodies():
+    for source in (
+        "function a(x) {\n  if (debug)\n    console.log(x);\n  return x;\n}\n",
+        "if (a) b();\nelse\n  console.log(x);\nreturn 1;\n",
+        "for (const a of b)\n  console.log(a);\nfoo();\n",
+        "while (busy)\n  console.log(a);\nfoo();\n",
+        "do\n  console.log(a);\nwhile (x);\n",
+        "if (a &&\n    b)\n  console.log(x);\nreturn 1;\n",
+    ):
+        patched, applied, skipped = _fix_console(source)
+        assert patched == source and applied == [], source
+        assert skipped[0][1] == "statement is the body of a brace-less if/else/for/while/do", source
+
+
+def test_keeps_statement_continued_on_next_line():
+    for source in (
+        "console.log('a')\n  .toString();\n",
+        "console.log('a')\n  ?.toString();\n",
+        "console.log(a)\n  ? b : c;\n",
+        "console.log(a)\n  + 1;\n",
+    ):
+        patched, applied, skipped = _fix_console(source)
+        assert patched == source and applied == [], source
+        assert skipped[0][1] == "the next line continues the statement's expression", source
+
+
+def test_keeps_console_call_inside_larger_statement():
+    for source in ("return console.log(x);\n", "x && console.log(x);\n", "} console.log();\n",
+                   "foo(\n  console.log(x)\n);\n"):
+        patched, applied, skipped = _fix_console(source)
+        assert patched == source and applied == [], source
+        assert skipped, source
+
+
+def test_detects_console_calls_anywhere_but_in_comments():
+    source = "return console.log(x);\n// console.log(y);\nconsole.warn(z);\n"
+    assert [issue["line"] for issue in detect("src/a.ts", source)] == [1, 3]
+
+
+def test_removes_unused_function():
+    patched, applied, _ = fix("src/a.js", "function unused() {\n  return 1;\n}\n\nexport const a = 1;\n",
+                              [("no-dead-code", 1)])
+    assert patched == "export const a = 1;\n" and applied == [("no-dead-code", 1)]
+
+
+def test_apply_reports_unfixed_reasons():
+    files = {"src/a.js": "if (debug)\n  console.log(x);\nconsole.log(y);\n", "README.md": "# a\n"}
+    issues = [
+        {"id": "ISSUE-1", "rule": "typescript:S106", "location": "src/a.js:2"},
+        {"id": "ISSUE-2", "rule": "javascript:S2228", "location": "src/a.js:3"},
+        {"id": "ISSUE-3", "rule": "javascript:S1481", "location": "src/a.js:1"},
+    ]
+    result = asyncio.run(PatchEngine(max_workers=1).apply(files, issues))
+    assert result["fixed"] == ["ISSUE-2"]
+    assert result["files"]["src/a.js"] == "if (debug)\n  console.log(x);\n"
+    assert result["unfixed"] == [
+        {"issue": "ISSUE-3", "reason": "no automatic fix for rule javascript:S1481"},
+        {"issue": "ISSUE-1", "reason": "statement is the body of a brace-less if/else/for/while/do"},
+    ]
+    assert list(result["diffs"]) == ["src/a.js"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
@@ -8,7 +8,7 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-from sonar import scan, status, apply_patch, quality_gate
+from sonar import scan, status, apply_patches, quality_gate, wait_for_task
 from mcp_helpers import TOOL_STATS, log
 
 async def main():
@@ -21,8 +21,8 @@ async def main():
     scan_result = await scan(
         project_key="demo-project",
         files={
-            "src/app.py": "def unused_function():\n    pass\n\nprint('debug log')",
-            "src/utils.py": "console.log('test')\n# TODO: fix this"
+            "src/app.js": "function unusedFunction() {\n    return 1;\n}\n\nexport const app = () => 1;\n",
+            "src/utils.js": "console.log('test');\n// TODO: fix this\nexport const util = 2;\n"
         }
     )
     log("Scan submitted: {}", scan_result)
@@ -40,13 +40,19 @@ async def main():
                 log("Issues found: {}", status_result["issues"])
             break
     
-    # Step 3: Apply a patch
-    log("\n[STEP 3] Applying suggested patch...")
-    patch_result = await apply_patch(task_id=task_id, patch_id="remove_unused_function")
-    log("Patch applied: {}", patch_result)
+    # Step 3: Apply the suggested patches (one reanalysis)
+    log("\n[STEP 3] Applying suggested patches...")
+    patch_ids = [issue["id"] for issue in status_result.get("issues", [])]
+    patch_result = await apply_patches(task_id=task_id, patch_ids=patch_ids)
+    for path, diff in patch_result.get("diffs", {}).items():
+        log("Patched {}:\n{}", path, diff)
     
     # Wait for reanalysis
-    await asyncio.sleep(1.5)
+    reanalysis = patch_result.get("reanalysis") or {}
+    if reanalysis.get("taskId"):
+        final = await wait_for_task(reanalysis["taskId"])
+        after = await status(task_id=reanalysis["taskId"])
+        log("Reanalysis: {} ({} issues left)", final.get("task", {}).get("status"), len(after.get("issues", [])))
     
     # Step 4: Check quality gate
     log("\n[STEP 4] Checking quality gate...")
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Tests for the sonar MCP tools: patches shared between callers of one (simulated) task,
+and issue paging against a fake /api/issues/search.
+
+Run with `python -m pytest test_sonar_tools.py` (or `python test_sonar_tools.py`).
+"""
+import asyncio
+import json
+import threading
+import time
+from contextlib import aclosing, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import sonar
+from mcp_helpers import cache_get, cache_set
+from sonar import apply_patches, status, wait_for_task
+
+FILES = {
+    "src/a.js": "foo();\nconsole.log(1);\nbar();\n",
+    "src/b.js": "export const b = 2;\n",
+}
+
+
+def _finished_task(task_id: str) -> str:
+    """A simulated task that has finished analyzing FILES, with one console issue."""
+    cache_set(f"sonar_task:{task_id}", {
+        "project": "test-project",
+        "files": dict(FILES),
+        "status": "FINISHED",
+        "real": False,
+        "issues": [{"id": "ISSUE-1", "rule": "javascript:S2228", "location": "src/a.js:2",
+                    "suggested_patch": "javascript:S2228"}],
+        "issue_seq": 1,
+    })
+    return task_id
+
+
+def test_second_apply_returns_the_patched_files():
+    task_id = _finished_task("sim-task-test-repeat")
+
+    async def apply_twice():
+        first = await apply_patches(task_id=task_id, patch_ids=["ISSUE-1"])
+        second = await apply_patches(task_id=task_id, patch_ids=["ISSUE-1"])
+        await wait_for_task(first["reanalysis"]["taskId"], timeout=10)
+        after = await status(task_id=first["reanalysis"]["taskId"])
+        return first, second, after
+
+    first, second, after = asyncio.run(apply_twice())
+    assert first["newly_applied"] == ["ISSUE-1"] and second["newly_applied"] == []
+    assert first["patched_files"] == second["patched_files"] == {"src/a.js": "foo();\nbar();\n"}
+    assert second["applied"] == ["ISSUE-1"] and second["fixed"] == ["ISSUE-1"]
+    assert second["diffs"] == first["diffs"] and second["changed_files"] == ["src/a.js"]
+    assert second["reanalysis"]["taskId"] == first["reanalysis"]["taskId"] != task_id
+    assert after["status"] == "FINISHED" and after["issues"] == []
+    # The analyzed task keeps its files and issues for anyone else sharing it
+    rec = cache_get(f"sonar_task:{task_id}")
+    assert rec["files"] == FILES and [issue["id"] for issue in rec["issues"]] == ["ISSUE-1"]
+
+
+def test_concurrent_applies_share_one_reanalysis():
+    task_id = _finished_task("sim-task-test-concurrent")
+
+    async def apply_together():
+        return await asyncio.gather(*(apply_patches(task_id=task_id, patch_ids=["ISSUE-1"]) for _ in range(3)))
+
+    results = asyncio.run(apply_together())
+    assert sorted(len(result["newly_applied"]) for result in results) == [0, 0, 1]
+    assert all(result["patched_files"] == {"src/a.js": "foo();\nbar();\n"} for result in results)
+    assert len({result["reanalysis"]["taskId"] for result in results}) == 1
+
+
+@contextmanager
+def fake_issues(total: int, delays: dict[int, float]):
+    """An /api/issues/search with `total` issues, answering page p after delays.get(p, 0) seconds.
+    Yields the list of requested page numbers."""
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            page, size = int(query["p"][0]), int(query["ps"][0])
+            requested.append(page)
+            time.sleep(delays.get(page, 0))
+            first = (page - 1) * size
+            issues = [{"key": f"I{n}"} for n in range(first, min(first + size, total))]
+            body = json.dumps({"paging": {"pageIndex": page, "pageSize": size, "total": total},
+                               "issues": issues}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    saved = sonar.SONAR_BASE
+    sonar.SONAR_BASE = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        yield requested
+    finally:
+        sonar.SONAR_BASE = saved
+        server.shutdown()
+        server.server_close()
+
+
+def test_fetch_issues_keeps_page_order():
+    # Page 2 answers last, but its issues still come before page 3's
+    with fake_issues(250, {2: 0.2}):
+        issues = asyncio.run(sonar._fetch_issues("p", chunk_size=100, max_concurrency=2))
+    assert [issue["key"] for issue in issues] == [f"I{n}" for n in range(250)]
+
+
+def test_iter_issues_streams_and_cancels_on_early_exit():
+    async def first_issues():
+        seen = []
+        async with aclosing(sonar._iter_issues("p", chunk_size=100, max_concurrency=1)) as issues:
+            async for issue in issues:
+                seen.append(issue["key"])
+                if len(seen) == 3:
+                    break
+        await asyncio.sleep(0.3)  # long enough for page 2 to finish and page 3 to be asked for
+        return seen
+
+    with fake_issues(400, {2: 0.1}) as requested:
+        seen = asyncio.run(first_issues())
+    assert seen == ["I0", "I1", "I2"]
+    assert 3 not in requested and 4 not in requested
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
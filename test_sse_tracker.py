@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Tests for sse_tracker: the bounded event store and the incremental text/event-stream parser.
+
+Run with `python -m pytest test_sse_tracker.py` (or `python test_sse_tracker.py`).
+"""
+from sse_tracker import SSEEventStore, SSEParser
+
+STREAM = (
+    ": keep-alive\r\n"
+    "retry: 1500\r\n"
+    "event: status\r\n"
+    "id: 1\r\n"
+    "data: {\"status\": \"PENDING\"}\r\n"
+    "\r\n"
+    "data: first line\r"
+    "data: second line — ünïcode\n"
+    "\n"
+    "id: 2\n"
+    "data\n"
+    "data:no space\n"
+    "\r\n"
+).encode()
+EXPECTED = [
+    {"event": "status", "id": "1", "data": '{"status": "PENDING"}'},
+    {"event": "message", "id": "1", "data": "first line\nsecond line — ünïcode"},
+    {"event": "message", "id": "2", "data": "\nno space"},
+]
+
+
+def _fill(store: SSEEventStore, events: list[tuple[str, float]]) -> list[dict]:
+    return [store.append({"correlation_id": cid, "event": "STATUS", "timestamp": ts}) for cid, ts in events]
+
+
+def test_ring_keeps_newest_events_and_forgets_drained_streams():
+    store = SSEEventStore(capacity=4, stream_capacity=10)
+    _fill(store, [("a", 1.0), ("b", 2.0), ("a", 3.0), ("b", 4.0), ("c", 5.0), ("c", 6.0)])
+    assert [e["seq"] for e in store] == [3, 4, 5, 6]
+    assert store.streams() == ["a", "b", "c"]
+    _fill(store, [("c", 7.0)])  # evicts a's last event: the stream goes away
+    assert store.streams() == ["b", "c"] and store.stream("a") == []
+    stats = store.stats()
+    assert (stats["total_events"], stats["retained_events"], stats["evicted_events"]) == (7, 4, 3)
+    assert stats["events_by_stream"] == {"b": 2, "c": 3}
+
+
+def test_stream_capacity_bounds_each_stream():
+    store = SSEEventStore(capacity=100, stream_capacity=3)
+    _fill(store, [("busy", float(t)) for t in range(10)] + [("quiet", 10.0)])
+    assert [e["timestamp"] for e in store.stream("busy")] == [7.0, 8.0, 9.0]
+    assert len(store) == 11 and store.stats()["events_by_stream"] == {"busy": 10, "quiet": 1}
+    # Evicting ring entries the stream already dropped leaves the stream alone
+    store.capacity = 2
+    _fill(store, [("quiet", 11.0)])
+    assert store.streams() == ["quiet"] and len(store.stream("quiet")) == 2
+
+
+def test_since_returns_retained_events_after_the_cursor():
+    store = SSEEventStore(capacity=3)
+    _fill(store, [("a", 1.0), ("a", 2.0)])
+    events, cursor = store.since(0)
+    assert [e["seq"] for e in events] == [1, 2] and cursor == 2
+    assert store.since(cursor) == ([], 2)
+    _fill(store, [("a", 3.0), ("a", 4.0), ("a", 5.0), ("a", 6.0)])
+    events, cursor = store.since(2)
+    assert [e["seq"] for e in events] == [4, 5, 6] and cursor == 6  # seq 3 was evicted
+    events, _ = store.since(2, limit=1)
+    assert [e["seq"] for e in events] == [6]
+
+
+def test_query_pages_backwards_by_seq_and_time():
+    store = SSEEventStore()
+    _fill(store, [("a" if t % 2 else "b", float(t)) for t in range(10)])
+    page, cursor = store.query(limit=4)
+    assert [e["timestamp"] for e in page] == [6.0, 7.0, 8.0, 9.0]
+    page, cursor = store.query(limit=4, cursor=cursor)
+    assert [e["timestamp"] for e in page] == [2.0, 3.0, 4.0, 5.0]
+    page, cursor = store.query(limit=4, cursor=cursor)
+    assert [e["timestamp"] for e in page] == [0.0, 1.0] and cursor is None
+    page, cursor = store.query(stream="a", since=2.0, until=7.0)
+    assert [e["timestamp"] for e in page] == [3.0, 5.0, 7.0] and cursor is None
+    assert store.query(stream="missing") == ([], None)
+
+
+def _parse(chunks) -> tuple[list[dict], SSEParser]:
+    parser = SSEParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    return events, parser
+
+
+def test_parser_handles_mixed_line_endings_and_multiline_data():
+    events, parser = _parse([STREAM])
+    assert events == EXPECTED
+    assert parser.retry_ms == 1500 and parser.last_event_id == "2"
+
+
+def test_parser_gives_the_same_events_however_the_stream_is_split():
+    # Every split point, including inside CRLF pairs and multi-byte UTF-8 characters
+    for cut in range(len(STREAM) + 1):
+        assert _parse([STREAM[:cut], STREAM[cut:]])[0] == EXPECTED, cut
+    assert _parse(STREAM[i:i + 1] for i in range(len(STREAM)))[0] == EXPECTED
+
+
+def test_crlf_split_across_chunks_is_one_line_ending():
+    events, _ = _parse([b"data: a\r", b"\ndata: b\r", b"\n\r", b"\n"])
+    assert events == [{"event": "message", "id": "", "data": "a\nb"}]
+
+
+def test_trailing_partial_event_is_held_back():
+    parser = SSEParser()
+    assert parser.feed(b"\xef\xbb\xbfdata: done\n\ndata: partial\ndata: more") == [
+        {"event": "message", "id": "", "data": "done"}]
+    # No blank line yet: nothing is dispatched until the event is complete
+    assert parser.feed(b"\n") == []
+    assert parser.feed(b"\n") == [{"event": "message", "id": "", "data": "partial\nmore"}]
+
+
+def test_events_without_data_are_not_dispatched():
+    events, parser = _parse([b"event: ping\n\nid: 7\n\n: comment\n\nretry: soon\n\n"])
+    assert events == [] and parser.last_event_id == "7" and parser.retry_ms is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Tests for workflow.run_batch in simulated Sonar mode, with PRs opened on fake_github.
+
+Run with `python -m pytest test_workflow.py` (or `python test_workflow.py`).
+"""
+import asyncio
+import json
+import os
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import sonar
+import sse_tracker
+from test_github_api import fake_github
+from workflow import run_batch
+
+REPO = "octo/demo"
+DESIGN = "https://www.figma.com/design/AAA/login?node-id=1-2"
+
+
+class FakeSonarHandler(BaseHTTPRequestHandler):
+    """Answers the quality gate lookup; everything else (e.g. the CE SSE stream) is a 404."""
+
+    def do_GET(self):
+        if self.path.startswith("/api/qualitygates/project_status"):
+            body = json.dumps({"projectStatus": {"status": "OK"}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+        else:
+            body = b"{}"
+            self.send_response(404)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def fake_sonar():
+    """A quality gate endpoint on a free port, with sonar and the SSE monitor pointed at it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSonarHandler)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    saved = sonar.SONAR_BASE, sse_tracker.SSE_MAX_RECONNECTS, os.environ.get("SONARQUBE_URL")
+    sonar.SONAR_BASE, sse_tracker.SSE_MAX_RECONNECTS = url, 0
+    os.environ["SONARQUBE_URL"] = url
+    try:
+        yield url
+    finally:
+        sonar.SONAR_BASE, sse_tracker.SSE_MAX_RECONNECTS, sonarqube_url = saved
+        if sonarqube_url is None:
+            os.environ.pop("SONARQUBE_URL", None)
+        else:
+            os.environ["SONARQUBE_URL"] = sonarqube_url
+        server.shutdown()
+        server.server_close()
+
+
+def test_duplicate_designs_get_their_own_branches():
+    with fake_sonar(), fake_github() as github:
+        report = asyncio.run(run_batch([DESIGN] * 3, REPO, "test-duplicate-designs", concurrency=3))
+        assert report["summary"]["completed"] == 3, [run.get("error") for run in report["runs"]]
+        branches = [branch for branch in github.repos[REPO]["branches"] if branch.startswith("figma-1-2-")]
+        assert len(branches) == 3
+        # The runs shared one Sonar task; each PR still carries the patched component
+        for branch in branches:
+            files = github.repos[REPO]["objects"][github.repos[REPO]["branches"][branch]]["files"]
+            assert "console.log" not in files["src/components/LoginForm.tsx"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
@@ -6,12 +6,19 @@ Uses EXISTING Figma and GitHub MCP servers (don't duplicate them!)
 Usage:
     python workflow.py <figma_url>
     python workflow.py "https://www.figma.com/design/FILE_KEY/PROJECT_NAME?node-id=NODE_ID"
+    python workflow.py --batch urls.txt --concurrency 4 --report report.json
+    cat urls.txt | python workflow.py --batch -
 """
+import argparse
 import asyncio
+import json
 import os
 import sys
 import re
+import secrets
+from collections import Counter
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,10 +29,17 @@ from dashboard import run_dashboard
 import time
 
 # Import our Sonar tools
-from sonar import scan, status, apply_patch, quality_gate
-from mcp_helpers import log, TOOL_STATS, CORRELATION_CHAIN
+from sonar import scan, status, apply_patches, quality_gate, wait_for_task
+from mcp_helpers import log, flush_logs, TOOL_STATS, CORRELATION_CHAIN, extra_stats, latency_summary
+from log_writer import CURRENT_CID
+from dag import DAG, SkipStep, Step
+from http_pool import close_clients, http_stats_snapshot
+from patch_engine import PATCH_ENGINE
+import github_api
 from sse_tracker import get_sse_stats, SSE_EVENTS, monitor_sonar_ce_task_sse
 
+WORKFLOW_CONCURRENCY = int(os.getenv("MCP_WORKFLOW_CONCURRENCY", "4"))  # batch runs in flight at once
+
 # NOTE: Figma and GitHub tools come from MCP servers you're already connected to!
 # In a real MCP environment, you'd call them via the MCP protocol.
 
@@ -73,166 +87,150 @@ class Workflow:
         self.correlation_id = None
     
     async def run(self) -> dict:
-        """Execute the full workflow."""
+        """
+        Execute the workflow. Steps are declared with their dependencies and run
+        by the DAG scheduler, so e.g. the GitHub base-branch lookup and test
+        generation overlap with the Sonar scan and analysis.
+        """
+        dag = DAG(f"workflow {self.figma_file_key}#{self.figma_node_id}", [
+            Step("figma_fetch", self._step_figma_fetch,
+                 report=lambda _: {"file_key": self.figma_file_key, "node_id": self.figma_node_id}),
+            Step("code_extraction", self._step_code_extraction, deps=("figma_fetch",),
+                 report=lambda files: {"file_count": len(files)}),
+            Step("test_generation", self._step_test_generation, deps=("figma_fetch",),
+                 report=lambda tests: {"file_count": len(tests)}),
+            Step("github_base", self._step_github_base,
+                 report=lambda base: {"default_branch": base["default_branch"]}),
+            Step("sonar_scan", self._step_sonar_scan, deps=("code_extraction",),
+                 report=lambda scan_result: {"task_id": scan_result.get("taskId"), "mode": scan_result.get("mode")}),
+            Step("analysis_complete", self._step_analysis, deps=("sonar_scan",),
+                 report=lambda issues: {"issue_count": len(issues)}),
+            Step("patch_application", self._step_patches, deps=("sonar_scan", "analysis_complete", "code_extraction"),
+                 report=lambda patched: {"patches_applied": len(patched["patches"]), "files_changed": len(patched["files"])}),
+            Step("quality_gate", self._step_quality_gate, deps=("patch_application",),
+                 report=lambda gate_status: {"gate_status": gate_status}),
+            Step("pr_creation", self._step_pr_creation,
+                 deps=("github_base", "code_extraction", "test_generation", "analysis_complete",
+                       "patch_application", "quality_gate"),
+                 report=lambda pr_result: {"pr_url": pr_result.get("pr_url")}),
+        ])
+        run = await dag.run()
+
         results = {
-            "steps": [],
-            "overall_status": "started"
+            "steps": run["steps"],
+            "overall_status": run["status"],
+            "elapsed_ms": run["elapsed_ms"],
+            "critical_path": run["critical_path"],
         }
-        # Simulate SSE event for Figma fetch
-        SSE_EVENTS.append({"correlation_id": "figma-fetch", "event": "FETCH", "timestamp": time.time()})
-        try:
-            # Step 1: Fetch design from Figma (via Figma MCP server)
-            log("\n" + "="*60)
-            log("STEP 1: Fetching Figma design")
-            log("="*60)
-
-            design_result = await self._fetch_figma_design()
-            results["steps"].append({
-                "step": "figma_fetch",
-                "status": "success",
-                "file_key": self.figma_file_key,
-                "node_id": self.figma_node_id
-                # Simulate SSE event for code extraction
-            })
-            SSE_EVENTS.append({"correlation_id": "code-extract", "event": "EXTRACT", "timestamp": time.time()})
-
-            # Step 2: Extract code files
-            log("\n" + "="*60)
-            log("STEP 2: Extracting code from design")
-            log("="*60)
-
-            files = self._extract_code_files(design_result)
-            results["steps"].append({
-                "step": "code_extraction",
-                "status": "success",
-                "file_count": len(files)
-            })
-
-            # Step 3: Run SonarQube scan
-            log("\n" + "="*60)
-            log("STEP 3: Running SonarQube analysis")
-            log("="*60)
-
-            scan_result = await scan(
-                project_key=self.project_key,
-                files=files,
-                _jsonrpc_id="rpc-sonar-scan",
-                _parent_cid="figma-code"
-            )
-            task_id = scan_result.get("taskId")
-            log("Scan started: taskId={}, mode={}", task_id, scan_result.get("mode"))
-            # Simulate SSE event for Sonar scan start
-            SSE_EVENTS.append({"correlation_id": "sonar-scan", "event": "STARTED", "timestamp": time.time()})
-
-            results["steps"].append({
-                "step": "sonar_scan",
-                "status": "success",
-                "task_id": task_id,
-                "mode": scan_result.get("mode")
-            })
-
-            # Step 4: Poll for completion
-            # Simulate SSE event for Sonar analysis complete
-            SSE_EVENTS.append({"correlation_id": "sonar-scan", "event": "FINISHED", "timestamp": time.time()})
-            log("\n" + "="*60)
-            log("STEP 4: Waiting for analysis to complete")
-            log("="*60)
-
-            issues = await self._wait_for_analysis(
-                task_id,
-                _jsonrpc_id="rpc-sonar-status",
-                _parent_cid="sonar-scan"
-            )
-            results["steps"].append({
-                "step": "analysis_complete",
-                "status": "success",
-                "issue_count": len(issues)
-            })
-
-            # Step 5: Apply patches automatically
-            if issues:
-                log("\n" + "="*60)
-                log("STEP 5: Applying automated patches ({} issues)", len(issues))
-                # Simulate SSE event for patch application
-                SSE_EVENTS.append({"correlation_id": "sonar-patch", "event": "PATCH_APPLIED", "timestamp": time.time()})
-                # Real SSE tracking for patch application (if supported)
-                try:
-                    await monitor_sonar_ce_task_sse(task_id, os.getenv("SONARQUBE_URL", "http://localhost:9000"), (os.getenv("SONARQUBE_USER", "admin"), os.getenv("SONARQUBE_PASS", "admin")), "sonar-patch")
-                except Exception as sse_exc:
-                    log("SSE tracking error: {}", sse_exc)
-                log("="*60)
-
-                patches_applied = await self._apply_patches(
-                    task_id,
-                    issues,
-                    files,
-                    _jsonrpc_id="rpc-sonar-applypatch",
-                    _parent_cid="sonar-status"
-                )
-                results["steps"].append({
-                    "step": "patch_application",
-                    "status": "success",
-                    "patches_applied": len(patches_applied)
-                })
-            else:
-                log("\n✓ No issues found, skipping patch step")
-                results["steps"].append({
-                    "step": "patch_application",
-                    "status": "skipped",
-                    "reason": "no_issues"
-                })
-
-            # Step 6: Verify quality gate
-            log("\n" + "="*60)
-            log("STEP 6: Checking quality gate")
-            log("="*60)
-
-            gate_result = await quality_gate(
-                project_key=self.project_key,
-                _jsonrpc_id="rpc-sonar-qualitygate",
-                _parent_cid="sonar-applypatch"
-            )
-            gate_status = gate_result.get("qualityGate", {}).get("projectStatus", {}).get("status", "UNKNOWN")
-
-            results["steps"].append({
-                "step": "quality_gate",
-                "status": "success",
-                "gate_status": gate_status
-            })
-
-            # Step 7: Create PR (via GitHub MCP server)
-            log("\n" + "="*60)
-            log("STEP 7: Creating Pull Request")
-            log("="*60)
-
-            pr_result = await self._create_pr(files, issues)
-            results["steps"].append({
-                "step": "pr_creation",
-                "status": pr_result.get("status", "pending"),
-                "pr_url": pr_result.get("pr_url")
-            })
-
-            results["overall_status"] = "completed"
+        critical = run["critical_path"]
+        log("Critical path: {} ({:.0f}ms of {:.0f}ms wall time)",
+            " → ".join(critical["steps"]), critical["elapsed_ms"], run["elapsed_ms"])
+        if run["status"] == "completed":
             log("\n" + "="*60)
             log("✓ WORKFLOW COMPLETED SUCCESSFULLY")
             log("="*60)
+        else:
+            log("✗ WORKFLOW FAILED: {}", run["error"])
+            results["error"] = run["error"]
+        return results
 
-        except Exception as e:
-            log("✗ WORKFLOW FAILED: {}", repr(e))
-            results["overall_status"] = "failed"
-            results["error"] = str(e)
+    def _log_step(self, title: str) -> None:
+        log("\n" + "="*60)
+        log("STEP: {}", title)
+        log("="*60)
 
-        return results
+    async def _step_figma_fetch(self, deps: dict) -> dict:
+        # Simulate SSE event for Figma fetch
+        SSE_EVENTS.append({"correlation_id": "figma-fetch", "event": "FETCH", "timestamp": time.time()})
+        self._log_step("Fetching Figma design")
+        return await self._fetch_figma_design()
+
+    async def _step_code_extraction(self, deps: dict) -> dict[str, str]:
+        # Simulate SSE event for code extraction
+        SSE_EVENTS.append({"correlation_id": "code-extract", "event": "EXTRACT", "timestamp": time.time()})
+        self._log_step("Extracting code from design")
+        return self._extract_code_files(deps["figma_fetch"])
+
+    async def _step_test_generation(self, deps: dict) -> dict[str, str]:
+        component_name = self._component_name(deps["figma_fetch"])
+        return {f"src/components/{component_name}.test.tsx": self._generate_test(component_name)}
+
+    async def _step_github_base(self, deps: dict) -> dict:
+        return await self._github_base()
+
+    async def _step_sonar_scan(self, deps: dict) -> dict:
+        self._log_step("Running SonarQube analysis")
+        scan_result = await scan(
+            project_key=self.project_key,
+            files=deps["code_extraction"],
+            _jsonrpc_id="rpc-sonar-scan",
+            _parent_cid="figma-code"
+        )
+        log("Scan started: taskId={}, mode={}", scan_result.get("taskId"), scan_result.get("mode"))
+        # Simulate SSE event for Sonar scan start
+        SSE_EVENTS.append({"correlation_id": "sonar-scan", "event": "STARTED", "timestamp": time.time()})
+        return scan_result
+
+    async def _step_analysis(self, deps: dict) -> list[dict]:
+        # Simulate SSE event for Sonar analysis complete
+        SSE_EVENTS.append({"correlation_id": "sonar-scan", "event": "FINISHED", "timestamp": time.time()})
+        self._log_step("Waiting for analysis to complete")
+        return await self._wait_for_analysis(
+            deps["sonar_scan"].get("taskId"),
+            _jsonrpc_id="rpc-sonar-status",
+            _parent_cid="sonar-scan"
+        )
+
+    async def _step_patches(self, deps: dict) -> dict:
+        issues = deps["analysis_complete"]
+        if not issues:
+            log("\n✓ No issues found, skipping patch step")
+            raise SkipStep("no_issues")
+        task_id = deps["sonar_scan"].get("taskId")
+        log("\n" + "="*60)
+        log("STEP: Applying automated patches ({} issues)", len(issues))
+        # Simulate SSE event for patch application
+        SSE_EVENTS.append({"correlation_id": "sonar-patch", "event": "PATCH_APPLIED", "timestamp": time.time()})
+        # Real SSE tracking for patch application (if supported)
+        try:
+            await monitor_sonar_ce_task_sse(task_id, os.getenv("SONARQUBE_URL", "http://localhost:9000"), (os.getenv("SONARQUBE_USER", "admin"), os.getenv("SONARQUBE_PASS", "admin")), "sonar-patch")
+        except Exception as sse_exc:
+            log("SSE tracking error: {}", sse_exc)
+        log("="*60)
+
+        return await self._apply_patches(
+            task_id,
+            issues,
+            deps["code_extraction"],
+            _jsonrpc_id="rpc-sonar-applypatch",
+            _parent_cid="sonar-status"
+        )
+
+    async def _step_quality_gate(self, deps: dict) -> str:
+        self._log_step("Checking quality gate")
+        gate_result = await quality_gate(
+            project_key=self.project_key,
+            _jsonrpc_id="rpc-sonar-qualitygate",
+            _parent_cid="sonar-applypatch"
+        )
+        return gate_result.get("qualityGate", {}).get("projectStatus", {}).get("status", "UNKNOWN")
+
+    async def _step_pr_creation(self, deps: dict) -> dict:
+        self._log_step("Creating Pull Request")
+        patched = deps["patch_application"] or {}  # None when the patch step was skipped
+        files = {**deps["code_extraction"], **patched.get("files", {}), **deps["test_generation"]}
+        return await self._create_pr(files, deps["analysis_complete"], deps["github_base"])
+
+    def _component_name(self, design_result: dict) -> str:
+        return design_result.get("metadata", {}).get("name", "Component")
 
-    
     def _extract_code_files(self, design_result: dict) -> dict[str, str]:
-        """Extract files from Figma design data."""
-        component_name = design_result.get("metadata", {}).get("name", "Component")
+        """Extract component files from Figma design data (tests are generated separately)."""
+        component_name = self._component_name(design_result)
         code = design_result.get("code", "")
         
         files = {
             f"src/components/{component_name}.tsx": code,
-            f"src/components/{component_name}.test.tsx": self._generate_test(component_name)
         }
         
         log("Extracted {} files from design", len(files))
@@ -250,122 +248,63 @@ describe('{component_name}', () => {{
 }});
 """
     
-    async def _wait_for_analysis(self, task_id: str, max_attempts: int = 10, **kwargs) -> list[dict]:
-        """Poll task until complete and return issues."""
-        for attempt in range(max_attempts):
-            await asyncio.sleep(1.0)
-            result = await status(task_id=task_id)
-            
-            task_status = result.get("status")
-            log("Analysis status: {}", task_status)
-            
-            if task_status in ("FINISHED", "SUCCESS"):
-                return result.get("issues", [])
-            elif task_status in ("FAILED", "CANCELED"):
-                log("Analysis failed with status: {}", task_status)
-                return []
+    async def _wait_for_analysis(self, task_id: str, timeout: float = 60.0, **kwargs) -> list[dict]:
+        """Wait for the task to complete (pushed by the CE watcher) and return issues."""
+        final = await wait_for_task(task_id, timeout=timeout)
+        if final.get("task", {}).get("status") == "TIMEOUT":
+            log("Analysis timed out after {:.0f}s", timeout)
+            return []
         
-        log("Analysis timed out after {} attempts", max_attempts)
-        return []
-    
-    async def _apply_patches(self, task_id: str, issues: list[dict], files: dict[str, str]) -> list[str]:
-        """Apply patches for detected issues."""
-        patches_applied = []
+        result = await status(task_id=task_id, **kwargs)
+        task_status = result.get("status")
+        log("Analysis status: {}", task_status)
         
-        for issue in issues[:3]:  # Limit to first 3 patches
-            patch_id = issue.get("suggested_patch") or issue.get("id")
-            if patch_id:
-                log("Applying patch: {}", patch_id)
-                result = await apply_patch(task_id=task_id, patch_id=patch_id)
-                
-                if result.get("applied"):
-                    patches_applied.append(patch_id)
+        if task_status in ("FINISHED", "SUCCESS"):
+            return result.get("issues", [])
         
-        # Wait for reanalysis
-        if patches_applied:
-            await asyncio.sleep(2.0)
-        
-        return patches_applied
+        log("Analysis failed with status: {}", task_status)
+        return []
     
-    async def _create_pr(self, files: dict[str, str], issues: list[dict]) -> dict:
-        """Create PR via GitHub API."""
-        import httpx
-        github_token = os.getenv("GITHUB_TOKEN")
-        repo = self.repo
-        owner, repo_name = repo.split("/")
-        safe_node_id = self.figma_node_id.replace(':', '-')
-        branch_name = f"figma-{safe_node_id}-{int(asyncio.get_event_loop().time())}"
-
-        headers = {
-            "Authorization": f"token {github_token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
+    async def _apply_patches(self, task_id: str, issues: list[dict], files: dict[str, str],
+                             timeout: float = 60.0, **kwargs) -> dict:
+        """
+        Apply patches for detected issues in one batch and wait for the single reanalysis.
+        Returns {"patches": applied patch ids, "files": patched contents of changed files}.
+        """
+        patch_ids = [issue.get("suggested_patch") or issue.get("id") or issue.get("key") for issue in issues[:3]]  # Limit to first 3 patches
+        patch_ids = [patch_id for patch_id in dict.fromkeys(patch_ids) if patch_id]
+        if not patch_ids:
+            return {"patches": [], "files": {}}
+
+        log("Applying {} patch(es): {}", len(patch_ids), ", ".join(patch_ids))
+        result = await apply_patches(task_id=task_id, patch_ids=patch_ids, **kwargs)
+        if "error" in result:
+            raise RuntimeError(f"apply_patches failed: {result['error']}")
+        for path, diff in result.get("diffs", {}).items():
+            log("Patched {}:\n{}", path, diff.rstrip())
 
-        async with httpx.AsyncClient() as client:
-            # Get default branch
-            repo_url = f"https://api.github.com/repos/{owner}/{repo_name}"
-            repo_resp = await client.get(repo_url, headers=headers)
-            repo_resp.raise_for_status()
-            default_branch = repo_resp.json()["default_branch"]
-
-            # Get default branch SHA
-            branch_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/ref/heads/{default_branch}"
-            branch_resp = await client.get(branch_url, headers=headers)
-            branch_resp.raise_for_status()
-            sha = branch_resp.json()["object"]["sha"]
-
-            # Create new branch
-            create_branch_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/refs"
-            branch_data = {
-                "ref": f"refs/heads/{branch_name}",
-                "sha": sha
-            }
-            branch_create_resp = await client.post(create_branch_url, json=branch_data, headers=headers)
-            if branch_create_resp.status_code != 201:
-                log("Branch creation failed: {} {}", branch_create_resp.status_code, branch_create_resp.text)
-                raise Exception(f"Branch creation failed: {branch_create_resp.status_code} {branch_create_resp.text}")
-
-            # Create tree with new files
-            tree_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/trees"
-            tree_data = {
-                "base_tree": sha,
-                "tree": [
-                    {
-                        "path": path,
-                        "mode": "100644",
-                        "type": "blob",
-                        "content": content
-                    } for path, content in files.items()
-                ]
-            }
-            tree_resp = await client.post(tree_url, json=tree_data, headers=headers)
-            tree_resp.raise_for_status()
-            new_tree_sha = tree_resp.json()["sha"]
-
-            # Create commit
-            commit_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/commits"
-            commit_data = {
-                "message": f"feat: Add {len(files)} components from Figma design",
-                "tree": new_tree_sha,
-                "parents": [sha]
-            }
-            commit_resp = await client.post(commit_url, json=commit_data, headers=headers)
-            commit_resp.raise_for_status()
-            new_commit_sha = commit_resp.json()["sha"]
-
-            # Update branch to point to new commit
-            update_ref_url = f"https://api.github.com/repos/{owner}/{repo_name}/git/refs/heads/{branch_name}"
-            update_ref_data = {
-                "sha": new_commit_sha,
-                "force": True
-            }
-            update_ref_resp = await client.patch(update_ref_url, json=update_ref_data, headers=headers)
-            update_ref_resp.raise_for_status()
+        # Wait for reanalysis
+        reanalysis = result.get("reanalysis")
+        if reanalysis:
+            final = await wait_for_task(reanalysis["taskId"], timeout=timeout)
+            log("Reanalysis {}", final.get("task", {}).get("status", "UNKNOWN"))
+
+        # Another run sharing the task may have applied some ids already; they count for this run too
+        patched = {path: content for path, content in result.get("patched_files", {}).items() if path in files}
+        applied = set(result.get("applied", []))
+        return {"patches": [patch_id for patch_id in patch_ids if patch_id in applied], "files": patched}
+    
+    async def _github_base(self) -> dict:
+        """Look up the repository's default branch and its head SHA (cached, revalidated with ETags)."""
+        return await github_api.repo_base(self.repo)
 
-            # Create PR
-            pr_url = f"https://api.github.com/repos/{owner}/{repo_name}/pulls"
-            pr_title = f"feat: Add {len(files)} components from Figma design"
-            pr_body = f"""## Auto-generated from Figma
+    async def _create_pr(self, files: dict[str, str], issues: list[dict], base: dict) -> dict:
+        """Create branch, commit and PR via the GitHub API, branching from `base` (see _github_base)."""
+        safe_node_id = self.figma_node_id.replace(':', '-')
+        # Runs of the same design can start within one second: the random suffix keeps branches apart
+        branch_name = f"figma-{safe_node_id}-{int(asyncio.get_event_loop().time())}-{secrets.token_hex(3)}"
+        pr_title = f"feat: Add {len(files)} components from Figma design"
+        pr_body = f"""## Auto-generated from Figma
 
         - Design: `{self.figma_file_key}#{self.figma_node_id}`
         - Files: {len(files)}
@@ -374,15 +313,12 @@ describe('{component_name}', () => {{
 
         Generated by MCP workflow automation.
         """
-            pr_data = {
-                "title": pr_title,
-                "head": branch_name,
-                "base": default_branch,
-                "body": pr_body
-            }
-            pr_resp = await client.post(pr_url, json=pr_data, headers=headers)
-            pr_resp.raise_for_status()
-            pr_json = pr_resp.json()
+        pr_json = await github_api.create_pull_request(
+            self.repo, base, branch_name, files,
+            title=pr_title,
+            body=pr_body,
+            message=f"feat: Add {len(files)} components from Figma design"
+        )
 
         log("Created PR: {}", pr_json.get("html_url"))
         return {
@@ -390,15 +326,140 @@ describe('{component_name}', () => {{
             "pr_url": pr_json.get("html_url"),
             "pr_number": pr_json.get("number")
         }
-async def main():
-    """Run the demo workflow."""
-    # Parse command line arguments
-    if len(sys.argv) < 2:
-        print("Usage: python workflow.py <figma_url>", file=sys.stderr)
-        print("Example: python workflow.py 'https://www.figma.com/design/FILE_KEY/PROJECT_NAME?node-id=NODE_ID'", file=sys.stderr)
+
+
+def read_batch(source: str) -> list[str]:
+    """Figma URLs from a file ("-" for stdin), one per line; blank lines and # comments are skipped."""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = Path(source).read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+async def run_batch(figma_urls: list[str], repo: str, project_key: str,
+                    concurrency: int = WORKFLOW_CONCURRENCY) -> dict:
+    """
+    Run one Workflow per Figma URL on the current event loop, at most
+    `concurrency` at a time. The runs share the pooled HTTP clients and the
+    Sonar caches; the returned report lists each run with its timings.
+    """
+    slots = asyncio.Semaphore(max(1, concurrency))
+    in_flight = max_in_flight = 0
+    batch_start = time.perf_counter()
+
+    async def run_one(index: int, figma_url: str) -> dict:
+        nonlocal in_flight, max_in_flight
+        entry = {"index": index, "figma_url": figma_url}
+        try:
+            figma_file_key, figma_node_id = parse_figma_url(figma_url)
+        except ValueError as e:
+            entry.update(overall_status="invalid", error=str(e))
+            return entry
+        queued = time.perf_counter()
+        async with slots:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            entry["queued_ms"] = (time.perf_counter() - queued) * 1000
+            entry["started_at"] = time.time()
+            # Log records of this run carry its id until a tool call sets its own cid
+            CURRENT_CID.set(f"batch-{index}")
+            try:
+                workflow = Workflow(figma_file_key, figma_node_id, repo=repo, project_key=project_key)
+                entry.update(await workflow.run())
+            finally:
+                in_flight -= 1
+        entry["finished_at"] = time.time()
+        return entry
+
+    log("Batch: {} run(s), concurrency {}", len(figma_urls), concurrency)
+    runs = await asyncio.gather(*(run_one(i, url) for i, url in enumerate(figma_urls)))
+    statuses = Counter(run["overall_status"] for run in runs)
+    run_ms = sorted(run["elapsed_ms"] for run in runs if "elapsed_ms" in run)
+    return {
+        "summary": {
+            "runs": len(runs),
+            "completed": statuses["completed"],
+            "failed": statuses["failed"],
+            "invalid": statuses["invalid"],
+            "concurrency": concurrency,
+            "max_in_flight": max_in_flight,
+            "elapsed_ms": (time.perf_counter() - batch_start) * 1000,
+            "run_ms": {
+                "mean": sum(run_ms) / len(run_ms) if run_ms else None,
+                "p50": run_ms[len(run_ms) // 2] if run_ms else None,
+                "max": run_ms[-1] if run_ms else None,
+            },
+        },
+        "runs": runs,
+        "tools": {name: {**(latency_summary(name) or {}), "counters": extra_stats(stats)}
+                  for name, stats in TOOL_STATS.items()},
+        "http": {host: {**stats, "latency": latency_summary(f"http.{host}")}
+                 for host, stats in http_stats_snapshot().items()},
+    }
+
+
+async def main_batch(args: argparse.Namespace) -> None:
+    """Run every URL from --batch and write the aggregated JSON report."""
+    try:
+        figma_urls = read_batch(args.batch)
+    except OSError as e:
+        log("ERROR: cannot read batch input: {}", e)
         sys.exit(1)
-    
-    figma_url = sys.argv[1]
+    if not figma_urls:
+        log("ERROR: no Figma URLs in {}", "stdin" if args.batch == "-" else args.batch)
+        sys.exit(1)
+
+    try:
+        report = await run_batch(figma_urls, args.repo, args.project, args.concurrency)
+    finally:
+        await close_clients()
+        PATCH_ENGINE.shutdown()
+
+    summary = report["summary"]
+    log("Batch finished in {:.0f}ms: {} completed, {} failed, {} invalid (max {} in flight)",
+        summary["elapsed_ms"], summary["completed"], summary["failed"], summary["invalid"], summary["max_in_flight"])
+    output = json.dumps(report, indent=2, default=str)
+    if args.report:
+        Path(args.report).write_text(output + "\n", encoding="utf-8")
+        log("Report written to {}", args.report)
+    else:
+        print(output)
+    flush_logs()
+    if summary["completed"] != summary["runs"]:
+        sys.exit(1)
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Figma → SonarQube → GitHub workflow",
+        epilog="Example: python workflow.py 'https://www.figma.com/design/FILE_KEY/PROJECT_NAME?node-id=NODE_ID'",
+    )
+    parser.add_argument("figma_url", nargs="?", help="run the workflow for one Figma URL")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run every Figma URL listed in FILE (one per line, '-' for stdin) and exit")
+    parser.add_argument("--concurrency", type=int, default=WORKFLOW_CONCURRENCY,
+                        help="batch runs in flight at once (default: %(default)s, MCP_WORKFLOW_CONCURRENCY)")
+    parser.add_argument("--report", metavar="PATH", help="write the batch JSON report here instead of stdout")
+    parser.add_argument("--repo", default=os.getenv("GITHUB_REPO", "Tetsukiba/MCP-demo-CSCI-435"),
+                        help="GitHub repository (owner/name, default: GITHUB_REPO)")
+    parser.add_argument("--project", default=os.getenv("SONAR_PROJECT", "MCP-demo-CSCI-435"),
+                        help="Sonar project key (default: SONAR_PROJECT)")
+    args = parser.parse_args(argv)
+    if (args.figma_url is None) == (args.batch is None):
+        parser.error("give either a Figma URL or --batch FILE")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    return args
+
+
+async def main(args: argparse.Namespace):
+    """Run the demo workflow."""
+    if args.batch is not None:
+        await main_batch(args)
+        return
+
+    figma_url = args.figma_url
     
     log("="*60)
     log("FIGMA → SONARQUBE → GITHUB WORKFLOW")
@@ -414,16 +475,12 @@ async def main():
         log("ERROR: {}", str(e))
         sys.exit(1)
     
-    # Configuration from environment
-    github_repo = os.getenv("GITHUB_REPO", "Tetsukiba/MCP-demo-CSCI-435")
-    sonar_project = os.getenv("SONAR_PROJECT", "MCP-demo-CSCI-435")
-    
     # Run workflow
     workflow = Workflow(
         figma_file_key=figma_file_key,
         figma_node_id=figma_node_id,
-        repo=github_repo,
-        project_key=sonar_project
+        repo=args.repo,
+        project_key=args.project
     )
     
     results = await workflow.run()
@@ -483,7 +540,15 @@ async def main():
     log("="*60)
     for tool_name, stats in TOOL_STATS.items():
         avg_ms = stats["total_ms"] / stats["count"] if stats["count"] > 0 else 0
-        log("{}: {} calls, {:.1f}ms avg", tool_name, stats["count"], avg_ms)
+        latency = latency_summary(tool_name)
+        # e.g. cache hits/misses, coalesced calls, memo hits (see bump_stat)
+        counters = "".join(f", {field}={value:g}" for field, value in extra_stats(stats).items())
+        if latency and latency["lifetime"]["success"]["count"]:
+            pct = latency["lifetime"]["success"]
+            log("{}: {} calls, {:.1f}ms avg, p50={:.1f}ms p99={:.1f}ms max={:.1f}ms{}",
+                tool_name, stats["count"], avg_ms, pct["p50_ms"], pct["p99_ms"], pct["max_ms"], counters)
+        else:
+            log("{}: {} calls, {:.1f}ms avg{}", tool_name, stats["count"], avg_ms, counters)
 
     # Correlation tracking
     log("\n" + "="*60)
@@ -501,7 +566,7 @@ async def main():
         log("SSE EVENTS: {} events across {} streams", sse_stats["total_events"], sse_stats["streams"])
         for cid, count in sse_stats["events_by_stream"].items():
             log("  Stream '{}': {} events", cid, count)
-            for event in [e for e in SSE_EVENTS if e["correlation_id"] == cid]:
+            for event in SSE_EVENTS.stream(cid):
                 ts = datetime.fromtimestamp(event["timestamp"]).strftime('%Y-%m-%d %H:%M:%S')
                 data_str = event.get("data", "")
                 if isinstance(data_str, dict):
@@ -514,6 +579,9 @@ async def main():
                     data_str)
         log("="*60)
 
+    await close_clients()
+    PATCH_ENGINE.shutdown()
+
     log("\nProgram complete. Workflow finished. Dashboard server will remain running.")
     # Block main thread to keep dashboard server alive
     import time
@@ -528,5 +596,6 @@ def start_dashboard():
     threading.Thread(target=run_dashboard, args=(8080,), daemon=True).start()
 
 if __name__ == "__main__":
+    cli_args = parse_args()
     start_dashboard()
-    asyncio.run(main())
+    asyncio.run(main(cli_args))